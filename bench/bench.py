@@ -0,0 +1,258 @@
+"""tinygit benchmarks.
+
+Generates a synthetic repo, then times tinygit commands against fresh copies
+of it and writes the results as json, so runs on different revisions can be
+compared (see --compare).
+
+  python bench/bench.py --files 1000 --depth 3 --commits 20 -o results.json
+  python bench/bench.py --files 1000 --depth 3 --commits 20 --compare results.json
+
+Every command runs in a child process. Results hold, per run, the wall time,
+the cpu time and peak rss of the child, the number of objects it read and
+wrote and, on linux, its read/write syscall counts from /proc/self/io.
+"""
+import sys
+import os
+import argparse
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import collections
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# GitRepo methods counted in the child, name in the results -> method
+COUNTED = {
+  "object_reads": "object_read",
+  "object_db_reads": "object_read_db",
+  "object_infos": "object_info",
+  "object_writes": "object_write",
+  "files_hashed": "blob_write_file",
+  "blob_checkouts": "blob_checkout",
+}
+
+
+# synthetic repo generation
+
+# random text of about size bytes, in lines of 64 chars
+def random_text(rng, size):
+  data = rng.getrandbits(max(size, 1) * 4).to_bytes(max(size, 1) // 2 + 1, "little").hex()[:size]
+  return "\n".join(data[i:i + 64] for i in range(0, len(data), 64)) + "\n"
+
+def random_size(rng, params):
+  if params.size_dist == "fixed":
+    return params.mean_size
+  if params.size_dist == "uniform":
+    return rng.randint(0, 2 * params.mean_size)
+  # lognormal, mostly small files and a few big ones, like most source trees
+  return int(rng.lognormvariate(0, 1) * params.mean_size / 1.65)
+
+def random_path(rng, params, i):
+  dirs = [f"d{rng.randrange(params.fanout)}" for _ in range(params.depth)]
+  return os.path.join(*dirs, f"f{i}.txt")
+
+# modify a random fraction of paths
+def modify_files(rng, params, paths, fraction):
+  for path in rng.sample(paths, min(len(paths), max(1, int(len(paths) * fraction)))):
+    with open(path, "w") as f:
+      f.write(random_text(rng, random_size(rng, params)))
+
+def tinygit(*argv):
+  from tinygit.cli import run
+  with open(os.devnull, "w") as devnull:
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+      run(list(argv))
+    finally:
+      sys.stdout = stdout
+
+# repo at path with params.commits commits on master and params.branches
+# branches of one commit each, forked before master's last commit
+# branches and master's last commit change disjoint halves of the files, so
+# merging a branch never conflicts
+def generate(path, params):
+  rng = random.Random(params.seed)
+  os.makedirs(path)
+  cwd = os.getcwd()
+  os.chdir(path)
+  try:
+    tinygit("init")
+    paths = [random_path(rng, params, i) for i in range(params.files)]
+    for p in paths:
+      os.makedirs(os.path.dirname(p), exist_ok=True)
+      with open(p, "w") as f:
+        f.write(random_text(rng, random_size(rng, params)))
+    tinygit("commit", "commit 0")
+    for i in range(1, params.commits - 1):
+      modify_files(rng, params, paths, params.change_rate)
+      tinygit("commit", f"commit {i}")
+    for b in range(params.branches):
+      tinygit("branch", f"branch{b}")
+      tinygit("checkout-branch", f"branch{b}")
+      modify_files(rng, params, paths[1::2], params.change_rate)
+      tinygit("commit", f"branch{b} commit")
+      tinygit("checkout-branch", "master")
+    if params.commits > 1:
+      modify_files(rng, params, paths[0::2], params.change_rate)
+      tinygit("commit", f"commit {params.commits - 1}")
+  finally:
+    os.chdir(cwd)
+  return paths
+
+
+# scenarios, name -> (setup, timed command)
+# setup runs in process before the timed command, after a status that
+# refreshes the copy's stat index
+
+def setup_none(rng, params, paths):
+  pass
+
+def setup_dirty(rng, params, paths):
+  modify_files(rng, params, paths, params.change_rate)
+
+SCENARIOS = {
+  "commit": (setup_dirty, ["commit", "bench"]),
+  "status-clean": (setup_none, ["status"]),
+  "status-dirty": (setup_dirty, ["status"]),
+  "checkout-branch": (setup_none, ["checkout-branch", "branch0"]),
+  "log": (setup_none, ["log"]),
+  "merge": (setup_none, ["merge", "branch0"]),
+  "tag": (setup_none, ["tag", "bench"]),
+}
+
+
+# run a tinygit command in a child process, returns its measurements
+def measure(argv):
+  countsfd, countspath = tempfile.mkstemp(suffix=".json")
+  os.close(countsfd)
+  env = dict(os.environ, TINYGIT_NO_DAEMON="1")
+  env["PYTHONPATH"] = os.pathsep.join(filter(None, [SOURCE_DIR, env.get("PYTHONPATH")]))
+  start = time.perf_counter()
+  proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", countspath, *argv],
+    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+  # drained before reaping, a child filling the pipe would never exit
+  stderr = proc.stderr.read().decode()
+  proc.stderr.close()
+  _, status, rusage = os.wait4(proc.pid, 0)
+  wall = time.perf_counter() - start
+  proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+  if proc.returncode != 0:
+    raise Exception(f"tinygit {' '.join(argv)} failed:\n{stderr}")
+  with open(countspath) as f:
+    counts = json.load(f)
+  os.remove(countspath)
+  return dict(wall=wall, cpu=rusage.ru_utime + rusage.ru_stime, maxrss_kb=rusage.ru_maxrss, **counts)
+
+# child side of measure, runs the command with GitRepo methods counted
+def child(countspath, argv):
+  from tinygit.state import GitRepo
+  from tinygit.cli import run
+  counts = collections.Counter({name: 0 for name in COUNTED})
+  def counted(name, method):
+    def wrapper(*args, **kwargs):
+      counts[name] += 1
+      return method(*args, **kwargs)
+    return wrapper
+  for name, method in COUNTED.items():
+    setattr(GitRepo, method, counted(name, getattr(GitRepo, method)))
+  try:
+    run(argv)
+  finally:
+    if os.path.isfile("/proc/self/io"):
+      with open("/proc/self/io") as f:
+        io = dict(line.split(": ") for line in f.read().splitlines())
+      counts["read_syscalls"], counts["write_syscalls"] = int(io["syscr"]), int(io["syscw"])
+    with open(countspath, "w") as f:
+      json.dump(counts, f)
+
+def run_scenario(name, base, workdir, params, paths):
+  setup, argv = SCENARIOS[name]
+  runs = []
+  for i in range(params.repeat):
+    copy = os.path.join(workdir, f"{name}-{i}")
+    shutil.copytree(base, copy, symlinks=True)
+    cwd = os.getcwd()
+    os.chdir(copy)
+    try:
+      tinygit("status")
+      setup(random.Random(params.seed + i), params, paths)
+      runs.append(measure(argv))
+    finally:
+      os.chdir(cwd)
+      shutil.rmtree(copy)
+  return {
+    "argv": argv,
+    "runs": runs,
+    "median_wall": statistics.median(run["wall"] for run in runs),
+    "median_cpu": statistics.median(run["cpu"] for run in runs),
+  }
+
+def revision():
+  out = subprocess.run(["git", "-C", SOURCE_DIR, "rev-parse", "HEAD"], capture_output=True, text=True)
+  return out.stdout.strip() if out.returncode == 0 else None
+
+def compare(results, old):
+  print(f"{'scenario':<18}{'old':>10}{'new':>10}{'change':>10}")
+  for name, scenario in results["scenarios"].items():
+    if name not in old["scenarios"]:
+      continue
+    before, after = old["scenarios"][name]["median_wall"], scenario["median_wall"]
+    print(f"{name:<18}{before:>10.3f}{after:>10.3f}{(after - before) / before:>+10.1%}")
+
+def make_parser():
+  parser = argparse.ArgumentParser(description="Benchmark tinygit commands on a synthetic repo.")
+  parser.add_argument("--files", type=int, default=1000, help="Number of files in the repo.")
+  parser.add_argument("--depth", type=int, default=3, help="Directory depth of the files.")
+  parser.add_argument("--fanout", type=int, default=4, help="Subdirectories per directory.")
+  parser.add_argument("--size-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal", help="Distribution of file sizes.")
+  parser.add_argument("--mean-size", type=int, default=4096, help="Mean file size in bytes.")
+  parser.add_argument("--commits", type=int, default=10, help="Number of commits on master.")
+  parser.add_argument("--branches", type=int, default=2, help="Number of branches.")
+  parser.add_argument("--change-rate", type=float, default=0.02, help="Fraction of files each commit changes.")
+  parser.add_argument("--seed", type=int, default=0, help="Seed of the generator.")
+  parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario.")
+  parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Scenario to run, all by default.")
+  parser.add_argument("--workdir", default=None, help="Where to generate repos, a temporary dir by default.")
+  parser.add_argument("-o", "--output", default=None, help="Write the results as json to this file.")
+  parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against.")
+  return parser
+
+def main(argv):
+  if argv[:1] == ["--child"]:
+    return child(argv[1], argv[2:])
+  params = make_parser().parse_args(argv)
+  if params.branches < 1:
+    params.scenario = [s for s in params.scenario or SCENARIOS if s not in ("checkout-branch", "merge")]
+  workdir = params.workdir or tempfile.mkdtemp(prefix="tinygit-bench-")
+  try:
+    base = os.path.join(workdir, "base")
+    start = time.perf_counter()
+    paths = generate(base, params)
+    results = {
+      "revision": revision(),
+      "python": sys.version.split()[0],
+      "params": {k: v for k, v in vars(params).items() if k not in ("workdir", "output", "compare")},
+      "generate_wall": time.perf_counter() - start,
+      "scenarios": {},
+    }
+    for name in params.scenario or SCENARIOS:
+      results["scenarios"][name] = run_scenario(name, base, workdir, params, paths)
+      print(f"{name:<18}{results['scenarios'][name]['median_wall']:.3f}s", file=sys.stderr)
+  finally:
+    if params.workdir is None:
+      shutil.rmtree(workdir)
+  if params.output:
+    with open(params.output, "w") as f:
+      json.dump(results, f, indent=2)
+  if params.compare:
+    with open(params.compare) as f:
+      compare(results, json.load(f))
+  return results
+
+if __name__ == "__main__":
+  sys.path.insert(0, SOURCE_DIR)
+  main(sys.argv[1:])
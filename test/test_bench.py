@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import shutil
+import os
+import json
+from bench.bench import main, measure, SCENARIOS
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_bench_results(self):
+        main(["--files", "20", "--depth", "2", "--commits", "3", "--repeat", "1", "-o", "results.json"])
+        with open("results.json") as f:
+            results = json.load(f)
+        self.assertEqual(list(results["scenarios"]), list(SCENARIOS))
+        self.assertEqual(results["params"]["files"], 20)
+        for scenario in results["scenarios"].values():
+            self.assertEqual(len(scenario["runs"]), 1)
+            for key in ["wall", "cpu", "maxrss_kb", "object_reads", "object_writes"]:
+                self.assertIn(key, scenario["runs"][0])
+        self.assertGreater(results["scenarios"]["commit"]["runs"][0]["object_writes"], 0)
+        self.assertGreater(results["scenarios"]["log"]["runs"][0]["object_reads"], 0)
+
+    def test_bench_generate_is_reproducible(self):
+        main(["--files", "10", "--commits", "2", "--branches", "0", "--repeat", "1", "--scenario", "log", "--workdir", "a"])
+        main(["--files", "10", "--commits", "2", "--branches", "0", "--repeat", "1", "--scenario", "log", "--workdir", "b"])
+        with open(os.path.join("a", "base", ".tinygit", "refs", "heads", "master")) as f:
+            a = f.read()
+        with open(os.path.join("b", "base", ".tinygit", "refs", "heads", "master")) as f:
+            b = f.read()
+        self.assertEqual(a, b)
+
+    def test_bench_merge_never_conflicts(self):
+        # high change rate, so master and the branch would touch the same files
+        for seed in range(3):
+            main(["--files", "20", "--depth", "1", "--commits", "3", "--branches", "1", "--change-rate", "0.5",
+                  "--repeat", "1", "--scenario", "merge", "--seed", str(seed)])
+
+    def test_bench_measure_drains_stderr(self):
+        # an error message far bigger than the pipe buffer
+        os.system("tinygit init >> /dev/null")
+        with self.assertRaises(Exception) as cm:
+            measure(["cat-file", "-t", "x" * 100000])
+        self.assertIn("did not match any objects", str(cm.exception))
+
+if __name__ == '__main__':
+    unittest.main()
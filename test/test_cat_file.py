@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+from tinygit.state import * 
+
+class TestCatFile(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_cat_file_not_a_repo(self):
+        out = subprocess.run(["tinygit", "cat-file", "-t", "3e1a939bd3fd30ba3d114bedba0fb888183f0b20"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_cat_file_type_and_size(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "cat-file", "-t", "3e1a939bd3fd30ba3d114bedba0fb888183f0b20"], capture_output=True)
+        self.assertEqual(out.stdout, b"commit\n")
+        out = subprocess.run(["tinygit", "cat-file", "-s", "01704555d3be59fda548e5524445e25b07c9b509"], capture_output=True)
+        self.assertEqual(out.stdout, b"2\n")
+
+    def test_cat_file_alias(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "cat-file", "-t", "HEAD"], capture_output=True)
+        self.assertEqual(out.stdout, b"commit\n")
+        out = subprocess.run(["tinygit", "cat-file", "-s", "master"], capture_output=True)
+        self.assertEqual(out.stdout, b"96\n")
+        out = subprocess.run(["tinygit", "cat-file", "-t", "0170"], capture_output=True)
+        self.assertEqual(out.stdout, b"tree\n")
+        out = subprocess.run(["tinygit", "cat-file", "-t", "dne"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_cat_file_info_packed_deltas(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 5000 > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        for i in range(3):
+            os.system(f"echo 'line {i}' >> a.txt")
+            os.system("tinygit commit next >> /dev/null")
+        repo = repo_find()
+        expected = {sha: (repo.object_read(sha).kind, len(repo.object_read(sha).serialize())) 
+                    for sha in repo.loose_object_list()}
+        os.system("tinygit repack >> /dev/null")
+        repo = repo_find()
+        for sha, info in expected.items():
+            self.assertEqual(repo.object_info(sha), info)
+
+    def test_cat_file_batch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'aaaaa' > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        repo = repo_find()
+        blobsha = repo.tree_read(repo.object_read(repo.resolve_head()).state["headers"]["tree"])[0].sha
+        out = subprocess.run(["tinygit", "cat-file", "--batch"], 
+            input=f"{blobsha}\nmaster\ndne\n".encode(), capture_output=True)
+        commit = repo.object_read(repo.resolve_head()).serialize()
+        self.assertEqual(out.stdout, 
+            f"{blobsha} blob 5\naaaaa\n".encode() + 
+            f"{repo.resolve_head()} commit {len(commit)}\n".encode() + commit + b"\n" + 
+            b"dne missing\n"
+        )
+
+    def test_cat_file_batch_check(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "cat-file", "--batch-check"], input=b"HEAD\n01704555\n", capture_output=True)
+        self.assertEqual(out.stdout, 
+            b"3e1a939bd3fd30ba3d114bedba0fb888183f0b20 commit 96\n"
+            b"01704555d3be59fda548e5524445e25b07c9b509 tree 2\n"
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,5 +46,23 @@ class TestCheckoutBranch(unittest.TestCase):
         out = subprocess.run(["ls"], capture_output=True)
         self.assertEqual(out.stdout, b'a.txt\n')
 
+    def test_checkout_branch_only_touches_changed_paths(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && echo same > d/same && echo a > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch otherbranch >> /dev/null")
+        os.system("tinygit checkout-branch otherbranch >> /dev/null")
+        os.system("echo b > a.txt && mkdir e && echo e > e/e")
+        subprocess.run(["tinygit", "commit", "changed a, added e"], capture_output=True)
+        inode = os.stat("d/same").st_ino
+        os.system("tinygit checkout-branch master >> /dev/null")
+        self.assertEqual(os.stat("d/same").st_ino, inode)
+        self.assertFalse(os.path.exists("e"))
+        with open("a.txt") as f:
+            self.assertEqual(f.read(), "a\n")
+        os.system("tinygit checkout-branch otherbranch >> /dev/null")
+        with open("e/e") as f:
+            self.assertEqual(f.read(), "e\n")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
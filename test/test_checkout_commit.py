@@ -55,5 +55,36 @@ class TestCheckoutCommit(unittest.TestCase):
         out = subprocess.run(["ls"], capture_output=True)
         self.assertEqual(out.stdout, b'a.txt\n')
 
+    def test_checkout_commit_parallel_writers(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir -p d/e && for i in $(seq 1 50); do echo $i > d/e/$i; echo $i > d/$i; done")
+        out = subprocess.run(["tinygit", "commit", "first"], capture_output=True).stdout.decode()
+        first_sha = out.split()[1]
+        os.system("rm -rf d")
+        subprocess.run(["tinygit", "commit", "second"], capture_output=True)
+        out = subprocess.run(["tinygit", "checkout-commit", "-j", "4", first_sha], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        for i in range(1, 51):
+            with open(f"d/e/{i}") as f:
+                self.assertEqual(f.read(), f"{i}\n")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Nothing to commit", out.stdout)
+
+    def test_checkout_commit_executable(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo x > run.sh && chmod +x run.sh")
+        out = subprocess.run(["tinygit", "commit", "first"], capture_output=True).stdout.decode()
+        first_sha = out.split()[1]
+        os.system("rm run.sh")
+        subprocess.run(["tinygit", "commit", "second"], capture_output=True)
+        os.system(f"tinygit checkout-commit {first_sha} >> /dev/null")
+        self.assertTrue(os.access("run.sh", os.X_OK))
+
+    def test_checkout_commit_bad_jobs(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "checkout-commit", "-j", "0", "HEAD"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
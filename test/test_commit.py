@@ -87,6 +87,51 @@ class TestCommit(unittest.TestCase):
         )
 
 
+    def test_commit_jobs_same_as_serial(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir -p d/e && seq 1 1000 > d/e/a && seq 1 2000 > d/b && echo c > c && echo c > d/c")
+        serial = subprocess.run(["tinygit", "commit", "-j", "1", "message"], capture_output=True).stdout.decode()
+        parallel = subprocess.run(["tinygit", "commit", "-j", "8", "message"], capture_output=True).stdout.decode()
+        repo = repo_find()
+        self.assertEqual(
+            repo.object_read(serial.split()[1]).state["headers"]["tree"],
+            repo.object_read(parallel.split()[1]).state["headers"]["tree"]
+        )
+
+    def test_commit_bad_jobs(self):
+        os.system("tinygit init >> /dev/null")
+        out = subprocess.run(["tinygit", "commit", "-j", "0", "message"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_commit_typed_tree_entries(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && echo 'aaaaa' > a.txt && echo 'x' > run.sh && chmod +x run.sh")
+        out = subprocess.run(["tinygit", "commit", "message"], capture_output=True).stdout.decode()
+        repo = repo_find()
+        treesha = repo.object_read(out.split()[1]).state["headers"]["tree"]
+        entries = sorted(repo.tree_read(treesha))
+        self.assertEqual([e.name for e in entries], ["a.txt", "d", "run.sh"])
+        self.assertEqual([e.kind for e in entries], ["blob", "tree", "blob"])
+        self.assertEqual([e.executable for e in entries], [False, False, True])
+        self.assertEqual([e.size for e in entries], [6, None, 2])
+
+    def test_commit_untyped_tree_readable(self):
+        os.system("tinygit init >> /dev/null")
+        repo = repo_find()
+        blobsha = repo.object_write(GitBlob(b"aaaaa\n"))
+        tree = GitTree()
+        tree.items.append(["a.txt", blobsha])
+        treesha = repo.object_write(tree)
+        self.assertEqual(repo.tree_read(treesha), [TreeEntry("a.txt", blobsha, "blob", None, 6)])
+
+    def test_commit_updates_commit_graph(self):
+        os.system("tinygit init >> /dev/null")
+        first = subprocess.run(["tinygit", "commit", "first"], capture_output=True).stdout.decode().split()[1]
+        second = subprocess.run(["tinygit", "commit", "second"], capture_output=True).stdout.decode().split()[1]
+        graph = repo_find().commit_graph()
+        self.assertEqual(graph.lookup(first), ("01704555d3be59fda548e5524445e25b07c9b509", [], 1))
+        self.assertEqual(graph.lookup(second), ("01704555d3be59fda548e5524445e25b07c9b509", [first], 2))
+
     # test commit detached
 
 if __name__ == '__main__':
@@ -0,0 +1,127 @@
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import subprocess
+from tinygit.state import * 
+from tinygit.daemon import *
+from tinygit.utils import *
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None:
+            self.daemon.terminate()
+            self.daemon.wait()
+        shutil.rmtree(self.test_dir)
+
+    def start_daemon(self):
+        self.daemon = subprocess.Popen(["tinygit", "daemon", "-v"], stdout=subprocess.PIPE, text=True)
+        for _ in range(500):
+            sock = daemon_connect(os.path.join(".tinygit", "daemon.sock"))
+            if sock is not None:
+                sock.close()
+                return
+            time.sleep(0.01)
+        self.fail("daemon didn't start")
+
+    def stop_daemon(self):
+        subprocess.run(["tinygit", "daemon", "--stop"], check=True)
+        out = self.daemon.communicate()[0]
+        self.daemon = None
+        return out
+
+    def test_daemon_not_a_repo(self):
+        out = subprocess.run(["tinygit", "daemon"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_daemon_stop_not_running(self):
+        os.system("tinygit init >> /dev/null")
+        out = subprocess.run(["tinygit", "daemon", "--stop"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_daemon_serves_commands(self):
+        os.system("tinygit init >> /dev/null")
+        self.start_daemon()
+        os.system("printf 'aaa' > a")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "log", "--oneline"], capture_output=True, text=True)
+        os.mkdir("sub")
+        os.chdir("sub")
+        out = subprocess.run(["tinygit", "status"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 0)
+        os.chdir("..")
+        served = self.stop_daemon()
+        self.assertEqual(served.splitlines(), [
+            f"{self.test_dir} tinygit commit first",
+            f"{self.test_dir} tinygit log --oneline",
+            f"{os.path.join(self.test_dir, 'sub')} tinygit status",
+        ])
+        self.assertFalse(os.path.exists(os.path.join(".tinygit", "daemon.sock")))
+
+    def test_daemon_same_output_and_exit_code(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        commands = [["log"], ["branch"], ["cat-file", "-s", "HEAD"], ["checkout-branch", "nope"], ["rev-parse", "nope"]]
+        env = dict(os.environ, TINYGIT_NO_DAEMON="1")
+        expected = [subprocess.run(["tinygit", *c], capture_output=True, env=env) for c in commands]
+        self.start_daemon()
+        for command, want in zip(commands, expected):
+            got = subprocess.run(["tinygit", *command], capture_output=True)
+            self.assertEqual(got.returncode, want.returncode)
+            self.assertEqual(got.stdout, want.stdout)
+
+    def test_daemon_sees_changes_from_other_processes(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        self.start_daemon()
+        os.system("tinygit log >> /dev/null")
+        env = dict(os.environ, TINYGIT_NO_DAEMON="1")
+        subprocess.run(["tinygit", "commit", "second"], capture_output=True, env=env)
+        subprocess.run(["tinygit", "repack"], capture_output=True, env=env)
+        out = subprocess.run(["tinygit", "rev-parse", "HEAD"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "44b9c372364f91cd4d0e7c84fee2d1ff27be295d\n")
+        out = subprocess.run(["tinygit", "cat-file", "-t", "44b9c372364f91cd4d0e7c84fee2d1ff27be295d"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "commit\n")
+
+    def test_daemon_stale_socket(self):
+        os.system("tinygit init >> /dev/null")
+        self.start_daemon()
+        self.daemon.kill()
+        self.daemon.wait()
+        self.daemon = None
+        # in process fallback, then a new daemon replaces the stale socket
+        out = subprocess.run(["tinygit", "commit", "first"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.start_daemon()
+        out = subprocess.run(["tinygit", "log"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(self.stop_daemon(), f"{self.test_dir} tinygit log\n")
+
+    def test_daemon_closed_pipe(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        repo = repo_find()
+        sha = repo.resolve_head()
+        # enough history to overflow the pipe buffer
+        for i in range(1000):
+            commit = GitCommit()
+            commit.state["headers"] = {"tree": "01704555d3be59fda548e5524445e25b07c9b509", "parent": sha}
+            commit.state["body"] = f"commit {i}"
+            sha = repo.object_write(commit)
+        write_file(repo.tinygitdir, "refs", "heads", "master", data=sha)
+        self.start_daemon()
+        out = subprocess.run("tinygit log | head -c 10", shell=True, capture_output=True)
+        self.assertEqual(out.stderr, b'')
+        out = subprocess.run(["tinygit", "log", "--oneline", "-n", "1"], capture_output=True, text=True)
+        self.assertIn("commit 999", out.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        # Create a tmp directory before all tests
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        # Remove tmp directory after the tests
+        shutil.rmtree(self.test_dir)
+
+    def commit(self, message):
+        subprocess.run(["tinygit", "commit", message], capture_output=True)
+        out = subprocess.run(["tinygit", "rev-parse", "HEAD"], capture_output=True, text=True)
+        return out.stdout.strip()
+
+    def test_diff_not_a_repo(self):
+        out = subprocess.run(["tinygit", "diff"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_diff_clean(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'a a a' > a")
+        self.commit("created a")
+        out = subprocess.run(["tinygit", "diff", "--name-status"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(out.stdout, b"")
+
+    def test_diff_workdir_name_status(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'a a a' > a && mkdir d && echo 'b b b' > d/b && echo 'c c c' > c")
+        self.commit("first")
+        os.system("echo 'A A A' > a && rm -r d && mkdir e && echo 'f f f' > e/f")
+        out = subprocess.run(["tinygit", "diff", "--name-status"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "M\ta\nD\td/b\nA\te/f\n")
+
+    def test_diff_commits_name_status(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'a a a' > a && echo 'b b b' > b")
+        first = self.commit("first")
+        os.system("echo 'A A A' > a && rm b && mkdir b && echo 'c c c' > b/c")
+        second = self.commit("second")
+        out = subprocess.run(["tinygit", "diff", "--name-status", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "M\ta\nD\tb\nA\tb/c\n")
+        out = subprocess.run(["tinygit", "diff", "--name-status", second, first], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "M\ta\nD\tb/c\nA\tb\n")
+
+    def test_diff_stat(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'a\\nb\\nc\\n' > a && printf '\\0\\1' > bin")
+        self.commit("first")
+        os.system("printf 'a\\nB\\nc\\nd\\n' > a && printf '\\0\\1\\2' > bin")
+        out = subprocess.run(["tinygit", "diff", "--stat"], capture_output=True, text=True)
+        self.assertEqual(out.stdout,
+            " a   | 3 ++-\n"
+            " bin | Bin 2 -> 3 bytes\n"
+            " 2 files changed, 2 insertions(+), 1 deletion(-)\n")
+
+    def test_diff_unknown_commit(self):
+        os.system("tinygit init >> /dev/null")
+        self.commit("first")
+        out = subprocess.run(["tinygit", "diff", "nothere"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_status_uses_diff(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && echo 'b b b' > d/b")
+        self.commit("first")
+        os.system("echo 'B B B' > d/b")
+        out = subprocess.run(["tinygit", "status"], capture_output=True, text=True)
+        self.assertIn("Modified ('dir', 'd')\nModified ('file', 'd/b')\n", out.stdout)
+
+    def test_diff_patch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 20 > a && echo x > gone")
+        self.commit("first")
+        os.system("seq 1 20 | sed 's/^3$/three/; s/^18$/eighteen/' > a && rm gone")
+        out = subprocess.run(["tinygit", "diff"], capture_output=True, text=True)
+        self.assertEqual(out.stdout,
+            "diff --git a/a b/a\n--- a/a\n+++ b/a\n"
+            "@@ -1,6 +1,6 @@\n 1\n 2\n-3\n+three\n 4\n 5\n 6\n"
+            "@@ -15,6 +15,6 @@\n 15\n 16\n 17\n-18\n+eighteen\n 19\n 20\n"
+            "diff --git a/gone b/gone\ndeleted file mode 100644\n--- a/gone\n+++ /dev/null\n"
+            "@@ -1 +0,0 @@\n-x\n")
+
+    def test_diff_patch_context(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 20 > a")
+        first = self.commit("first")
+        os.system("seq 1 20 | sed 's/^3$/three/; s/^10$/ten/' > a")
+        second = self.commit("second")
+        out = subprocess.run(["tinygit", "diff", "-U", "0", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout,
+            "diff --git a/a b/a\n--- a/a\n+++ b/a\n@@ -3 +3 @@\n-3\n+three\n@@ -10 +10 @@\n-10\n+ten\n")
+        out = subprocess.run(["tinygit", "diff", "-U", "5", first, second], capture_output=True, text=True)
+        self.assertIn("@@ -1,15 +1,15 @@\n", out.stdout)
+        out = subprocess.run(["tinygit", "diff", "-U", "-1", first, second], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_diff_patch_binary_and_no_newline(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf '\\0\\1' > bin")
+        self.commit("first")
+        os.system("printf '\\0\\2' > bin && printf 'no newline' > n")
+        out = subprocess.run(["tinygit", "diff"], capture_output=True, text=True)
+        self.assertEqual(out.stdout,
+            "diff --git a/bin b/bin\nBinary files a/bin and b/bin differ\n"
+            "diff --git a/n b/n\nnew file mode 100644\n--- /dev/null\n+++ b/n\n"
+            "@@ -0,0 +1 @@\n+no newline\n\\ No newline at end of file\n")
+
+    def test_line_matches_minimal(self):
+        from tinygit.diff import line_matches
+        a, b = list("abcabba"), list("cbabac")
+        matches = list(line_matches(a, b))
+        self.assertEqual(sum(n for _, _, n in matches), 4)
+        for i, j, n in matches:
+            self.assertEqual(a[i:i + n], b[j:j + n])
+
+    def test_diff_renames(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && seq 1 30 > d/a && seq 100 140 > d/b && seq 200 210 > other")
+        first = self.commit("first")
+        os.system("mv d e && seq 1 31 > e/a && seq 300 310 > other")
+        second = self.commit("second")
+        out = subprocess.run(["tinygit", "diff", "--name-status", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "R096\td/a\te/a\nR100\td/b\te/b\nM\tother\n")
+        out = subprocess.run(["tinygit", "diff", "-M97", "--name-status", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "D\td/a\nA\te/a\nR100\td/b\te/b\nM\tother\n")
+        out = subprocess.run(["tinygit", "diff", "--no-renames", "--name-status", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "D\td/a\nD\td/b\nA\te/a\nA\te/b\nM\tother\n")
+        out = subprocess.run(["tinygit", "diff", "-l", "0", "--name-status", first, second], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "D\td/a\nA\te/a\nR100\td/b\te/b\nM\tother\n")
+
+    def test_diff_rename_patch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 30 > a")
+        self.commit("first")
+        os.system("rm a && seq 1 31 > b")
+        out = subprocess.run(["tinygit", "diff"], capture_output=True, text=True)
+        self.assertEqual(out.stdout,
+            "diff --git a/a b/b\nsimilarity index 96%\nrename from a\nrename to b\n--- a/a\n+++ b/b\n"
+            "@@ -28,3 +28,4 @@\n 28\n 29\n 30\n+31\n")
+
+    def test_diff_copies(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 30 > a")
+        self.commit("first")
+        os.system("cp a b && echo 31 >> a")
+        out = subprocess.run(["tinygit", "diff", "--name-status"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "M\ta\nA\tb\n")
+        out = subprocess.run(["tinygit", "diff", "-C", "--name-status"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "M\ta\nC100\ta\tb\n")
@@ -0,0 +1,89 @@
+import unittest
+import tempfile
+import shutil
+import os
+import zlib
+import subprocess
+from tinygit.state import * 
+
+class TestFsck(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def blob_path(self, sha):
+        return os.path.join(".tinygit", "objects", sha[0:2], sha[2:])
+
+    def commit_file(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'aaa' > a")
+        os.system("tinygit commit first >> /dev/null")
+        repo = repo_find()
+        return repo.tree_read(repo.object_read(repo.resolve_head()).state["headers"]["tree"])[0].sha
+
+    def test_fsck_not_a_repo(self):
+        out = subprocess.run(["tinygit", "fsck"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_fsck_clean(self):
+        self.commit_file()
+        os.system("tinygit repack >> /dev/null")
+        out = subprocess.run(["tinygit", "fsck"], capture_output=True, text=True)
+        self.assertEqual((out.returncode, out.stdout, out.stderr), (0, "", ""))
+
+    def test_fsck_progress(self):
+        self.commit_file()
+        out = subprocess.run(["tinygit", "fsck", "--progress"], capture_output=True)
+        self.assertEqual(out.stderr, b"\rChecking objects: 100% (3/3)\n")
+
+    def test_fsck_corrupt(self):
+        sha = self.commit_file()
+        with open(self.blob_path(sha), "wb") as f:
+            f.write(zlib.compress(b"blob 3\x00aab"))
+        out = subprocess.run(["tinygit", "fsck"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 1)
+        self.assertRegex(out.stdout, f"^corrupt {sha}: hashes to [0-9a-f]{{40}}\n$")
+        # only the header of blobs is checked
+        out = subprocess.run(["tinygit", "fsck", "--connectivity-only"], capture_output=True, text=True)
+        self.assertEqual((out.returncode, out.stdout), (0, ""))
+
+    def test_fsck_missing(self):
+        sha = self.commit_file()
+        os.remove(self.blob_path(sha))
+        for args in [[], ["--connectivity-only"]]:
+            out = subprocess.run(["tinygit", "fsck", *args], capture_output=True, text=True)
+            self.assertEqual(out.returncode, 1)
+            self.assertEqual(out.stdout, f"missing blob {sha}\n")
+
+    def test_fsck_dangling(self):
+        self.commit_file()
+        os.system("printf 'bbb' > b")
+        sha = subprocess.run(["tinygit", "hash-object", "-w", "b"], capture_output=True, text=True).stdout.strip()
+        out = subprocess.run(["tinygit", "fsck"], capture_output=True, text=True)
+        self.assertEqual((out.returncode, out.stdout), (0, f"dangling blob {sha}\n"))
+
+    def test_fsck_parallel(self):
+        os.system("tinygit init >> /dev/null")
+        os.mkdir("d")
+        for i in range(600):
+            with open(os.path.join("d", str(i)), "w") as f:
+                f.write(str(i))
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        os.system("printf 'x' > d/0")
+        os.system("tinygit commit second >> /dev/null")
+        sha = repo_find().object_resolve("HEAD")[0]
+        with open(self.blob_path(sha), "wb") as f:
+            f.write(b"not zlib")
+        one = subprocess.run(["tinygit", "fsck", "-j", "1"], capture_output=True, text=True)
+        many = subprocess.run(["tinygit", "fsck", "-j", "4"], capture_output=True, text=True)
+        self.assertEqual(one.returncode, 1)
+        self.assertEqual((many.returncode, many.stdout), (one.returncode, one.stdout))
+        self.assertTrue(one.stdout.startswith(f"corrupt {sha}: "))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import subprocess
+from tinygit.state import * 
+
+DAY = 24 * 60 * 60
+
+class TestGc(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def hash_object(self, data):
+        with open("obj", "w") as f:
+            f.write(data)
+        sha = subprocess.run(["tinygit", "hash-object", "-w", "obj"], capture_output=True, text=True).stdout.strip()
+        os.remove("obj")
+        return sha
+
+    def age(self, sha, days):
+        path = os.path.join(".tinygit", "objects", sha[0:2], sha[2:])
+        os.utime(path, (time.time() - days * DAY, time.time() - days * DAY))
+
+    def test_gc_not_a_repo(self):
+        out = subprocess.run(["tinygit", "gc"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_gc_prunes_old_unreachable_and_packs_reachable(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'aaa' > a")
+        os.system("tinygit commit first >> /dev/null")
+        old, recent = self.hash_object("old"), self.hash_object("recent")
+        self.age(old, 30)
+        out = subprocess.run(["tinygit", "gc"], capture_output=True, text=True)
+        self.assertEqual(out.stdout.splitlines()[0], "Packed 3 objects, pruned 1 unreachable objects")
+        self.assertRegex(out.stdout.splitlines()[1], "^Reclaimed -?[0-9]+ bytes of disk$")
+        repo = repo_find()
+        self.assertEqual(repo.loose_object_list(), [recent])
+        self.assertFalse(repo.object_exists(old))
+        self.assertEqual(len(repo.pack_list()), 1)
+        out = subprocess.run(["tinygit", "status"], capture_output=True, text=True)
+        self.assertIn("Nothing to commit, working tree clean", out.stdout)
+
+    def test_gc_grace_zero_prunes_deleted_branch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit checkout-branch other >> /dev/null")
+        os.system("printf 'bbb' > b")
+        os.system("tinygit commit second >> /dev/null")
+        abandoned = repo_find().resolve_branch("other")
+        os.system("tinygit checkout-branch master >> /dev/null")
+        os.system("tinygit branch -d other >> /dev/null")
+        subprocess.run(["tinygit", "gc", "--grace", "0"], capture_output=True)
+        repo = repo_find()
+        self.assertFalse(repo.object_exists(abandoned))
+        self.assertTrue(repo.object_exists(repo.resolve_head()))
+        self.assertEqual(repo.loose_object_list(), [])
+
+    def test_gc_full_drops_unreachable_packed(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        old = self.hash_object("old")
+        os.system("tinygit repack >> /dev/null")
+        # recent pack, its unreachable objects are loosened, then pruned once old
+        subprocess.run(["tinygit", "gc", "--full"], capture_output=True)
+        repo = repo_find()
+        self.assertEqual(repo.loose_object_list(), [old])
+        self.assertEqual(len(repo.pack_list()), 1)
+        self.age(old, 30)
+        subprocess.run(["tinygit", "gc", "--full"], capture_output=True)
+        repo = repo_find()
+        self.assertFalse(repo.object_exists(old))
+        self.assertTrue(repo.object_exists(repo.resolve_head()))
+
+    def test_gc_rewritten_object_is_fresh(self):
+        os.system("tinygit init >> /dev/null")
+        sha = self.hash_object("again")
+        self.age(sha, 30)
+        # a writer reusing the object makes it recent again
+        self.hash_object("again")
+        subprocess.run(["tinygit", "gc"], capture_output=True)
+        self.assertTrue(repo_find().object_exists(sha))
+
+    def test_gc_auto(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "gc", "--auto"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, "")
+        self.assertEqual(len(repo_find().loose_object_list()), 2)
+
+    def test_gc_lock(self):
+        os.system("tinygit init >> /dev/null")
+        with open(os.path.join(".tinygit", "gc.lock"), "w") as f:
+            f.write(str(os.getpid()))
+        out = subprocess.run(["tinygit", "gc"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+        # a lock left by a process that's gone is taken over
+        proc = subprocess.Popen(["true"])
+        proc.wait()
+        with open(os.path.join(".tinygit", "gc.lock"), "w") as f:
+            f.write(str(proc.pid))
+        out = subprocess.run(["tinygit", "gc"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertFalse(os.path.exists(os.path.join(".tinygit", "gc.lock")))
+
+if __name__ == '__main__':
+    unittest.main()
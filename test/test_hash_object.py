@@ -0,0 +1,38 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+import hashlib
+from tinygit.state import * 
+
+class TestHashObject(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_hash_object_blob(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'aaaaa' > a.txt")
+        out = subprocess.run(["tinygit", "hash-object", "a.txt"], capture_output=True)
+        self.assertEqual(out.stdout.decode().strip(), hashlib.sha1(b"blob 6\x00aaaaa\n").hexdigest())
+        self.assertEqual(repo_find().loose_object_list(), [])
+
+    def test_hash_object_large_blob_roundtrip(self):
+        os.system("tinygit init >> /dev/null")
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        with open("big", "wb") as f:
+            f.write(data)
+        out = subprocess.run(["tinygit", "hash-object", "-w", "big"], capture_output=True)
+        sha = out.stdout.decode().strip()
+        self.assertEqual(sha, hashlib.sha1(b"blob %d\x00" % len(data) + data).hexdigest())
+        kind, size, chunks = repo_find().object_open(sha)
+        self.assertEqual((kind, size), ("blob", len(data)))
+        self.assertEqual(b"".join(chunks), data)
+
+if __name__ == '__main__':
+    unittest.main()
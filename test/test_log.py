@@ -3,6 +3,8 @@ import tempfile
 import shutil
 import os
 import subprocess
+from tinygit.state import *
+from tinygit.utils import *
 
 class TestLog(unittest.TestCase):
     def setUp(self):
@@ -62,7 +64,77 @@ class TestLog(unittest.TestCase):
             out.stdout, 
             b'\x1b[95mcommit 44b9c372364f91cd4d0e7c84fee2d1ff27be295d\x1b[0m\n{\n  "headers": {\n    "tree": "01704555d3be59fda548e5524445e25b07c9b509",\n    "parent": "3e1a939bd3fd30ba3d114bedba0fb888183f0b20"\n  },\n  "body": "second"\n}\n\n\x1b[95mcommit 3e1a939bd3fd30ba3d114bedba0fb888183f0b20\x1b[0m\n{\n  "headers": {\n    "tree": "01704555d3be59fda548e5524445e25b07c9b509"\n  },\n  "body": "first"\n}\n\n'
         )
-        
+
+
+    def test_log_max_count_skip(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit commit second >> /dev/null")
+        os.system("tinygit commit third >> /dev/null")
+        out = subprocess.run(["tinygit", "log", "--oneline", "-n", "1", "--skip", "1"], capture_output=True)
+        self.assertEqual(out.stdout, b'\x1b[95m44b9c37\x1b[0m second\n')
+
+    def test_log_machine(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "log", "--machine"], capture_output=True)
+        self.assertEqual(
+            out.stdout,
+            b'{"sha": "3e1a939bd3fd30ba3d114bedba0fb888183f0b20", "tree": "01704555d3be59fda548e5524445e25b07c9b509", "parents": [], "body": "first"}\n'
+        )
+
+    def test_log_negative_count(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "log", "-n", "-1"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_log_closed_pipe(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        repo = repo_find()
+        sha = repo.resolve_head()
+        # enough history to overflow the pipe buffer
+        for i in range(1000):
+            commit = GitCommit()
+            commit.state["headers"] = {"tree": "01704555d3be59fda548e5524445e25b07c9b509", "parent": sha}
+            commit.state["body"] = f"commit {i}"
+            sha = repo.object_write(commit)
+        write_file(repo.tinygitdir, "refs", "heads", "master", data=sha)
+        out = subprocess.run("tinygit log | head -c 10", shell=True, capture_output=True)
+        self.assertEqual(out.stderr, b'')
+
+    def test_log_octopus(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        repo = repo_find()
+        root = repo.resolve_head()
+        tree = "01704555d3be59fda548e5524445e25b07c9b509"
+        branches = []
+        for i in range(3):
+            commit = GitCommit()
+            commit.state["headers"] = {"tree": tree, "parent": root}
+            commit.state["body"] = f"branch {i}"
+            branches.append(repo.object_write(commit))
+        # the commit-graph doesn't store commits with more than two parents
+        commit = GitCommit()
+        commit.state["headers"] = {"tree": tree, "parent": branches}
+        commit.state["body"] = "octopus"
+        octopus = repo.object_write(commit)
+        commit = GitCommit()
+        commit.state["headers"] = {"tree": tree, "parent": octopus}
+        commit.state["body"] = "top"
+        top = repo.object_write(commit)
+        write_file(repo.tinygitdir, "refs", "heads", "master", data=top)
+        out = subprocess.run(["tinygit", "log", "--oneline"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(len(out.stdout.splitlines()), 6)
+        self.assertTrue(out.stdout.splitlines()[1].endswith(b"octopus"))
+        repo = repo_find()
+        self.assertTrue(repo.is_ancestor(branches[2], top))
+        self.assertFalse(repo.is_ancestor(branches[0], branches[1]))
+        self.assertEqual(repo.merge_base(top, branches[1]), branches[1])
+        self.assertEqual(repo.merge_base(branches[0], branches[1]), root)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
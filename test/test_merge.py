@@ -0,0 +1,161 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+import json
+from tinygit.state import * 
+
+class TestMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_merge_not_a_repo(self):
+        out = subprocess.run(["tinygit", "merge", "master"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_merge_bad_branch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "merge", "dne"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_merge_union(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo a > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch otherbranch >> /dev/null")
+        os.system("tinygit checkout-branch otherbranch >> /dev/null")
+        os.system("mkdir d && echo b > d/b.txt")
+        os.system("tinygit commit second >> /dev/null")
+        os.system("tinygit checkout-branch master >> /dev/null")
+        os.system("tinygit merge otherbranch >> /dev/null")
+        out = subprocess.run(["ls", "a.txt", "d"], capture_output=True)
+        self.assertEqual(out.stdout, b'a.txt\n\nd:\nb.txt\n')
+
+    def test_merge_already_up_to_date(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch otherbranch >> /dev/null")
+        os.system("tinygit commit second >> /dev/null")
+        out = subprocess.run(["tinygit", "merge", "otherbranch"], capture_output=True)
+        self.assertIn(b"Already up to date", out.stdout)
+
+    # master and other fork from a commit holding the given files, then each
+    # side writes its files and commits
+    def fork(self, base, ours, theirs):
+        os.system("tinygit init >> /dev/null")
+        self.write(base)
+        os.system("tinygit commit base >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit checkout-branch other >> /dev/null")
+        self.write(theirs)
+        os.system("tinygit commit theirs >> /dev/null")
+        os.system("tinygit checkout-branch master >> /dev/null")
+        self.write(ours)
+        os.system("tinygit commit ours >> /dev/null")
+
+    def write(self, files):
+        for path, data in files.items():
+            if data is None:
+                os.remove(path)
+                continue
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(data)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_merge_fast_forward(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit checkout-branch other >> /dev/null")
+        os.system("echo b > b")
+        os.system("tinygit commit second >> /dev/null")
+        os.system("tinygit checkout-branch master >> /dev/null")
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        repo = repo_find()
+        self.assertEqual(out.stdout, f"Fast-forward to {repo.resolve_branch('other')}\n")
+        self.assertEqual(repo.resolve_head(), repo.resolve_branch("other"))
+        self.assertEqual(self.read("b"), "b\n")
+
+    def test_merge_three_way(self):
+        self.fork({"a": "a\n", "b": "b\n", "c": "c\n"}, {"a": "ours\n", "c": None}, {"b": "theirs\n", "d/e": "e\n"})
+        repo = repo_find()
+        ours, theirs = repo.resolve_head(), repo.resolve_branch("other")
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 0)
+        merge = repo_find().resolve_head()
+        self.assertEqual(out.stdout, f"Merge made commit {merge}\n")
+        self.assertEqual(repo.object_read(merge).parents(), [ours, theirs])
+        self.assertEqual((self.read("a"), self.read("b"), self.read("d/e")), ("ours\n", "theirs\n", "e\n"))
+        self.assertFalse(os.path.exists("c"))
+        out = subprocess.run(["tinygit", "status"], capture_output=True, text=True)
+        self.assertIn("Nothing to commit, working tree clean", out.stdout)
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        self.assertIn("Already up to date", out.stdout)
+
+    def test_merge_lines(self):
+        base = "".join(f"{i}\n" for i in range(10))
+        self.fork({"f": base}, {"f": base.replace("1\n", "one\n")}, {"f": base.replace("8\n", "eight\n")})
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(self.read("f"), base.replace("1\n", "one\n").replace("8\n", "eight\n"))
+
+    def test_merge_conflict(self):
+        self.fork({"f": "a\nb\nc\n", "g": "g\n"}, {"f": "a\nours\nc\n", "g": None}, {"f": "a\ntheirs\nc\n", "g": "changed\n"})
+        repo = repo_find()
+        ours, theirs = repo.resolve_head(), repo.resolve_branch("other")
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 1)
+        self.assertEqual(out.stdout, 
+            "CONFLICT (content): f\n"
+            "CONFLICT (modify/delete): g\n"
+            "Automatic merge failed, fix the conflicts and commit the result\n")
+        self.assertEqual(self.read("f"), "a\n<<<<<<< HEAD\nours\n=======\ntheirs\n>>>>>>> other\nc\n")
+        self.assertEqual(self.read("g"), "changed\n")
+        self.assertEqual(repo_find().resolve_head(), ours)
+        # committing the resolution makes the merge commit
+        self.write({"f": "a\nboth\nc\n"})
+        os.system("tinygit commit resolved >> /dev/null")
+        repo = repo_find()
+        self.assertEqual(repo.object_read(repo.resolve_head()).parents(), [ours, theirs])
+        self.assertFalse(os.path.exists(os.path.join(".tinygit", "MERGE_HEAD")))
+
+    def test_merge_conflict_name_taken(self):
+        self.fork({"a": "\0base", "a.other": "kept\n"}, {"a": "\0ours"}, {"a": "\0theirs"})
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, text=True)
+        self.assertEqual(out.returncode, 1)
+        self.assertIn("CONFLICT (binary): a\n", out.stdout)
+        self.assertEqual((self.read("a"), self.read("a.other"), self.read("a.other.1")), ("\0ours", "kept\n", "\0theirs"))
+        out = subprocess.run(["tinygit", "status"], capture_output=True, text=True)
+        self.assertNotIn("Nothing to commit, working tree clean", out.stdout)
+        os.system("tinygit commit resolved >> /dev/null")
+        repo = repo_find()
+        tree = repo.object_read(repo.resolve_head()).state["headers"]["tree"]
+        self.assertEqual([item[0] for item in repo.object_read(tree).items], ["a", "a.other", "a.other.1"])
+
+    def test_merge_reads_only_changed(self):
+        files = {os.path.join("big", str(i), str(j)): f"{i} {j}\n" for i in range(10) for j in range(10)}
+        files.update({"a": "a\n", "b": "b\n"})
+        self.fork(files, {"a": "ours\n"}, {"b": "theirs\n"})
+        env = dict(os.environ, TINYGIT_TRACE=os.path.join(self.test_dir, "trace.json"))
+        out = subprocess.run(["tinygit", "merge", "other"], capture_output=True, env=env)
+        self.assertEqual(out.returncode, 0)
+        with open("trace.json") as f:
+            counters = json.load(f)["otherData"]["counters"]
+        # three root trees for the merge, two for the checkout, no blobs at all
+        self.assertEqual(counters.get("objects.read.blob", 0), 0)
+        self.assertLessEqual(counters["objects.read.tree"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+from tinygit.state import * 
+
+class TestObjectCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_object_cache_hit(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'aaaaa' > a.txt")
+        out = subprocess.run(["tinygit", "commit", "message"], capture_output=True).stdout.decode()
+        commitsha = out.split()[1]
+        repo = repo_find()
+        first = repo.object_read(commitsha)
+        self.assertIs(repo.object_read(commitsha), first)
+        self.assertEqual((repo.object_cache.hits, repo.object_cache.misses), (1, 1))
+        treesha = first.state["headers"]["tree"]
+        filesha = repo.object_read(treesha).items[0][1]
+        repo.object_read(filesha)
+        repo.object_read(filesha)
+        self.assertEqual((repo.blob_cache.hits, repo.blob_cache.misses), (1, 1))
+
+    def test_object_cache_evicts_lru(self):
+        cache = ObjectCache(10)
+        cache.put("a", "A", 4)
+        cache.put("b", "B", 4)
+        cache.get("a")
+        cache.put("c", "C", 4)
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.size, 8)
+        cache.put("d", "D", 11)
+        self.assertIsNone(cache.get("d"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+from tinygit.state import * 
+
+class TestPackRefs(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_pack_refs_not_a_repo(self):
+        out = subprocess.run(["tinygit", "pack-refs"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_pack_refs_moves_refs(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit tag v1 >> /dev/null")
+        os.system("tinygit pack-refs >> /dev/null")
+        self.assertEqual(os.listdir(os.path.join(".tinygit", "refs", "heads")), [])
+        self.assertEqual(os.listdir(os.path.join(".tinygit", "refs", "tags")), [])
+        with open(os.path.join(".tinygit", "packed-refs")) as f:
+            self.assertEqual(f.read(), 
+                "3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/heads/master\n"
+                "3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/heads/other\n"
+                "3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/tags/v1\n"
+            )
+
+    def test_pack_refs_refs_resolve(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit tag v1 >> /dev/null")
+        os.system("tinygit pack-refs >> /dev/null")
+        os.system("tinygit commit second >> /dev/null")
+        out = subprocess.run(["tinygit", "show-ref"], capture_output=True)
+        self.assertEqual(out.stdout, 
+            b"44b9c372364f91cd4d0e7c84fee2d1ff27be295d HEAD\n"
+            b"44b9c372364f91cd4d0e7c84fee2d1ff27be295d refs/heads/master\n"
+            b"3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/heads/other\n"
+            b"3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/tags/v1\n"
+        )
+        out = subprocess.run(["tinygit", "log", "--oneline", "v1"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+
+    def test_pack_refs_delete_packed_branch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch other >> /dev/null")
+        os.system("tinygit pack-refs >> /dev/null")
+        os.system("tinygit branch -d other >> /dev/null")
+        out = subprocess.run(["tinygit", "branch"], capture_output=True)
+        self.assertEqual(out.stdout, b"master\n")
+
+    def test_pack_refs_hierarchical_branch(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch feature/x >> /dev/null")
+        out = subprocess.run(["tinygit", "pack-refs"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(os.listdir(os.path.join(".tinygit", "refs", "heads")), [])
+        with open(os.path.join(".tinygit", "packed-refs")) as f:
+            self.assertEqual(f.read(), 
+                "3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/heads/feature/x\n"
+                "3e1a939bd3fd30ba3d114bedba0fb888183f0b20 refs/heads/master\n"
+            )
+        out = subprocess.run(["tinygit", "branch"], capture_output=True)
+        self.assertEqual(out.stdout, b"feature/x\nmaster\n")
+        out = subprocess.run(["tinygit", "fsck"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+
+    def test_pack_refs_bad_ref(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        with open(os.path.join(".tinygit", "refs", "heads", "broken"), "w") as f:
+            f.write("0" * 40)
+        out = subprocess.run(["tinygit", "pack-refs"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+        self.assertFalse(os.path.exists(os.path.join(".tinygit", "packed-refs")))
+        self.assertTrue(os.path.exists(os.path.join(".tinygit", "refs", "heads", "master")))
+
+if __name__ == '__main__':
+    unittest.main()
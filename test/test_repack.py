@@ -0,0 +1,109 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+import hashlib
+import tracemalloc
+from tinygit.state import * 
+
+class TestRepack(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_repack_not_a_repo(self):
+        out = subprocess.run(["tinygit", "repack"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_repack_removes_loose_objects(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'aaaaa' > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        self.assertEqual(repo_find().loose_object_list(), [])
+        self.assertEqual(len(repo_find().pack_list()), 1)
+
+    def test_repack_objects_readable(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'aaaaa' > a.txt")
+        out = subprocess.run(["tinygit", "commit", "first"], capture_output=True).stdout.decode()
+        commitsha = out.split()[1]
+        os.system("tinygit repack >> /dev/null")
+        repo = repo_find()
+        treesha = repo.object_read(commitsha).state["headers"]["tree"]
+        filesha = repo.object_read(treesha).items[0][1]
+        self.assertEqual(repo.object_read(filesha).serialize(), b'aaaaa\n')
+
+    def test_repack_all_single_pack(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        os.system("echo 'aaaaa' > a.txt")
+        os.system("tinygit commit second >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        self.assertEqual(len(repo_find().pack_list()), 2)
+        os.system("tinygit repack -a >> /dev/null")
+        self.assertEqual(len(repo_find().pack_list()), 1)
+
+    def test_repack_deltas_readable(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("seq 1 5000 > a.txt")
+        os.system("tinygit commit first >> /dev/null")
+        first = repo_find().resolve_head()
+        os.system("echo 'one more line' >> a.txt")
+        os.system("tinygit commit second >> /dev/null")
+        second = repo_find().resolve_head()
+        os.system("tinygit repack >> /dev/null")
+        repo = repo_find()
+        self.assertLess(os.path.getsize(repo.pack_list()[0].packpath), 16000)
+        self.assertEqual(repo.loose_object_list(), [])
+        # both versions of a.txt are rewritten from the pack, one of them from a delta
+        os.system(f"tinygit checkout-commit {first} >> /dev/null")
+        with open("a.txt") as f:
+            self.assertTrue(f.read().endswith("4999\n5000\n"))
+        os.system(f"tinygit checkout-commit {second} >> /dev/null")
+        with open("a.txt") as f:
+            self.assertTrue(f.read().endswith("5000\none more line\n"))
+
+    def test_repack_skips_unrelated_deltas(self):
+        base = os.urandom(1 << 20)
+        other = os.urandom(1 << 20)
+        edited = base[:1000] + b"edit" + base[1000:]
+        # unrelated pairs are rejected without indexing the base or
+        # searching byte by byte
+        self.assertTrue(delta_hopeless(base, other, len(other) // 2))
+        self.assertFalse(delta_hopeless(base, edited, len(edited) // 2))
+        objects = [("3" * 40, b"blob " + edited), ("1" * 40, b"blob " + base), ("2" * 40, b"blob " + other)]
+        plan = {sha: best[0] for sha, _, best in delta_search(iter(objects)) if best}
+        self.assertEqual(plan, {"1" * 40: "3" * 40})
+
+    def test_repack_streams_objects(self):
+        # 200 objects of 64KB, only the delta window is held at once
+        def objects():
+            for i in range(200):
+                data = os.urandom(1 << 16)
+                raw = f"blob {len(data)}\0".encode() + data
+                yield hashlib.sha1(raw).hexdigest(), raw
+        tracemalloc.start()
+        packpath = pack_write(os.path.join(self.test_dir, "pack"), objects())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertLess(peak, 200 * (1 << 16) // 4)
+        self.assertEqual(GitPack(packpath).count, 200)
+
+    def test_repack_abbr_alias(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        out = subprocess.run(["tinygit", "checkout-commit", "3e1a939"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        out = subprocess.run(["tinygit", "log"], capture_output=True)
+        self.assertIn(b"commit 3e1a939bd3fd30ba3d114bedba0fb888183f0b20", out.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
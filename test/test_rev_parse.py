@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+from tinygit.state import * 
+
+class TestRevParse(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_rev_parse_not_a_repo(self):
+        out = subprocess.run(["tinygit", "rev-parse", "HEAD"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_rev_parse_head(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "rev-parse", "HEAD"], capture_output=True)
+        self.assertEqual(out.stdout, b"3e1a939bd3fd30ba3d114bedba0fb888183f0b20\n")
+
+    def test_rev_parse_short_prefix(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "rev-parse", "--short=4", "3e1a9"], capture_output=True)
+        self.assertEqual(out.stdout, b"3e1a\n")
+        out = subprocess.run(["tinygit", "rev-parse", "--short=1", "3e1a9"], capture_output=True)
+        self.assertEqual(out.stdout, b"3e1a\n")
+        out = subprocess.run(["tinygit", "rev-parse", "3e1"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_rev_parse_short_branch_name(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit branch e >> /dev/null")
+        os.system("tinygit checkout-branch e >> /dev/null")
+        # some object shas start with e, but a sha prefix needs 4 digits
+        os.system("for i in $(seq 1 100); do echo $i > $i; done")
+        os.system("tinygit commit second >> /dev/null")
+        repo = repo_find()
+        self.assertTrue(any(sha.startswith("e") for sha in repo.loose_object_list()))
+        out = subprocess.run(["tinygit", "rev-parse", "e"], capture_output=True, text=True)
+        self.assertEqual(out.stdout, repo.resolve_branch("e") + "\n")
+        out = subprocess.run(["tinygit", "log", "e"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+
+    def test_rev_parse_short_before_name(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        out = subprocess.run(["tinygit", "rev-parse", "--short", "HEAD"], capture_output=True)
+        self.assertEqual(out.returncode, 0)
+        self.assertEqual(out.stdout, b"3e1a\n")
+        out = subprocess.run(["tinygit", "rev-parse", "--short=6", "HEAD"], capture_output=True)
+        self.assertEqual(out.stdout, b"3e1a93\n")
+        out = subprocess.run(["tinygit", "rev-parse", "--short=x", "HEAD"], capture_output=True)
+        self.assertEqual(out.returncode, 1)
+
+    def test_rev_parse_abbrev_unique(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("for i in $(seq 1 300); do echo $i > $i; done")
+        os.system("tinygit commit first >> /dev/null")
+        os.system("tinygit repack >> /dev/null")
+        os.system("echo x > x")
+        os.system("tinygit commit second >> /dev/null")
+        repo = repo_find()
+        shas = set(repo.loose_object_list())
+        for pack in repo.pack_list():
+            shas.update(pack.shas())
+        for sha in shas:
+            short = repo.abbrev(sha)
+            self.assertEqual(repo.resolve_obj_abbr(short), [sha])
+            if len(short) > ABBREV_MIN:
+                self.assertGreater(len(repo.resolve_obj_abbr(short[:-1])), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess
+import sys
+import time
+import json
+
+# microseconds a cheap command may take on top of starting python, best of
+# STARTUP_RUNS, well above what it takes (~30ms) so only a regression fails
+# it, even on a loaded machine
+STARTUP_BUDGET_US = 250000
+STARTUP_RUNS = 5
+
+# run tinygit argv in process the way the tinygit script does
+RUN = "import sys; from tinygit.cli import main; sys.argv = ['tinygit'] + sys.argv[1:]; sys.exit(main())"
+
+# run tinygit argv in process, then print the names of every loaded module
+# to stderr, lazily loaded ones included
+LOADED = "import sys, json; from tinygit.cli import run; run(sys.argv[1:]); sys.stdout.flush(); json.dump(sorted(sys.modules), sys.stderr)"
+
+# modules a command loading only what it needs doesn't load
+HEAVY = ["tinygit.merge", "tinygit.commands_merge", "tinygit.commands_diff", "tinygit.commands_maintenance",
+  "concurrent.futures", "multiprocessing", "hashlib", "mmap", "difflib", "socket"]
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        self.env = dict(os.environ, TINYGIT_NO_DAEMON="1")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    # modules loaded by running tinygit argv
+    def loaded(self, *argv):
+        out = subprocess.run([sys.executable, "-c", LOADED, *argv],
+            capture_output=True, text=True, check=True, env=self.env)
+        return set(json.loads(out.stderr))
+
+    # microseconds running argv takes, best of a few runs
+    def best_time(self, argv):
+        best = None
+        for _ in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            subprocess.run(argv, capture_output=True, check=True, env=self.env)
+            elapsed = int((time.perf_counter() - start) * 1e6)
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def test_startup_lazy_imports(self):
+        # log reads the commit-graph, which is mmapped
+        for argv, needed in [(["branch"], []), (["log"], ["mmap"]), (["rev-parse", "HEAD"], [])]:
+            modules = self.loaded(*argv)
+            self.assertIn("tinygit.state", modules)
+            for heavy in HEAVY:
+                if heavy in needed:
+                    self.assertIn(heavy, modules, argv)
+                else:
+                    self.assertNotIn(heavy, modules, argv)
+
+    def test_startup_heavy_command_imports(self):
+        modules = self.loaded("fsck", "--no-progress")
+        self.assertIn("tinygit.commands_maintenance", modules)
+        self.assertIn("concurrent.futures", modules)
+        self.assertNotIn("tinygit.merge", modules)
+
+    def test_startup_budget(self):
+        python = self.best_time([sys.executable, "-c", "pass"])
+        command = self.best_time([sys.executable, "-c", RUN, "branch"])
+        self.assertLess(command - python, STARTUP_BUDGET_US)
+
+if __name__ == '__main__':
+    unittest.main()
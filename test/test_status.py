@@ -3,6 +3,8 @@ import tempfile
 import shutil
 import os
 import subprocess
+from tinygit.state import *
+from tinygit.utils import *
 
 class TestStatus(unittest.TestCase):
     def setUp(self):
@@ -52,5 +54,52 @@ class TestStatus(unittest.TestCase):
         out = subprocess.run(["tinygit", "status"], capture_output=True)
         self.assertIn(b"Deleted (\'file\', \'foo\')", out.stdout)
 
+    def test_status_writes_index(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'foo foo foo' > foo")
+        os.system("tinygit commit 'created foo' >> /dev/null")
+        subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertTrue(os.path.isfile(os.path.join(".tinygit", "index")))
+
+    def test_status_modified_same_size_after_cached(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("echo 'a a a' > a")
+        os.system("tinygit commit 'created a' >> /dev/null")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Nothing to commit", out.stdout)
+        os.system("echo 'b b b' > a")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Modified (\'file\', \'a\')", out.stdout)
+
+    def test_status_renamed(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && echo 'foo foo foo' > d/foo")
+        os.system("tinygit commit 'created foo' >> /dev/null")
+        os.system("mv d e")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Renamed ('file', 'd/foo') -> ('file', 'e/foo')", out.stdout)
+        self.assertNotIn(b"Deleted ('file', 'd/foo')", out.stdout)
+
+    def test_status_old_format_tree_clean(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("mkdir d && echo 'foo foo foo' > d/foo && echo 'a a a' > a")
+        repo = repo_find()
+        # trees as written before typed entries, [name, sha] items
+        d, root = GitTree(), GitTree()
+        d.items = [["foo", repo.object_write(GitBlob(b"foo foo foo\n"))]]
+        root.items = [["a", repo.object_write(GitBlob(b"a a a\n"))], ["d", repo.object_write(d)]]
+        commit = GitCommit()
+        commit.state["headers"] = {"tree": repo.object_write(root)}
+        commit.state["body"] = "old format"
+        write_file(repo.tinygitdir, "refs", "heads", "master", data=repo.object_write(commit))
+        # those trees don't record modes, an executable file isn't a change
+        os.system("chmod +x a")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Nothing to commit", out.stdout)
+        self.assertNotIn(b"Modified", out.stdout)
+        os.system("echo 'b b b' > d/foo")
+        out = subprocess.run(["tinygit", "status"], capture_output=True)
+        self.assertIn(b"Modified ('dir', 'd')\nModified ('file', 'd/foo')", out.stdout)
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import tempfile
+import shutil
+import os
+import json
+import subprocess
+from tinygit.state import * 
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_trace_summary(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'aaa' > a")
+        out = subprocess.run(["tinygit", "--trace", "commit", "first"], capture_output=True, text=True)
+        self.assertRegex(out.stdout, "^commit [0-9a-f]{40} saved\n$")
+        phases = {line.split()[0] for line in out.stderr.splitlines() if line}
+        for name in ["repo_find", "workdir_walk", "blob_write_file", "object_write", "objects.written.tree", 
+                     "objects.written.blob", "objects.written.commit", "bytes.written.compressed", "fs.scandir"]:
+            self.assertIn(name, phases)
+
+    def test_trace_env_file(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("printf 'aaa' > a")
+        os.system("tinygit commit first >> /dev/null")
+        env = dict(os.environ, TINYGIT_TRACE=os.path.join(self.test_dir, "trace.json"))
+        out = subprocess.run(["tinygit", "checkout-commit", "HEAD"], capture_output=True, env=env)
+        self.assertEqual(out.stderr, b"")
+        with open("trace.json") as f:
+            trace = json.load(f)
+        names = {event["name"] for event in trace["traceEvents"]}
+        self.assertIn("command checkout-commit", names)
+        self.assertIn("checkout_tree", names)
+        for event in trace["traceEvents"]:
+            self.assertEqual(event["ph"], "X")
+        counters = trace["otherData"]["counters"]
+        self.assertEqual(counters["objects.read.commit"], 1)
+        self.assertEqual(counters["cache.hits"] + counters["cache.misses"], trace["otherData"]["phases"]["object_read"]["calls"])
+
+    def test_trace_file_flag(self):
+        os.system("tinygit init >> /dev/null")
+        os.system("tinygit commit first >> /dev/null")
+        traced = subprocess.run(["tinygit", "--trace-file", "trace.json", "log"], capture_output=True)
+        plain = subprocess.run(["tinygit", "log"], capture_output=True)
+        self.assertEqual(traced.stdout, plain.stdout)
+        self.assertTrue(os.path.isfile("trace.json"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,76 +1,178 @@
 import sys
+import os
 import argparse
-
-from tinygit.commands import *
-
-
-parser = argparse.ArgumentParser()
-subs = parser.add_subparsers(title="commands", dest="command", required=True)
-
-sp = subs.add_parser("init", help="Initialize a new, empty repository.")
-sp.add_argument("location", metavar="location", nargs="?", default=".", help="Where to create the tinygit repository.")
-
-sp = subs.add_parser("status", help="Display status")
-
-sp = subs.add_parser("commit", help="Commit the working tree.")
-sp.add_argument("message", help="Commit message.")
-
-sp = subs.add_parser("checkout-commit", help="Checkout a commit using the working dir.")
-sp.add_argument("commit", help="The commit to checkout.")
-
-sp = subs.add_parser("checkout-branch", help="Checkout a branch using the working dir.")
-sp.add_argument("branch", help="The branch to checkout.")
-
-sp = subs.add_parser("branch", help="Make or list branches.")
-sp.add_argument("branchname", nargs="?", default="", help="The new branch's name.")
-sp.add_argument("-d", dest="branchtodelete")
-
-sp = subs.add_parser("merge", help="Merge branches")
-sp.add_argument("branchname", help="name of the branch to merge into this one.")
-
-sp = subs.add_parser("log", help="Display history of a given commit.")
-sp.add_argument("commit", nargs="?", default="HEAD", help="Commit to start at, defaults to HEAD.")
-
-sp = subs.add_parser("tag", help="List and create tags")
-sp.add_argument("name", help="The new tag's name.")
-sp.add_argument("object", nargs="?", default="HEAD", help="The object the new tag will point to.")
-
-sp = subs.add_parser("hash-object", help="Compute object ID and optionally creates a blob from a file")
-sp.add_argument("-t", metavar="type", dest="type", choices=["blob", "commit", "tag", "tree"], default="blob", help="Specify the type")
-sp.add_argument("-w", dest="write", action="store_true", help="Actually write the object into the database")
-sp.add_argument("file", help="Read object from <file>")
-
-sp = subs.add_parser("cat-file", help="Provide content of repository objects")
-sp.add_argument("object", metavar="object", help="The object to display")
-
-sp = subs.add_parser("show-ref", help="List references.")
-
-sp = subs.add_parser("rev-parse", help="Parse revision (or other objects )identifiers")
-sp.add_argument("--wyag-type", metavar="type", dest="type", choices=["blob", "commit", "tag", "tree"], default=None, help="Specify the expected type")
-sp.add_argument("name", help="The name to parse")
-
-sp = subs.add_parser("ls-tree", help="Pretty-print a tree object.")
-sp.add_argument("object", help="The object to show.")
+import importlib
+
+from tinygit.daemon import *
+from tinygit.trace import *
+
+
+# arguments of each command, only the dispatched command's are added
+
+def args_init(sp):
+  sp.add_argument("location", metavar="location", nargs="?", default=".", help="Where to create the tinygit repository.")
+
+def args_commit(sp):
+  sp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of threads hashing and compressing files, defaults to the number of cores.")
+  sp.add_argument("message", help="Commit message.")
+
+def args_checkout_commit(sp):
+  sp.add_argument("commit", help="The commit to checkout.")
+  sp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of threads writing files, defaults to the number of cores.")
+
+def args_checkout_branch(sp):
+  sp.add_argument("branch", help="The branch to checkout.")
+  sp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of threads writing files, defaults to the number of cores.")
+
+def args_branch(sp):
+  sp.add_argument("branchname", nargs="?", default="", help="The new branch's name.")
+  sp.add_argument("-d", dest="branchtodelete")
+
+def args_merge(sp):
+  sp.add_argument("branchname", help="name of the branch to merge into this one.")
+  sp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of threads writing files, defaults to the number of cores.")
+
+def args_log(sp):
+  sp.add_argument("commit", nargs="?", default="HEAD", help="Commit to start at, defaults to HEAD.")
+  sp.add_argument("-n", "--max-count", type=int, default=None, help="Show at most this many commits.")
+  sp.add_argument("--skip", type=int, default=0, help="Skip this many commits before showing any.")
+  group = sp.add_mutually_exclusive_group()
+  group.add_argument("--oneline", action="store_true", help="Show abbreviated sha and first line of the message.")
+  group.add_argument("--machine", action="store_true", help="Show one json object per commit and line.")
+
+def args_tag(sp):
+  sp.add_argument("name", help="The new tag's name.")
+  sp.add_argument("object", nargs="?", default="HEAD", help="The object the new tag will point to.")
+
+def args_hash_object(sp):
+  sp.add_argument("-t", metavar="type", dest="type", choices=["blob", "commit", "tag", "tree"], default="blob", help="Specify the type")
+  sp.add_argument("-w", dest="write", action="store_true", help="Actually write the object into the database")
+  sp.add_argument("file", help="Read object from <file>")
+
+def args_cat_file(sp):
+  group = sp.add_mutually_exclusive_group()
+  group.add_argument("-t", dest="kind", action="store_true", help="Show the object's type")
+  group.add_argument("-s", dest="size", action="store_true", help="Show the object's size")
+  group.add_argument("--batch", action="store_true", help="Show kind, size and contents of objects named on stdin")
+  group.add_argument("--batch-check", action="store_true", help="Show kind and size of objects named on stdin")
+  sp.add_argument("object", metavar="object", nargs="?", default=None, help="The object to display")
+
+def args_repack(sp):
+  sp.add_argument("-a", dest="all", action="store_true", help="Also fold existing packs into the new one.")
+
+def args_gc(sp):
+  sp.add_argument("--grace", type=int, default=None, metavar="seconds", help="Keep unreachable objects younger than this, defaults to two weeks.")
+  sp.add_argument("--full", action="store_true", help="Fold every pack into one, dropping unreachable packed objects.")
+  sp.add_argument("--auto", action="store_true", help="Only run if there are many loose objects or packs.")
+
+def args_fsck(sp):
+  sp.add_argument("--connectivity-only", action="store_true", help="Only check links between objects, don't read blobs.")
+  sp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of processes checking objects, defaults to the number of cores.")
+  group = sp.add_mutually_exclusive_group()
+  group.add_argument("--progress", action="store_true", default=None, help="Show progress on stderr.")
+  group.add_argument("--no-progress", dest="progress", action="store_false", help="Don't show progress.")
+
+def args_rev_parse(sp):
+  sp.add_argument("--wyag-type", metavar="type", dest="type", choices=["blob", "commit", "tag", "tree"], default=None, help="Specify the expected type")
+  # --short may take the name as its value, see cmd_rev_parse
+  sp.add_argument("--short", nargs="?", const="4", default=None, metavar="length", help="Print the shortest unique abbreviation, at least length long")
+  sp.add_argument("name", nargs="?", default=None, help="The name to parse")
+
+def args_daemon(sp):
+  sp.add_argument("--stop", action="store_true", help="Stop the daemon of this repository.")
+  sp.add_argument("-v", "--verbose", action="store_true", help="Print every command served.")
+
+def args_diff(sp):
+  sp.add_argument("-U", "--unified", type=int, default=3, metavar="lines", help="Lines of context around changes, defaults to 3.")
+  renames = sp.add_mutually_exclusive_group()
+  renames.add_argument("-M", "--find-renames", type=int, nargs="?", const=50, default=50, metavar="percent", help="Detect renames at least this similar, defaults to 50.")
+  renames.add_argument("--no-renames", dest="find_renames", action="store_const", const=None, help="Don't detect renames.")
+  sp.add_argument("-C", "--find-copies", action="store_true", help="Also detect copies of modified and deleted files.")
+  sp.add_argument("-l", "--rename-limit", type=int, default=1000, metavar="count", help="Only detect identical renames past count * count candidate pairs, defaults to 1000.")
+  group = sp.add_mutually_exclusive_group()
+  group.add_argument("--name-status", action="store_true", help="Show the status and path of changed files.")
+  group.add_argument("--stat", action="store_true", help="Show the number of changed lines per file.")
+  sp.add_argument("old", nargs="?", default="HEAD", help="Commit to compare from, defaults to HEAD.")
+  sp.add_argument("new", nargs="?", default=None, help="Commit to compare to, defaults to the workdir.")
+
+def args_ls_tree(sp):
+  sp.add_argument("object", help="The object to show.")
+
+def args_none(sp):
+  pass
+
+
+# command -> (help, function adding its arguments, "module:function" running it)
+# the module is imported only when the command is dispatched
+COMMANDS = {
+  "init"            : ("Initialize a new, empty repository.", args_init, "tinygit.commands:cmd_init"),
+  "status"          : ("Display status", args_none, "tinygit.commands:cmd_status"),
+  "commit"          : ("Commit the working tree.", args_commit, "tinygit.commands:cmd_commit"),
+  "checkout-commit" : ("Checkout a commit using the working dir.", args_checkout_commit, "tinygit.commands:cmd_checkout_commit"),
+  "checkout-branch" : ("Checkout a branch using the working dir.", args_checkout_branch, "tinygit.commands:cmd_checkout_branch"),
+  "branch"          : ("Make or list branches.", args_branch, "tinygit.commands:cmd_branch"),
+  "merge"           : ("Merge branches", args_merge, "tinygit.commands_merge:cmd_merge"),
+  "diff"            : ("Show changes between commits or a commit and the working dir.", args_diff, "tinygit.commands_diff:cmd_diff"),
+  "log"             : ("Display history of a given commit.", args_log, "tinygit.commands:cmd_log"),
+  "tag"             : ("List and create tags", args_tag, "tinygit.commands:cmd_tag"),
+  "hash-object"     : ("Compute object ID and optionally creates a blob from a file", args_hash_object, "tinygit.commands:cmd_hash_object"),
+  "cat-file"        : ("Provide content of repository objects", args_cat_file, "tinygit.commands:cmd_cat_file"),
+  "pack-refs"       : ("Pack branches and tags into one file.", args_none, "tinygit.commands:cmd_pack_refs"),
+  "repack"          : ("Pack loose objects.", args_repack, "tinygit.commands_maintenance:cmd_repack"),
+  "fsck"            : ("Verify the object db.", args_fsck, "tinygit.commands_maintenance:cmd_fsck"),
+  "gc"              : ("Prune unreachable objects and pack the rest.", args_gc, "tinygit.commands_maintenance:cmd_gc"),
+  "show-ref"        : ("List references.", args_none, "tinygit.commands:cmd_show_ref"),
+  "rev-parse"       : ("Parse revision (or other objects )identifiers", args_rev_parse, "tinygit.commands:cmd_rev_parse"),
+  "daemon"          : ("Serve commands from a long running process.", args_daemon, "tinygit.commands:cmd_daemon"),
+  "ls-tree"         : ("Pretty-print a tree object.", args_ls_tree, "tinygit.commands:cmd_ls_tree"),
+}
+
+# parser for argv, only the subparser of the command named in argv gets its
+# arguments, all of them do if there is none (e.g. for tinygit -h)
+def make_parser(argv):
+  command = None
+  for i, arg in enumerate(argv):
+    if not arg.startswith("-") and (i == 0 or argv[i - 1] != "--trace-file"):
+      command = arg if arg in COMMANDS else None
+      break
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--trace", action="store_true", help="Print where the command spends its time to stderr.")
+  parser.add_argument("--trace-file", metavar="path", default=None, help="Write a chrome trace-event file of the command to path.")
+  subs = parser.add_subparsers(title="commands", dest="command", required=True)
+  for name, (help, add_args, _) in COMMANDS.items():
+    sp = subs.add_parser(name, help=help)
+    if command is None or command == name:
+      add_args(sp)
+  return parser
 
 # main entry point for CLI application
+# commands go through the daemon of the repo if one is running, except the
+# ones reading stdin, which isn't forwarded, and traced ones, which are 
+# traced in process
 def main():
-  args = parser.parse_args(sys.argv[1:])  
-  if   args.command == "add"              : cmd_add(args)
-  elif args.command == "branch"           : cmd_branch(args)
-  elif args.command == "cat-file"         : cmd_cat_file(args)
-  elif args.command == "checkout-commit"  : cmd_checkout_commit(args)
-  elif args.command == "checkout-branch"  : cmd_checkout_branch(args)
-  elif args.command == "commit"           : cmd_commit(args)
-  elif args.command == "hash-object"      : cmd_hash_object(args)
-  elif args.command == "init"             : cmd_init(args)
-  elif args.command == "log"              : cmd_log(args)
-  elif args.command == "ls-tree"          : cmd_ls_tree(args)
-  elif args.command == "merge"            : cmd_merge(args)
-  elif args.command == "rev-parse"        : cmd_rev_parse(args)
-  elif args.command == "rm"               : cmd_rm(args)
-  elif args.command == "show-ref"         : cmd_show_ref(args)
-  elif args.command == "status"           : cmd_status(args)
-  elif args.command == "tag"              : cmd_tag(args)
+  args = make_parser(sys.argv[1:]).parse_args(sys.argv[1:])
+  trace = args.trace_file or ("1" if args.trace else os.environ.get(TRACE_ENV))
+  if args.command not in ("daemon", "init") and not getattr(args, "batch", False) \
+      and not getattr(args, "batch_check", False) and not trace:
+    code = daemon_forward(sys.argv[1:])
+    if code is not None:
+      return code
+  if not trace:
+    dispatch(args)
+    return
+  trace_start(trace)
+  try:
+    traced("command " + args.command)(dispatch)(args)
+  finally:
+    trace_stop()
+
+# run a command in process
+def run(argv):
+  dispatch(make_parser(argv).parse_args(argv))
+
+def dispatch(args):
+  module, function = COMMANDS[args.command][2].split(":")
+  getattr(importlib.import_module(module), function)(args)
 
 if __name__ == '__main__':
   sys.exit(main())
@@ -1,13 +1,21 @@
 import sys
 import os
-import configparser
-import shutil
+import stat
 import re
-from collections import defaultdict
-from collections import Counter
+import collections
+import itertools
+import json
+
+# commands needing heavy modules (diff, merge, repack, gc and fsck) live in
+# commands_*.py, and shutil and concurrent.futures are only imported by the
+# functions using them, so cheap commands start fast
 
 from tinygit.utils import *
 from tinygit.state import *
+from tinygit.index import *
+from tinygit.diff import *
+from tinygit.daemon import *
+from tinygit.trace import *
 
 
 def cmd_init(args):
@@ -43,76 +51,86 @@ def cmd_init(args):
 
 
 def cmd_commit(args):
-  """tinygit commit <message>         
+  """tinygit commit [-j <jobs>] <message>
   
   Add a snapshot of work to the repository.
 
   Fails if not called currently in a tinygit repository. 
-  Compresses workdir into commit and store it.
+  Fails if jobs is less than 1.
+  Compresses workdir into commit and store it, hashing and compressing
+  files on jobs threads.
   If on branch, advances branch head.
   If not on branch, detaches HEAD.
+  After a merge with conflicts, the commit concludes the merge and gets 
+  the merged branch as second parent.
   """
   repo = repo_find()
+  check_jobs(args.jobs)
+  index = repo.index()
+  tree_sha, _ = workdir_walk(repo, index, write=True, jobs=args.jobs)
+  index.save()
+
+  # a merge with conflicts left its other parent in MERGE_HEAD
+  parents = [repo.resolve_head()] if repo.resolve_head() else []
+  merge_head = read_file(repo.tinygitdir, "MERGE_HEAD")
+  if merge_head:
+    parents.append(merge_head.strip())
+  commitsha = commit_create(repo, tree_sha, args.message, parents)
+  if merge_head:
+    os.remove(os.path.join(repo.tinygitdir, "MERGE_HEAD"))
+
+  print(f"commit {commitsha} saved")
+
 
-  # list dirs in BFS discovery order, avoiding .tinygit etc.
-  dirs = []
-  for dirpath, dirnames, filenames in os.walk(repo.workdir):
-    dirs.append(dirpath)
-    if ".tinygit" in dirnames: 
-      dirnames.remove(".tinygit")
-
-  # store blob and tree objects
-  dirs.reverse()
-  treehashes = {}
-  tree = None
-  for dirpath in dirs:
-    tree = GitTree()
-    for child in os.scandir(dirpath):
-      if child.is_dir() and child.name != ".tinygit":
-        tree.items.append((child.name, treehashes[child.path]))
-      elif child.is_file():
-        with open(child.path, "rb") as f:
-          sha = repo.object_write(GitBlob(f.read()))
-          tree.items.append((child.name, sha))
-    treehashes[dirpath] = repo.object_write(tree)
-
-  # Build and write commit object
+# write a commit and move the branch HEAD is on, or HEAD if detached, to it
+# a single parent is stored as a string, several as a list
+def commit_create(repo, tree_sha, message, parents):
   commit = GitCommit()
-  commit.state["headers"]["tree"] = object_hash(tree)
-  commit.state["body"] = args.message
-  head = repo.get_head()
-  if head["type"] == "branch":
-    if file_exists(repo.tinygitdir, "refs", "heads", head["id"]):
-      commit.state["headers"]["parent"] = read_file(repo.tinygitdir, "refs", "heads", head["id"])
-  else:
-    commit.state["headers"]["parent"] = head["id"]
+  commit.state["headers"]["tree"] = tree_sha
+  commit.state["body"] = message
+  if len(parents) == 1:
+    commit.state["headers"]["parent"] = parents[0]
+  elif parents:
+    commit.state["headers"]["parent"] = parents
   commitsha = repo.object_write(commit)
+  repo.commit_graph_update([commitsha])
+  head_move(repo, commitsha)
+  return commitsha
 
-  # Update Head and or Branch
+
+# point the branch HEAD is on, or HEAD if detached, at commit sha
+def head_move(repo, sha):
+  head = repo.get_head()
   if head["type"] == "branch":
-    write_file(repo.tinygitdir, "refs", "heads", head["id"], data=commitsha)
+    repo.ref_write("refs/heads/" + head["id"], sha)
   else:
-    repo.set_head(type="commit", id=commitsha)
-
-  print(f"commit {commitsha} saved")
+    repo.set_head(type="commit", id=sha)
 
 
 def cmd_log(args):
-  """tinygit log [<commit-alias>]    
+  """tinygit log [-n <count>] [--skip <count>] [--oneline | --machine] [<commit-alias>]
   
   Show commit history.
 
-  Starts from commit-alias and works backwards.
+  Starts from commit-alias and works backwards, newest commits first.
   If no commit-alias provided, logs from HEAD backwards.
+  Stops after count commits if -n is given, skips the first count commits if --skip is given.
   Fails if not called currently in a tinygit repository.
   Fails if commit-alias doesn't refer to a commit.
   Fails if commit-alias is ambiguous.
   Fails if the chosen branch has no commit history.
+  Fails if a count is negative.
   For each commit prints
     1. sha hash
     2. contents
+  With --oneline prints the abbreviated sha hash and first line of the message.
+  With --machine prints one json object per line with sha, tree, parents and message.
+  Commits are read lazily, so the cost only depends on the number printed.
+  There is no --since, commits carry no dates.
   """
   repo = repo_find()
+  if args.max_count is not None and args.max_count < 0 or args.skip < 0:
+    raise Exception("Counts must not be negative")
   commit_shas = repo.resolve_commit_alias(args.commit)
 
   if not commit_shas:
@@ -121,12 +139,34 @@ def cmd_log(args):
   if len(commit_shas) > 1:
     raise Exception(f"'{args.commit}' is an ambigious alias")
 
-  commit = repo.object_read(commit_shas[0])
-  while commit:
-    print(f"{bcolors.HEADER}commit {object_hash(commit)}{bcolors.ENDC}")
-    print(commit.serialize().decode())
-    print()
-    commit = repo.object_read(commit.state["headers"]["parent"]) if "parent" in commit.state["headers"] else None
+  shas = itertools.islice(repo.commit_walk(commit_shas[0]), args.skip, 
+    None if args.max_count is None else args.skip + args.max_count)
+  out = sys.stdout
+  try:
+    for sha in shas:
+      commit = repo.object_read(sha)
+      if args.oneline:
+        title = commit.state["body"].split("\n")[0]
+        out.write(f"{bcolors.HEADER}{sha[:7]}{bcolors.ENDC} {title}\n")
+      elif args.machine:
+        out.write(json.dumps({
+          "sha": sha, 
+          "tree": commit.state["headers"]["tree"], 
+          "parents": commit.parents(), 
+          "body": commit.state["body"]
+        }) + "\n")
+      else:
+        out.write(f"{bcolors.HEADER}commit {sha}{bcolors.ENDC}\n{commit.serialize().decode()}\n\n")
+    out.flush()
+  except BrokenPipeError:
+    # reader went away (e.g. log | head), stop quietly
+    # served by the daemon, stdout has no fd and the daemon drops the rest
+    try:
+      fd = out.fileno()
+    except OSError:
+      return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, fd)
 
 
 # print status, based on HEAD
@@ -138,6 +178,8 @@ def cmd_status(args):
   Fails if not called currently in a tinygit repository.
   Prints HEAD
   Print modified, added, deleted files (compared to last commit).
+  Only subtrees whose shas differ from the last commit's are compared.
+  Added files identical or similar to deleted ones print as renamed.
   """
   repo = repo_find()
   print("HEAD")
@@ -147,27 +189,34 @@ def cmd_status(args):
   if not commit_shas:
     print("No commits yet")
   else:
-    work_entry_map = workdir_entries()
+    index = repo.index()
+    work_tree_sha, trees = workdir_walk(repo, index)
+    index.save()
     tree_sha = repo.object_read(commit_shas[0]).state["headers"]["tree"]
-    commit_entry_map = tree_entries(tree_sha)
-    commit_entry_keys, work_entry_keys = set(commit_entry_map.keys()), set(work_entry_map.keys())
-
-    if commit_entry_map == work_entry_map:
+    changes = [Change("M" if old and new else "A" if new else "D", path, old, new)
+      for path, old, new in tree_diff(repo, tree_sha, work_tree_sha, trees=trees, expand=True, dirs=True)]
+    # renamed files, dirs stay added and deleted
+    files = detect_renames(repo, [c for c in changes if (c.old or c.new).kind == "blob"], workdir=True)
+    changes = sorted([c for c in changes if (c.old or c.new).kind == "tree"] + files, key=lambda c: c.path)
+    if not changes:
       print("Nothing to commit, working tree clean")
-    else:
-      for e in work_entry_keys.intersection(commit_entry_keys):
-        if work_entry_map[e] != commit_entry_map[e]:
-          print(f"Modified {e}")
-      for e in work_entry_keys - commit_entry_keys:
-        print(f"Added {e}")
-      for e in commit_entry_keys - work_entry_keys:
-        print(f"Deleted {e}")
-
-
-def workdir_entries():
-  # return map (type, path) -> sha
-  # needs to be map to generate created, deleted, modified information
-  repo = repo_find()
+    names = {"M": "Modified", "A": "Added", "D": "Deleted"}
+    for status, path, old, new, source in changes:
+      e = ("dir" if (old or new).kind == "tree" else "file", path)
+      if source:
+        print(f"Renamed {('file', source)} -> {e}")
+      else:
+        print(f"{names[status]} {e}")
+
+
+@traced("workdir_walk")
+def workdir_walk(repo, index, write=False, jobs=1):
+  # hash the workdir bottom up, return (root tree sha, map sha -> entries of
+  # its trees), the map lets tree_diff read trees that weren't written
+  # files and dirs whose index entries are still valid are not re-hashed
+  # if write, also store blob and tree objects that aren't in the db yet
+  # with jobs > 1, files are hashed and compressed on a thread pool (hashlib
+  # and zlib release the GIL) while trees are still built here in order
   # list dir paths in reversed BFS discovery order, avoiding .tinygit etc.
   dir_paths = []
   for dir_path, dir_names, _ in os.walk(repo.workdir):
@@ -175,75 +224,93 @@ def workdir_entries():
     if ".tinygit" in dir_names: 
       dir_names.remove(".tinygit")
   dir_paths.reverse()
-  # calculate blob and trees
-  entry_map = {}
-  tree, tree_shas = None, {}
-  for dir_path in dir_paths:
-    tree = GitTree()
-    for entry in os.scandir(dir_path):
-      if entry.is_dir() and entry.name != ".tinygit":
-        tree.items.append((entry.name, tree_shas[entry.path]))
-        entry_map[("dir", os.path.relpath(entry.path, repo.workdir))] = tree_shas[entry.path]
-      elif entry.is_file():
-        with open(entry.path, "rb") as f:
-          file_sha = object_hash(GitBlob(f.read()))
-        tree.items.append((entry.name, file_sha))
-        entry_map[("file", os.path.relpath(entry.path, repo.workdir))] = file_sha
-    tree_shas[dir_path] = object_hash(tree)
-  return entry_map
-
-
-def tree_entries(tree_sha):
-  # return map (type, path) -> sha
-  # needs to be map to generate created, deleted, modified information
-  repo = repo_find()
-  entry_map = {}
-  tree = repo.object_read(tree_sha)
-  S = [(repo.workdir, tree_sha)]
-  while S:
-    tree_path, tree_sha = S.pop()
-    tree = repo.object_read(tree_sha)
-    for name, obj_sha in tree.items:
-      obj = repo.object_read(obj_sha)
-      if obj.kind == "tree":
-        entry_map[("dir", os.path.relpath(os.path.join(tree_path, name), repo.workdir))] = obj_sha
-        S.append((os.path.join(tree_path, name), obj_sha))
-      elif obj.kind == "blob":
-        entry_map[("file", os.path.relpath(os.path.join(tree_path, name), repo.workdir))] = obj_sha
-  return entry_map
+  repo.pack_list()
+  pool = None
+  if jobs > 1:
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=jobs)
+  futures = []
+  try:
+    # list every dir, starting on files the index can't vouch for
+    # children are (name, path, rel_path, stat, sha or future, hashed), stat is None for dirs
+    listings = {}
+    for dir_path in dir_paths:
+      children = []
+      # sorted, so equal dirs always hash to equal trees
+      for entry in sorted(os.scandir(dir_path), key=lambda e: e.name):
+        rel_path = os.path.relpath(entry.path, repo.workdir)
+        if entry.is_dir() and entry.name != ".tinygit":
+          children.append((entry.name, entry.path, rel_path, None, None, False))
+        elif entry.is_file():
+          st = entry.stat()
+          file_sha = index.lookup_file(rel_path, st)
+          if file_sha is None or (write and not repo.object_exists(file_sha)):
+            if pool:
+              file_sha = pool.submit(repo.blob_write_file, entry.path, write)
+              futures.append(file_sha)
+            else:
+              file_sha = repo.blob_write_file(entry.path, write)
+            children.append((entry.name, entry.path, rel_path, st, file_sha, True))
+            continue
+          children.append((entry.name, entry.path, rel_path, st, file_sha, False))
+      listings[dir_path] = children
+    # calculate trees, children first
+    trees = {}
+    tree_sha, tree_shas = None, {}
+    for dir_path in dir_paths:
+      tree = GitTree()
+      for name, path, rel_path, st, file_sha, hashed in listings[dir_path]:
+        if st is None:
+          tree.items.append([name, tree_shas[path], "tree", False, None])
+        else:
+          if hashed and pool:
+            file_sha = file_sha.result()
+          if hashed:
+            index.update_file(rel_path, st, file_sha)
+          tree.items.append([name, file_sha, "blob", bool(st.st_mode & stat.S_IXUSR), st.st_size])
+      rel_path = os.path.relpath(dir_path, repo.workdir)
+      tree_sha = index.lookup_tree(rel_path, tree.items)
+      if tree_sha is None or (write and not repo.object_exists(tree_sha)):
+        tree_sha = repo.object_write(tree) if write else object_hash(tree)
+        index.update_tree(rel_path, tree.items, tree_sha)
+      tree_shas[dir_path] = tree_sha
+      trees[tree_sha] = [TreeEntry(*item) for item in tree.items]
+  finally:
+    if pool:
+      pool_close(pool, futures)
+  return tree_sha, trees
 
 
 def cmd_checkout_commit(args):
-  """tinygit checkout-commit <commitalias>
+  """tinygit checkout-commit [-j <jobs>] <commitalias>
   
   Checkout a commit.
 
-  Overwrites the the workdir completely, replacing with the contents of the snapshot.
+  Updates the workdir to the contents of the snapshot, only touching the
+  paths that differ between the snapshot and HEAD. Files are written by
+  jobs threads.
   Fails if not called currently in a tinygit repository.
+  Fails if jobs is less than 1.
   Fails if commitalias doesn't resolve to a commit.
   Updates HEAD to commitalias.
   """
   repo = repo_find()
+  check_jobs(args.jobs)
   commit_shas = repo.resolve_commit_alias(args.commit)
   if not commit_shas:
     raise Exception(f"'{args.commit}' did not match any commits known to tinygit")
   if len(commit_shas) > 1:
     raise Exception(f"'{args.commit}' is ambiguous")
 
+  commit = repo.object_read(commit_shas[0])
+  old_tree_sha = head_tree_sha(repo)
+
   # Update HEAD
   repo.set_head(type="commit", id=commit_shas[0])
   print(f"Entering 'detached HEAD' state at {commit_shas[0]}")
 
   # Update Working Directory
-  commit = repo.object_read(commit_shas[0])
-  for entry in scan_dir(repo.workdir):
-    if entry.name == ".tinygit":
-      pass
-    elif entry.is_dir():
-      shutil.rmtree(entry.path)
-    elif entry.is_file():
-      os.remove(entry.path)
-  unpack_tree(repo.object_read(commit.state["headers"]["tree"]), repo.workdir, repo)
+  checkout_tree(repo, old_tree_sha, commit.state["headers"]["tree"], jobs=args.jobs)
 
 
 def cmd_tag(args):
@@ -253,7 +320,7 @@ def cmd_tag(args):
   if not is_valid_tag_name(name):
     raise Exception("{name} is not a valid tag name ([-a-zA-Z0-9]+)")
 
-  if file_exists(repo.tinygitdir, "refs", "tags", name):
+  if repo.resolve_tag(name):
     raise Exception("{name} already exists") 
   
   object_shas = repo.object_resolve(args.object)
@@ -263,7 +330,7 @@ def cmd_tag(args):
   if len(object_shas) > 1:
     raise Exception(f"'{args.object}' is ambiguous")
   
-  write_file(repo.tinygitdir, "refs", "tags", name, data=object_shas[0])
+  repo.ref_write("refs/tags/" + name, object_shas[0])
 
 
 def is_valid_tag_name(name):
@@ -277,14 +344,14 @@ def cmd_branch(args):
   """
   repo = repo_find()
   if args.branchtodelete != None:       # delete branch
-    if args.branchtodelete not in {entry.name for entry in scan_dir(repo.tinygitdir, "refs", "heads")}:
+    if not repo.resolve_branch(args.branchtodelete):
       print(f"Branch '{args.branchtodelete}' not found")
       return
-    os.remove(os.path.join(repo.tinygitdir, "refs", "heads", args.branchtodelete))
+    repo.ref_delete("refs/heads/" + args.branchtodelete)
 
   elif args.branchname != "":           # create branch
 
-    if args.branchname in {entry.name for entry in scan_dir(repo.tinygitdir, "refs", "heads")}:
+    if repo.resolve_branch(args.branchname):
       print(f"A branch named '{args.branchname}' already exists")
       return
 
@@ -292,122 +359,159 @@ def cmd_branch(args):
     if curcommit == None:
       print("Cannot make new branch pointing to no commit")
     else:
-      write_file(repo.tinygitdir, "refs", "heads", args.branchname, data=curcommit)
+      repo.ref_write("refs/heads/" + args.branchname, curcommit)
 
   else:                                 # list branches 
-    for entry in scan_dir(repo.tinygitdir, "refs", "heads"):
-      print(entry.name)
-
-
-def files_dirs_to_create(commit, repo):
-  # files to create (path, filesha, fileobj, commitsha)
-  # dirs to create (path)
-  files_to_create = []
-  dirs_to_create = []
-  commitsha = object_hash(commit)[:6]
-  trees = [(repo.workdir, commit.state["headers"]["tree"])]
-  while trees:
-    path, treesha = trees.pop()
-    tree = repo.object_read(treesha)
-    for name, objsha in tree.items:
-      obj = repo.object_read(objsha)
-      if obj.kind == "blob":
-        files_to_create.append((os.path.join(path, name), objsha, obj, commitsha))
-      if obj.kind == "tree":
-        dirs_to_create.append(os.path.join(path, name))
-        trees.append((os.path.join(path, name), objsha))
-  return files_to_create, dirs_to_create
+    for name in repo.ref_names("heads"):
+      print(name)
 
 
 def cmd_checkout_branch(args):
-  """tinygit checkout-branch <branchname>
+  """tinygit checkout-branch [-j <jobs>] <branchname>
   
   Checkout a branch.
 
-  Overwrites the the workdir completely, replacing with the contents of the snapshot.
+  Updates the workdir to the contents of the snapshot, only touching the
+  paths that differ between the snapshot and HEAD. Files are written by
+  jobs threads.
   Fails if not called currently in a tinygit repository.
+  Fails if jobs is less than 1.
   Fails if branchname doesn't refer to a branch.
   Updates HEAD to branch.
   """
   repo = repo_find()
+  check_jobs(args.jobs)
   branch_sha = repo.resolve_branch(args.branch)
   if not branch_sha:
     raise Exception(f"'{args.branch}' did not match any branches known to tinygit")
   commit = repo.object_read(branch_sha)
+  old_tree_sha = head_tree_sha(repo)
 
   # Update HEAD        
   repo.set_head(type="branch", id=args.branch)
   
   # Update Working Directory
-  for entry in scan_dir(repo.workdir):
-    if entry.name == ".tinygit":
-      pass
-    elif entry.is_dir():
-      shutil.rmtree(entry.path)
-    elif entry.is_file():
-      os.remove(entry.path)
-  unpack_tree(repo.object_read(commit.state["headers"]["tree"]), repo.workdir, repo)
+  checkout_tree(repo, old_tree_sha, commit.state["headers"]["tree"], jobs=args.jobs)
 
 
-# helper function for checkout
-# unpack direct children of tree, in path path
-def unpack_tree(tree, path, repo):
-  for name, sha in tree.items:
-    obj = repo.object_read(sha)
-    if obj.kind == "blob":
-      with open(os.path.join(path, name), "wb") as f:
-        f.write(obj.blobbytes)
-    elif obj.kind == "tree":
-      os.mkdir(os.path.join(path, name))
-      unpack_tree(obj, os.path.join(path, name), repo)
-
-
-def cmd_merge(args):
-  """tinygit merge command
-  
-  Used for merging branches
+# tree sha of the commit HEAD points to or None if no commits yet
+def head_tree_sha(repo):
+  head_sha = repo.resolve_head()
+  if head_sha is None:
+    return None
+  return repo.object_read(head_sha).state["headers"]["tree"]
 
-  Merge isn't fancy like git. It is a UNION of files and directories where conflicts are BOTH present.
-  First, directories in branch a or b or both will be created
-  Next, files in branch a and b or be or both be created if there is only one version
-  If files in branch a and b have the same name foo and different contents ie they CONFLICT, then foo.a and foo.b will be created
-  """
-  repo = repo_find()
-  commit_a = repo.object_read(repo.commit_resolve("HEAD")[0])
-  commit_b = repo.object_read(repo.commit_resolve(args.branchname)[0])
-  files_a, dirs_a = files_dirs_to_create(commit_a, repo)
-  files_b, dirs_b = files_dirs_to_create(commit_b, repo)
 
-  dirs = set(dirs_a + dirs_b)
+# helper function for checkout
+# move the workdir from tree old_sha to tree new_sha, only touching paths
+# that differ between the two
+@traced("checkout_tree")
+def checkout_tree(repo, old_sha, new_sha, jobs=1):
+  blobs = []
+  for path, old, new in tree_diff(repo, old_sha, new_sha):
+    full_path = os.path.join(repo.workdir, path)
+    if os.path.isdir(full_path) and not os.path.islink(full_path):
+      import shutil
+      shutil.rmtree(full_path)
+    elif os.path.lexists(full_path):
+      os.remove(full_path)
+    if new is None:
+      continue
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if new.kind == "tree":
+      os.mkdir(full_path)
+      unpack_tree(new.sha, full_path, repo, blobs)
+    elif new.kind == "blob":
+      blobs.append((new.sha, full_path, new.executable))
+  write_blobs(repo, blobs, jobs)
 
-  pathsandshas = defaultdict(set)
-  for path, sha, _, _ in files_a + files_b:
-    pathsandshas[path].add(sha)
-  conflicts = set(path for path, sha, _, _ in files_a if len(pathsandshas[path]) == 2)
 
-  # empty workdir
-  for entry in scan_dir(repo.workdir):
-    if entry.name == ".tinygit":
-      pass
-    elif entry.is_dir():
-      shutil.rmtree(entry.path)
-    elif entry.is_file():
-      os.remove(entry.path)
+# helper function for checkout
+# create the dirs of tree tree_sha in path path and collect 
+# (sha, path, executable) of its blobs, without reading any blob
+def unpack_tree(tree_sha, path, repo, blobs):
+  for entry in repo.tree_read(tree_sha):
+    if entry.kind == "blob":
+      blobs.append((entry.sha, os.path.join(path, entry.name), entry.executable))
+    elif entry.kind == "tree":
+      os.mkdir(os.path.join(path, entry.name))
+      unpack_tree(entry.sha, os.path.join(path, entry.name), repo, blobs)
 
-  # build dirs
-  for path in dirs:
-    os.mkdir(path)
 
-  # build files
-  for path, objsha, obj, commitsha in files_a + files_b:
-    write_file(path + "." + commitsha if path in conflicts else path, data=obj.blobbytes, mode="wb")
+# helper function for checkout
+# write (sha, path, executable) blobs, their dirs must exist already
+# with jobs > 1 blobs are inflated and written on a thread pool, with at most
+# 2 * jobs writes queued so memory stays bounded
+# if writes fail, the error of the first failing blob in order is raised
+@traced("write_blobs")
+def write_blobs(repo, blobs, jobs=1):
+  if jobs <= 1:
+    for sha, path, executable in blobs:
+      repo.blob_checkout(sha, path, executable)
+    return
+  from concurrent.futures import ThreadPoolExecutor
+  repo.pack_list()
+  pool = ThreadPoolExecutor(max_workers=jobs)
+  try:
+    pending = collections.deque()
+    for sha, path, executable in blobs:
+      pending.append(pool.submit(repo.blob_checkout, sha, path, executable))
+      if len(pending) >= 2 * jobs:
+        pending.popleft().result()
+    while pending:
+      pending.popleft().result()
+  finally:
+    pool_close(pool, pending)
+
+
+# shut pool down, cancelling the futures that haven't started
+# (shutdown's cancel_futures needs python 3.9)
+def pool_close(pool, futures):
+  for future in futures:
+    future.cancel()
+  pool.shutdown(wait=True)
+
+def check_jobs(jobs):
+  if jobs < 1:
+    raise Exception(f"Invalid number of jobs {jobs}")
 
 
 # plumbing commands
 # print contents of file to stdout
 def cmd_cat_file(args):
+  """tinygit cat-file [-t | -s] <object-alias>
+  tinygit cat-file --batch | --batch-check
+
+  Print an object.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if object-alias doesn't resolve to an object.
+  Fails if object-alias is ambiguous.
+  With -t prints only the kind of the object, with -s only its size, 
+  neither needs more than the object's header.
+  With --batch or --batch-check, reads object aliases from stdin, one per 
+  line, and for each prints "<sha> <kind> <size>", followed by a newline, 
+  the size bytes of the object's contents and another newline for --batch.
+  Aliases that don't resolve print "<alias> missing" or "<alias> ambiguous".
+  Output is flushed after every object, and the repo and its caches stay 
+  warm for the whole session.
+  """
   repo = repo_find()
-  obj = repo.object_read(args.object)
+  if args.batch or args.batch_check:
+    cat_file_batch(repo, sys.stdin, sys.stdout.buffer, contents=args.batch)
+    return
+  if args.object is None:
+    raise Exception("No object given")
+  shas = alias_shas(repo, args.object)
+  if not shas:
+    raise Exception(f"'{args.object}' did not match any objects known to tinygit")
+  if len(shas) > 1:
+    raise Exception(f"'{args.object}' is ambiguous")
+  if args.kind or args.size:
+    kind, size = repo.object_info(shas[0])
+    print(kind if args.kind else size)
+    return
+  obj = repo.object_read(shas[0])
   print(f"Requested object is a {obj.kind}")
   if obj.kind == "blob":
     print("blobs are bytes and cannot be printed using this command")
@@ -415,14 +519,50 @@ def cmd_cat_file(args):
     print(obj.serialize().decode())
 
 
+def cat_file_batch(repo, lines, out, contents):
+  try:
+    for line in lines:
+      alias = line.strip()
+      if not alias:
+        continue
+      shas = alias_shas(repo, alias)
+      if len(shas) != 1:
+        out.write(f"{alias} {'missing' if not shas else 'ambiguous'}\n".encode())
+      elif contents:
+        kind, size, chunks = repo.object_open(shas[0])
+        out.write(f"{shas[0]} {kind} {size}\n".encode())
+        for chunk in chunks:
+          out.write(chunk)
+        out.write(b"\n")
+      else:
+        kind, size = repo.object_info(shas[0])
+        out.write(f"{shas[0]} {kind} {size}\n".encode())
+      out.flush()
+  except BrokenPipeError:
+    # reader went away, stop quietly
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, out.fileno())
+
+
+# shas an object alias resolves to, none or several if it doesn't resolve
+# to exactly one, full shas skip ref resolution
+def alias_shas(repo, alias):
+  if len(alias) == 40 and repo.object_exists(alias):
+    return [alias]
+  return repo.object_resolve(alias)
+
+
 # hash object and optionally write to db
 def cmd_hash_object(args): 
   repo = repo_find()
+  if args.type == 'blob':
+    # blobs are streamed, they can be larger than memory
+    print(repo.blob_write_file(args.file, write=args.write))
+    return
+
   with open(args.file, "rb") as f:
     data = f.read()
-    if   args.type == 'blob': 
-      c = GitBlob
-    elif args.type == 'commit': 
+    if   args.type == 'commit': 
       c = GitCommit
     elif args.type == 'tag': 
       c = GitTag
@@ -438,6 +578,65 @@ def cmd_hash_object(args):
   print(object_hash(obj))
 
 
+def cmd_pack_refs(args):
+  """tinygit pack-refs
+
+  Pack branches and tags into .tinygit/packed-refs.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if a ref doesn't point to an object, before anything is written.
+  Moves every loose ref into the sorted packed-refs file and removes the
+  loose copies, so resolving a ref is a binary search in one file.
+  """
+  repo = repo_find()
+  refs = {ref: sha for ref, sha in repo.ref_list().items() if ref != "HEAD"}
+  for ref, sha in refs.items():
+    if not sha or not repo.object_exists(sha):
+      raise Exception(f"Ref {ref} doesn't point to an object")
+  repo.packed_refs_write(refs)
+  for kind in ["heads", "tags"]:
+    for _, path in repo.loose_ref_files(kind):
+      os.remove(path)
+    # and the directories of hierarchical refs, now empty
+    root = os.path.join(repo.tinygitdir, "refs", kind)
+    for dirpath, _, _ in os.walk(root, topdown=False):
+      if dirpath != root and not os.listdir(dirpath):
+        os.rmdir(dirpath)
+  repo.loose_refs = {}
+  print(f"Packed {len(refs)} refs")
+
+
+def cmd_rev_parse(args):
+  """tinygit rev-parse [--wyag-type <type>] [--short[=<length>]] <name>
+
+  Print the sha an alias refers to.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if name doesn't resolve to an object (of the given type).
+  Fails if name is ambiguous.
+  With --short, prints the shortest prefix of the sha, at least length 
+  (default and minimum 4) long, that no other object shares.
+  Sha prefixes shorter than 4 aren't resolved.
+  Fails if length isn't a number.
+  """
+  # in "--short <name>" argparse takes the name for the length
+  if args.name is None and args.short is not None:
+    args.name, args.short = args.short, "4"
+  if args.name is None:
+    raise Exception("No name given")
+  if args.short is not None and not args.short.isdigit():
+    raise Exception(f"Invalid length '{args.short}'")
+  repo = repo_find()
+  shas = repo.object_resolve(args.name)
+  if args.type:
+    shas = [sha for sha in shas if repo.object_info(sha)[0] == args.type]
+  if not shas:
+    raise Exception(f"'{args.name}' did not match any objects known to tinygit")
+  if len(shas) > 1:
+    raise Exception(f"'{args.name}' is ambiguous")
+  print(repo.abbrev(shas[0], int(args.short)) if args.short else shas[0])
+
+
 def cmd_show_ref(args):
   """tinygit show-ref command
   
@@ -448,4 +647,27 @@ def cmd_show_ref(args):
     print(f"{v} {k}")
 
 
+def cmd_daemon(args):
+  """tinygit daemon [--stop] [-v]
+
+  Serve commands for this repo from a long running process.
 
+  Fails if not called currently in a tinygit repository.
+  Fails if a daemon is already running for the repo, or with --stop, if none 
+  is.
+  While it runs, tinygit commands in the repo connect to the daemon over 
+  .tinygit/daemon.sock and run there, against a repo whose object, ref and 
+  stat caches stay warm between commands. Refs, packs and the commit-graph 
+  are reloaded when changed on disk, so commands see the same repo as ever.
+  Commands run one at a time. Set TINYGIT_NO_DAEMON to run in process anyway.
+  """
+  from tinygit.cli import run
+  repo = repo_find()
+  if args.stop:
+    if not daemon_stop():
+      raise Exception("No daemon running")
+    return
+  try:
+    daemon_serve(repo, run, verbose=args.verbose)
+  except KeyboardInterrupt:
+    pass
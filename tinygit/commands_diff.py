@@ -0,0 +1,135 @@
+import sys
+
+from tinygit.utils import *
+from tinygit.state import *
+from tinygit.diff import *
+from tinygit.commands import *
+
+
+def cmd_diff(args):
+  """tinygit diff [-U <lines>] [-M[<percent>] | --no-renames] [-C] [-l <count>] [--name-status | --stat] [<commit-alias> [<commit-alias>]]
+
+  Show changes between two commits, or between a commit and the workdir.
+
+  Compares the first commit to the second, or to the workdir if only one
+  is given, or HEAD to the workdir if none are.
+  Only subtrees whose shas differ between the two sides are read.
+  Fails if not called currently in a tinygit repository.
+  Fails if a commit-alias doesn't resolve to exactly one commit.
+  Fails if lines or count is negative, or percent isn't between 0 and 100.
+  Added files are paired with the deleted files they were renamed from,
+  identical or at least percent (50 by default) similar, unless
+  --no-renames. With -C they are also paired with the modified or deleted
+  files they were copied from. Only identical files are paired if there
+  are more than count (1000 by default) squared candidate pairs.
+  Prints a unified diff of every changed file, with lines lines of context
+  around changes (3 by default). Binary files, which have a NUL byte in
+  their first 8000 bytes, are only reported as differing.
+  With --name-status prints "<status>\t<path>" for every changed file,
+  status being A added, D deleted or M modified, or "<status>\t<from>\t<path>"
+  for renames and copies, status being R or C and their similarity.
+  With --stat prints the number of changed lines of every changed file and
+  a summary.
+  """
+  repo = repo_find()
+  if args.unified < 0:
+    raise Exception(f"Invalid number of context lines {args.unified}")
+  if args.find_renames is not None and not 0 <= args.find_renames <= 100:
+    raise Exception(f"Invalid similarity {args.find_renames}")
+  if args.rename_limit < 0:
+    raise Exception(f"Invalid rename limit {args.rename_limit}")
+  old_sha = diff_tree_sha(repo, args.old)
+  trees, workdir = None, args.new is None
+  if workdir:
+    index = repo.index()
+    new_sha, trees = workdir_walk(repo, index)
+    index.save()
+  else:
+    new_sha = diff_tree_sha(repo, args.new)
+  changes = blob_diff(repo, old_sha, new_sha, trees)
+  if args.find_renames is not None:
+    changes = detect_renames(repo, changes, workdir, args.find_renames, args.rename_limit, args.find_copies)
+  if args.stat:
+    print_stat(repo, changes, workdir)
+  elif args.name_status:
+    for status, path, _, _, source in changes:
+      print("\t".join(filter(None, [status, source, path])))
+  else:
+    sys.stdout.flush()
+    for change in changes:
+      print_patch(repo, change, sys.stdout.buffer, workdir, args.unified)
+    sys.stdout.buffer.flush()
+
+# tree sha of the commit alias resolves to, None if HEAD has no commits yet
+def diff_tree_sha(repo, alias):
+  commit_shas = repo.resolve_commit_alias(alias)
+  if not commit_shas:
+    if alias == "HEAD":
+      return None
+    raise Exception(f"'{alias}' did not match any commits known to tinygit")
+  if len(commit_shas) > 1:
+    raise Exception(f"'{alias}' is ambiguous")
+  return repo.object_read(commit_shas[0]).state["headers"]["tree"]
+
+# print changed lines per file of changes and totals
+# binary files print their sizes instead
+def print_stat(repo, changes, workdir=False, width=40):
+  rows, insertions, deletions = [], 0, 0
+  for _, path, old, new, source in changes:
+    old_size, old_data = blob_text(repo, old, path)
+    new_size, new_data = blob_text(repo, new, path, workdir)
+    counts = None
+    if old and new and old.sha == new.sha:
+      counts = (0, 0)
+    elif old_data is not None and new_data is not None:
+      counts = line_counts(old_data, new_data)
+    rows.append((f"{source} => {path}" if source else path, counts, old_size, new_size))
+    if counts:
+      insertions, deletions = insertions + counts[0], deletions + counts[1]
+  if not rows:
+    return
+  name_width = max(len(path) for path, *_ in rows)
+  most = max((sum(counts) for _, counts, _, _ in rows if counts), default=0)
+  for path, counts, old_size, new_size in rows:
+    if counts is None:
+      print(f" {path:<{name_width}} | Bin {old_size} -> {new_size} bytes")
+      continue
+    added, deleted = counts
+    if most > width:
+      added, deleted = (added * width + most - 1) // most, (deleted * width + most - 1) // most
+    print(f" {path:<{name_width}} | {sum(counts):>{len(str(most))}} {'+' * added}{'-' * deleted}".rstrip())
+  print(f" {len(rows)} file{'s' if len(rows) != 1 else ''} changed, "
+    f"{insertions} insertion{'s' if insertions != 1 else ''}(+), {deletions} deletion{'s' if deletions != 1 else ''}(-)")
+
+# write the unified diff of one change to out, hunks are written as they
+# are found
+def print_patch(repo, change, out, workdir=False, context=3):
+  status, path, old, new, source = change
+  mode = lambda entry: "100755" if entry.executable else "100644"
+  a, b = (b"a/" + (source or path).encode(), b"b/" + path.encode())
+  out.write(b"diff --git " + a + b" " + b + b"\n")
+  if source:
+    verb = "rename" if status[0] == "R" else "copy"
+    out.write(f"similarity index {int(status[1:])}%\n{verb} from {source}\n{verb} to {path}\n".encode())
+  if status == "A":
+    out.write(f"new file mode {mode(new)}\n".encode())
+  elif status == "D":
+    out.write(f"deleted file mode {mode(old)}\n".encode())
+  if old and new and not same_mode(old, new):
+    out.write(f"old mode {mode(old)}\nnew mode {mode(new)}\n".encode())
+  if old and new and old.sha == new.sha:
+    return
+  _, old_data = blob_text(repo, old, path)
+  _, new_data = blob_text(repo, new, path, workdir)
+  a, b = (a if old else b"/dev/null"), (b if new else b"/dev/null")
+  if old_data is None or new_data is None:
+    out.write(b"Binary files " + a + b" and " + b + b" differ\n")
+    return
+  out.write(b"--- " + a + b"\n+++ " + b + b"\n")
+  old_lines, new_lines = old_data.splitlines(keepends=True), new_data.splitlines(keepends=True)
+  for a_start, a_count, b_start, b_count, lines in unified_hunks(old_lines, new_lines, context):
+    out.write(f"@@ -{hunk_range(a_start, a_count)} +{hunk_range(b_start, b_count)} @@\n".encode())
+    for tag, line in lines:
+      out.write(tag.encode() + line)
+      if not line.endswith(b"\n"):
+        out.write(b"\n\\ No newline at end of file\n")
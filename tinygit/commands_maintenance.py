@@ -0,0 +1,377 @@
+import sys
+import os
+import zlib
+import collections
+import time
+import contextlib
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from tinygit.utils import *
+from tinygit.state import *
+from tinygit.commands import *
+
+
+def cmd_repack(args):
+  """tinygit repack [-a]
+
+  Pack loose objects.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if another gc or repack is running.
+  Moves every loose object into a new pack and removes the loose copies.
+  With -a, also folds the existing packs into the new one, leaving one pack.
+  Objects similar to another one of the same kind and name are stored as
+  deltas against it.
+  """
+  repo = repo_find()
+  with repo_lock(repo, "gc"):
+    # sha -> the pack it is read from, None for loose objects
+    sources = dict.fromkeys(repo.loose_object_list())
+    loose = list(sources)
+    old_packs = repo.pack_list() if args.all else []
+    for pack in old_packs:
+      for sha in pack.shas():
+        sources.setdefault(sha, pack)
+
+    if not sources:
+      print("Nothing to pack")
+      return
+
+    packpath = pack_objects(repo, sources)
+    # drop what is now in the new pack
+    remove_loose(repo, loose)
+    remove_packs(repo, old_packs, packpath)
+
+  print(f"Packed {len(sources)} objects into {os.path.basename(packpath)}")
+
+
+# helper function for repack and gc
+# write the objects of sources, sha -> the pack holding it or None for
+# loose, into a new pack, returns its path
+# objects are read one at a time while the pack is written, only the delta
+# window is held in memory
+def pack_objects(repo, sources):
+  # kind and size of every object, and blobs and trees named after the
+  # entries pointing at them, set the order of the delta search
+  infos, names = {}, {}
+  for sha in sources:
+    infos[sha] = repo.object_info(sha)
+    if infos[sha][0] == "tree":
+      for item in repo.object_read(sha).items:
+        names[item[1]] = item[0]
+  objects = ((sha, source_read(repo, sources[sha], sha)) for sha in delta_order(infos, names))
+  return pack_write(os.path.join(repo.tinygitdir, "objects", "pack"), objects)
+
+
+# helper function for repack and gc
+# decompressed "<kind> <size>\0<data>" of an object in pack, or loose if None
+def source_read(repo, pack, sha):
+  if pack is None:
+    return zlib.decompress(read_file(repo.tinygitdir, "objects", sha[0:2], sha[2:], mode="rb"))
+  return pack.read_raw(sha)
+
+
+# helper function for repack and gc
+# remove loose objects and the fanout dirs left empty
+def remove_loose(repo, shas):
+  for sha in shas:
+    os.remove(os.path.join(repo.tinygitdir, "objects", sha[0:2], sha[2:]))
+  for entry in scan_dir(repo.tinygitdir, "objects"):
+    if entry.is_dir() and len(entry.name) == 2 and not os.listdir(entry.path):
+      os.rmdir(entry.path)
+  repo.loose_index().rebuild(repo.loose_object_list())
+
+
+# helper function for repack and gc
+# remove packs, except the one at keep
+def remove_packs(repo, packs, keep=None):
+  for pack in packs:
+    pack.close()
+    if pack.packpath != keep:
+      os.remove(pack.idxpath)
+      os.remove(pack.packpath)
+  repo.packs = None
+
+
+# hold .tinygit/<name>.lock while in the with block, so commands rewriting
+# the db don't run at once, a lock left by a process that died is taken over
+@contextlib.contextmanager
+def repo_lock(repo, name):
+  path = os.path.join(repo.tinygitdir, name + ".lock")
+  try:
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+  except FileExistsError:
+    pid = read_file(path)
+    try:
+      os.kill(int(pid), 0)
+      alive = True
+    except (ValueError, TypeError, ProcessLookupError):
+      alive = False
+    except PermissionError:
+      alive = True
+    if alive:
+      raise Exception(f"Another process ({pid}) holds {path}")
+    os.remove(path)
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+  try:
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    yield
+  finally:
+    os.remove(path)
+
+
+# disk usage in bytes of the files under path, whole blocks count since 
+# that's what many small loose objects really cost
+def dir_size(path):
+  return sum(os.lstat(os.path.join(dir_path, name)).st_blocks * 512
+             for dir_path, _, names in os.walk(path) for name in names)
+
+
+def cmd_gc(args):
+  """tinygit gc [--grace <seconds>] [--full] [--auto]
+
+  Remove unreachable objects and pack the rest.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if another gc or repack is running.
+  Marks every object reachable from HEAD, branches and tags. Unreachable 
+  loose objects, and leftover temporary files, older than the grace period 
+  (two weeks by default) are deleted. Reachable loose objects are moved 
+  into a new pack.
+  Incremental by default: existing packs are left alone until there are 
+  GC_PACKS_MAX of them, or with --full. Then they are all folded into one 
+  pack, dropping the unreachable objects in them that are older than the 
+  grace period. Recent unreachable packed objects become loose again.
+  Writers touch the objects they reuse (see GitRepo.object_freshen), so 
+  objects a commit in progress refers to are always within the grace period.
+  With --auto, does nothing unless there are GC_AUTO_LOOSE loose objects or 
+  GC_PACKS_MAX packs.
+  """
+  repo = repo_find()
+  grace = GC_GRACE if args.grace is None else args.grace
+  if grace < 0:
+    raise Exception(f"Invalid grace period {grace}")
+
+  with repo_lock(repo, "gc"):
+    # listed under the lock, a gc or repack that just finished may have
+    # removed objects and packs
+    loose = repo.loose_object_list()
+    packs = repo.pack_list()
+    full = args.full or len(packs) >= GC_PACKS_MAX
+    if args.auto and len(loose) < GC_AUTO_LOOSE and not full:
+      return
+    objectsdir = os.path.join(repo.tinygitdir, "objects")
+    size_before = dir_size(objectsdir)
+    reachable = repo.reachable(set(repo.ref_list().values()))
+    expire = time.time() - grace
+
+    # sort loose objects into packed, pruned and left alone (recent unreachable)
+    # packed ones go into sources, sha -> the pack holding it or None for loose
+    sources, pruned = {}, set()
+    for sha in loose:
+      path = os.path.join(objectsdir, sha[0:2], sha[2:])
+      if sha in reachable:
+        sources[sha] = None
+      elif os.stat(path).st_mtime < expire:
+        pruned.add(sha)
+
+    # fold the packs, unreachable packed objects are pruned or loosened
+    loosened = 0
+    if full:
+      for pack in packs:
+        recent = os.stat(pack.packpath).st_mtime >= expire
+        for sha in pack.shas():
+          if sha in sources:
+            continue
+          if sha in reachable:
+            sources[sha] = pack
+          elif recent and not file_exists(objectsdir, sha[0:2], sha[2:]):
+            write_file_atomic(objectsdir, sha[0:2], sha[2:], data=zlib.compress(pack.read_raw(sha)), mode="wb")
+            os.utime(os.path.join(objectsdir, sha[0:2], sha[2:]), (time.time(), os.stat(pack.packpath).st_mtime))
+            loosened += 1
+          elif not recent:
+            pruned.add(sha)
+
+    packpath = pack_objects(repo, sources) if sources else None
+    remove_loose(repo, [sha for sha in loose if sha in sources or sha in pruned])
+    if full:
+      remove_packs(repo, packs, packpath)
+    remove_stale_tmp(objectsdir, expire)
+    size_after = dir_size(objectsdir)
+
+  print(f"Packed {len(sources)} objects, pruned {len(pruned)} unreachable objects" + 
+        (f", loosened {loosened} recent unreachable objects" if loosened else ""))
+  print(f"Reclaimed {size_before - size_after} bytes of disk")
+
+
+# helper function for gc
+# remove temporary files of writers that died, older than expire
+def remove_stale_tmp(objectsdir, expire):
+  for dir_path, _, names in os.walk(objectsdir):
+    for name in names:
+      path = os.path.join(dir_path, name)
+      if (name.startswith("tmp") or ".tmp" in name) and os.stat(path).st_mtime < expire:
+        os.remove(path)
+
+
+def cmd_fsck(args):
+  """tinygit fsck [--connectivity-only] [-j <jobs>] [--progress | --no-progress]
+
+  Verify the object db.
+
+  Fails if not called currently in a tinygit repository.
+  Fails (exit code 1) if any object is corrupt or missing.
+  Re-hashes every loose and packed object, on jobs worker processes, and 
+  checks that its header matches its data. Checks that every tree entry,
+  commit tree and parent, branch and tag points to an object of the right
+  kind. Prints "corrupt", "missing" and "broken link" problems, then the
+  dangling objects, ones no ref, commit or tree refers to.
+  With --connectivity-only, blobs are not read, only their headers, so just
+  the links between objects are checked.
+  Progress goes to stderr, by default only when it is a terminal.
+  """
+  repo = repo_find()
+  check_jobs(args.jobs)
+  objects = [(sha, None) for sha in repo.loose_object_list()]
+  for pack in repo.pack_list():
+    objects.extend((sha, pack.packpath) for sha in pack.shas())
+  verify = not args.connectivity_only
+  progress = sys.stderr.isatty() if args.progress is None else args.progress
+  batches = [objects[i:i + FSCK_BATCH] for i in range(0, len(objects), FSCK_BATCH)]
+
+  # check every object, collecting kinds and links (from, from kind, to, to kind)
+  kinds, links, corrupt = {}, [], {}
+  pool = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 and len(batches) > 1 else None
+  futures = []
+  try:
+    if pool:
+      futures.extend(pool.submit(fsck_objects, repo.tinygitdir, batch, verify) for batch in batches)
+      results = (future.result() for future in futures)
+    else:
+      results = (fsck_objects(repo.tinygitdir, batch, verify) for batch in batches)
+    done, last = 0, 0
+    for result in results:
+      for sha, kind, problem, refs in result:
+        if problem:
+          corrupt[sha] = problem
+          continue
+        kinds[sha] = kind
+        links.extend((sha, kind, to, to_kind) for to, to_kind in refs)
+      done += len(result)
+      if progress and (time.monotonic() - last > 0.1 or done == len(objects)):
+        print(f"\rChecking objects: {done * 100 // max(len(objects), 1)}% ({done}/{len(objects)})", 
+              end="\n" if done == len(objects) else "", file=sys.stderr, flush=True)
+        last = time.monotonic()
+  finally:
+    if pool:
+      pool_close(pool, futures)
+
+  problems = [f"corrupt {sha}: {problem}" for sha, problem in sorted(corrupt.items())]
+  missing, graph = set(), collections.defaultdict(list)
+  for sha, kind, to, to_kind in links:
+    graph[sha].append(to)
+    if to in corrupt:
+      continue
+    if to not in kinds:
+      missing.add((to, to_kind))
+    elif to_kind is not None and kinds[to] != to_kind:
+      problems.append(f"broken link from {kind} {sha} to {to_kind} {to}, which is a {kinds[to]}")
+  roots = repo.ref_list()
+  for ref, sha in sorted(roots.items()):
+    if sha not in kinds and sha not in corrupt:
+      problems.append(f"missing object {sha} for {ref}")
+  problems.extend(f"missing {kind or 'object'} {sha}" for sha, kind in sorted(missing, key=lambda m: m[0]))
+
+  # dangling objects are unreachable and nothing points at them
+  reachable, stack = set(), list(roots.values())
+  while stack:
+    sha = stack.pop()
+    if sha not in reachable:
+      reachable.add(sha)
+      stack.extend(graph[sha])
+  pointed_at = {to for _, _, to, _ in links}
+  for sha in sorted(kinds):
+    if sha not in reachable and sha not in pointed_at:
+      problems.append(f"dangling {kinds[sha]} {sha}")
+
+  for problem in problems:
+    print(problem)
+  if any(not problem.startswith("dangling") for problem in problems):
+    sys.exit(1)
+
+
+# helper function for fsck, runs in the worker processes
+# check (sha, path of its pack or None if loose) objects, returns 
+# (sha, kind, problem or None, links) for each, links are the (sha, kind) 
+# a tree or commit refers to, kind is None for entries of untyped trees
+def fsck_objects(tinygitdir, objects, verify):
+  ret = []
+  for sha, packpath in objects:
+    try:
+      kind, data = fsck_object(tinygitdir, sha, packpath, verify)
+      ret.append((sha, kind, None, fsck_links(kind, data)))
+    except Exception as e:
+      ret.append((sha, None, str(e) or type(e).__name__, []))
+  return ret
+
+
+# packs opened by this fsck worker, path -> GitPack
+fsck_packs = {}
+
+# (kind, data) of an object, data is None for blobs
+# with verify, the object is hashed and its size checked, otherwise blobs
+# are only checked to exist
+def fsck_object(tinygitdir, sha, packpath, verify):
+  if packpath is not None:
+    if packpath not in fsck_packs:
+      fsck_packs[packpath] = GitPack(packpath)
+    pack = fsck_packs[packpath]
+    if not verify and pack.info(sha)[0] == "blob":
+      return "blob", None
+    chunks = [pack.read_raw(sha)]
+  else:
+    f = open(os.path.join(tinygitdir, "objects", sha[0:2], sha[2:]), "rb")
+    if not verify:
+      kind, _, _ = parse_header(inflate_header(read_chunks(f, 256)))
+      if kind == "blob":
+        f.close()
+        return "blob", None
+      f.seek(0)
+    chunks = inflate(read_chunks(f))
+  # hash in chunks, only trees and commits are kept whole
+  h, head, body, n = hashlib.sha1(), b"", [], 0
+  kind = size = None
+  for chunk in chunks:
+    h.update(chunk)
+    if kind is None:
+      head += chunk
+      if b'\x00' not in head:
+        continue
+      kind, size, start = parse_header(head)
+      chunk = head[start:]
+    n += len(chunk)
+    if kind != "blob":
+      body.append(chunk)
+  if packpath is None:
+    f.close()
+  if kind is None:
+    raise Exception("bad header")
+  if kind not in ("blob", "tree", "commit"):
+    raise Exception(f"unknown kind {kind}")
+  if n != size:
+    raise Exception(f"size {n} doesn't match header size {size}")
+  if h.hexdigest() != sha:
+    raise Exception(f"hashes to {h.hexdigest()}")
+  return kind, None if kind == "blob" else b"".join(body)
+
+
+# (sha, kind) of the objects a tree or commit refers to
+def fsck_links(kind, data):
+  if kind == "tree":
+    return [(item[1], item[2] if len(item) >= 5 else None) for item in GitTree(data).items]
+  if kind == "commit":
+    commit = GitCommit(data)
+    return [(commit.state["headers"]["tree"], "tree")] + [(p, "commit") for p in commit.parents()]
+  return []
@@ -0,0 +1,65 @@
+import sys
+
+from tinygit.utils import *
+from tinygit.state import *
+from tinygit.merge import *
+from tinygit.commands import *
+
+
+def cmd_merge(args):
+  """tinygit merge [-j <jobs>] <branchname>
+  
+  Merge a branch into HEAD.
+
+  Fails if not called currently in a tinygit repository.
+  Fails if HEAD points to no commit or branchname isn't a branch.
+  Fails (exit code 1) if there are conflicts.
+  Does nothing if the branch is already contained in HEAD, and moves HEAD
+  forward if HEAD is contained in the branch.
+  Otherwise merges the trees of HEAD and the branch against the tree of 
+  their merge base, without reading subtrees that are the same on two 
+  sides, or blobs changed on only one. Files changed on both sides are 
+  merged line by line. Makes a merge commit with HEAD and the branch as 
+  parents.
+  On conflicts, the conflicting files hold both versions between conflict
+  markers (binary files and file/directory clashes keep theirs as 
+  <name>.<branchname>, or <name>.<branchname>.<n> if that is taken) and no
+  commit is made, tinygit commit makes the merge commit once they are
+  resolved.
+  The workdir is assumed to hold HEAD, only the paths the merge changes are
+  written, by jobs threads.
+  """
+  repo = repo_find()
+  check_jobs(args.jobs)
+  sha_a, sha_b = repo.resolve_head(), repo.resolve_branch(args.branchname)
+  if not sha_a:
+    raise Exception("Cannot merge into HEAD pointing to no commit")
+  if not sha_b:
+    raise Exception(f"'{args.branchname}' did not match any branches known to tinygit")
+  if repo.is_ancestor(sha_b, sha_a):
+    print("Already up to date")
+    return
+  tree_a = repo.object_read(sha_a).state["headers"]["tree"]
+  tree_b = repo.object_read(sha_b).state["headers"]["tree"]
+
+  if repo.is_ancestor(sha_a, sha_b):
+    checkout_tree(repo, tree_a, tree_b, jobs=args.jobs)
+    head_move(repo, sha_b)
+    print(f"Fast-forward to {sha_b}")
+    return
+
+  base = repo.merge_base(sha_a, sha_b)
+  tree_base = repo.object_read(base).state["headers"]["tree"] if base else None
+  merged, conflicts = merge_trees(repo, tree_base, tree_a, tree_b, args.branchname)
+  if merged is None:
+    merged = repo.object_write(GitTree())
+  checkout_tree(repo, tree_a, merged, jobs=args.jobs)
+
+  if conflicts:
+    write_file(repo.tinygitdir, "MERGE_HEAD", data=sha_b + "\n")
+    for path, reason in conflicts:
+      print(f"CONFLICT ({reason}): {path}")
+    print("Automatic merge failed, fix the conflicts and commit the result")
+    sys.exit(1)
+  commitsha = commit_create(repo, merged, f"Merge branch '{args.branchname}'", [sha_a, sha_b])
+  print(f"Merge made commit {commitsha}")
@@ -0,0 +1,179 @@
+import os
+import sys
+import io
+import json
+import struct
+
+# tinygit daemon protocol, over .tinygit/daemon.sock
+#   request   one json line {"argv": [...], "cwd": "..."}
+#   response  frames of channel (1 byte), length (u32), data until an exit
+#             frame, channels are b"o" stdout, b"e" stderr, b"x" exit code
+SOCKET_NAME = "daemon.sock"
+FRAME = struct.Struct(">cI")
+
+# set to skip the daemon and always run in process
+NO_DAEMON_ENV = "TINYGIT_NO_DAEMON"
+
+
+# path of the daemon socket of the repo containing cwd, or None
+def daemon_socket_path():
+  path = os.path.realpath(".")
+  while True:
+    if os.path.isdir(os.path.join(path, ".tinygit")):
+      sockpath = os.path.join(path, ".tinygit", SOCKET_NAME)
+      return sockpath if os.path.exists(sockpath) else None
+    parentpath = os.path.dirname(path)
+    if parentpath == path:
+      return None
+    path = parentpath
+
+def daemon_connect(sockpath):
+  # only once there is a socket, commands without a daemon don't pay for it
+  import socket
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(sockpath)
+  except OSError:
+    sock.close()
+    return None
+  return sock
+
+# run a command through the daemon of the current repo
+# returns the exit code or None if no daemon is running
+def daemon_forward(argv):
+  if os.environ.get(NO_DAEMON_ENV):
+    return None
+  sockpath = daemon_socket_path()
+  sock = daemon_connect(sockpath) if sockpath else None
+  if sock is None:
+    return None
+  with sock:
+    sock.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+    f = sock.makefile("rb")
+    outputs = {b"o": sys.stdout, b"e": sys.stderr}
+    while True:
+      header = f.read(FRAME.size)
+      if len(header) < FRAME.size:
+        raise Exception("Daemon went away")
+      channel, length = FRAME.unpack(header)
+      data = f.read(length)
+      if channel == b"x":
+        return int(data)
+      try:
+        outputs[channel].flush()
+        outputs[channel].buffer.write(data)
+        outputs[channel].buffer.flush()
+      except BrokenPipeError:
+        # reader went away (e.g. log | head), stop quietly, the daemon drops
+        # the rest of the output once the socket is closed
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, outputs[channel].fileno())
+        return 0
+
+
+class FrameWriter(io.RawIOBase):
+  """Writable stream sending everything written as frames of one channel."""
+
+  def __init__(self, sock, channel):
+    self.sock = sock
+    self.channel = channel
+    self.broken = False
+
+  def writable(self):
+    return True
+
+  # once the client is gone the rest of the output is dropped
+  def write(self, data):
+    if not self.broken:
+      try:
+        self.sock.sendall(FRAME.pack(self.channel, len(data)) + bytes(data))
+      except OSError as e:
+        # seen by commands as a closed stdout
+        self.broken = True
+        raise BrokenPipeError(*e.args)
+    return len(data)
+
+
+# serve commands for repo until stopped, run(argv) runs a command in process
+# requests are served one at a time, commands change cwd and sys.stdout
+def daemon_serve(repo, run, verbose=False):
+  # server only imports, clients connecting to the daemon stay cheap to start
+  import signal
+  import socket
+  from tinygit.state import open_repos
+  sockpath = os.path.join(repo.tinygitdir, SOCKET_NAME)
+  if os.path.exists(sockpath):
+    sock = daemon_connect(sockpath)
+    if sock is not None:
+      sock.close()
+      raise Exception("Daemon already running")
+    os.remove(sockpath)   # left behind by a daemon that was killed
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  server.bind(sockpath)
+  server.listen()
+  # clean up the socket when terminated too
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  open_repos[repo.workdir] = repo
+  try:
+    while True:
+      conn, _ = server.accept()
+      with conn:
+        try:
+          request = json.loads(conn.makefile("rb").readline())
+        except ValueError:
+          continue   # client hung up before sending a request
+        if request["argv"][:2] == ["daemon", "--stop"]:
+          conn.sendall(FRAME.pack(b"x", 1) + b"0")
+          break
+        if verbose:
+          print(request["cwd"], "tinygit", *request["argv"], flush=True)
+        code = daemon_serve_request(conn, repo, run, request)
+        try:
+          conn.sendall(FRAME.pack(b"x", len(str(code))) + str(code).encode())
+        except OSError:
+          pass   # client went away
+  finally:
+    del open_repos[repo.workdir]
+    server.close()
+    os.remove(sockpath)
+
+# run one command with its output sent to conn, returns the exit code
+def daemon_serve_request(conn, repo, run, request):
+  import traceback
+  stdout, stderr, cwd = sys.stdout, sys.stderr, os.getcwd()
+  sys.stdout = io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, b"o")))
+  sys.stderr = io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, b"e")))
+  code = 0
+  try:
+    os.chdir(request["cwd"])
+    repo.refresh()
+    code = run(request["argv"]) or 0
+  except SystemExit as e:
+    if e.code is None or isinstance(e.code, int):
+      code = e.code or 0
+    else:
+      print(e.code, file=sys.stderr)
+      code = 1
+  except Exception:
+    traceback.print_exc()
+    code = 1
+  finally:
+    try:
+      sys.stdout.flush()
+      sys.stderr.flush()
+    except OSError:
+      code = 1   # client went away
+    sys.stdout, sys.stderr = stdout, stderr
+    os.chdir(cwd)
+  return code
+
+# ask the daemon of the current repo to stop, False if none is running
+def daemon_stop():
+  sockpath = daemon_socket_path()
+  sock = daemon_connect(sockpath) if sockpath else None
+  if sock is None:
+    return False
+  with sock:
+    sock.sendall(json.dumps({"argv": ["daemon", "--stop"], "cwd": os.getcwd()}).encode() + b"\n")
+    sock.recv(FRAME.size + 1)
+  return True
@@ -0,0 +1,375 @@
+import os
+import itertools
+import collections
+
+from tinygit.utils import *
+from tinygit.state import *
+
+
+# name -> TreeEntry for the entries of a tree, empty for None
+# trees maps the shas of trees that aren't in the db, like the workdir's
+# (see workdir_walk), to their entries
+def tree_items(repo, tree_sha, trees=None):
+  if tree_sha is None:
+    return {}
+  if trees and tree_sha in trees:
+    return {entry.name: entry for entry in trees[tree_sha]}
+  return {entry.name: entry for entry in repo.tree_read(tree_sha)}
+
+
+# lockstep diff of two trees, either may be None for the empty tree
+# children with the same sha on both sides are skipped without being read,
+# so the cost scales with the size of the change
+# yields (path, old, new) where old and new are TreeEntry or None, in
+# sorted path order
+# added and deleted subtrees are yielded whole rather than expanded, unless
+# expand, then their entries follow them and a path that changed between
+# blob and tree is yielded as a deletion and an addition
+# if dirs, subtrees changed on both sides are yielded before their changes
+def tree_diff(repo, old_sha, new_sha, path="", trees=None, expand=False, dirs=False):
+  if old_sha == new_sha:
+    return
+  old_items, new_items = tree_items(repo, old_sha, trees), tree_items(repo, new_sha, trees)
+  for name in sorted(old_items.keys() | new_items.keys()):
+    old, new = old_items.get(name), new_items.get(name)
+    if old and new and old.sha == new.sha and same_mode(old, new):
+      continue
+    child_path = os.path.join(path, name)
+    if old and new and old.kind == "tree" and new.kind == "tree":
+      # trees of other formats (e.g. [name, sha] items) can differ in sha
+      # with the same entries, a dir only changed if some entry did
+      changes = tree_diff(repo, old.sha, new.sha, child_path, trees, expand, dirs)
+      first = next(changes, None)
+      if first is None:
+        continue
+      if dirs:
+        yield child_path, old, new
+      yield first
+      yield from changes
+    elif expand and (old and old.kind == "tree" or new and new.kind == "tree"):
+      if old:
+        yield child_path, old, None
+        if old.kind == "tree":
+          yield from tree_diff(repo, old.sha, None, child_path, trees, expand, dirs)
+      if new:
+        yield child_path, None, new
+        if new.kind == "tree":
+          yield from tree_diff(repo, None, new.sha, child_path, trees, expand, dirs)
+    else:
+      yield child_path, old, new
+
+# whether two entries have the same mode, an unknown mode matches any
+def same_mode(old, new):
+  return old.executable is None or new.executable is None or old.executable == new.executable
+
+# a changed blob, status is "A" added, "D" deleted, "M" modified (contents or
+# mode), or "R<score>" renamed and "C<score>" copied from source, the old path
+Change = collections.namedtuple("Change", ["status", "path", "old", "new", "source"], defaults=[None])
+
+# changed blobs between two trees, as Change in path order
+def blob_diff(repo, old_sha, new_sha, trees=None):
+  for path, old, new in tree_diff(repo, old_sha, new_sha, trees=trees, expand=True):
+    if (old or new).kind != "blob":
+      continue
+    yield Change("A" if old is None else "D" if new is None else "M", path, old, new)
+
+
+# bytes looked at to tell binary blobs from text, like git
+BINARY_SNIFF = 8000
+
+# rename detection, see detect_renames
+RENAME_THRESHOLD = 50    # least similarity in percent of an inexact rename
+RENAME_LIMIT = 1000      # no inexact renames past this many sources by destinations
+RENAME_CANDIDATES = 16   # sources scored per destination
+SKETCH_CHUNK = 64        # longest chunk of a similarity sketch
+
+def is_binary(data):
+  return b"\x00" in data[:BINARY_SNIFF]
+
+# (size, contents) of the blob of entry, (0, b"") for no entry
+# contents are None for binary blobs, of which only the start is read
+# workdir entries are read from the workdir, their blobs may not be stored
+def blob_text(repo, entry, path, workdir=False):
+  if entry is None:
+    return 0, b""
+  if workdir:
+    with open(os.path.join(repo.workdir, path), "rb") as f:
+      head = f.read(BINARY_SNIFF)
+      if is_binary(head):
+        return os.fstat(f.fileno()).st_size, None
+      data = head + f.read()
+      return len(data), data
+  _, size, chunks = repo.object_open(entry.sha)
+  data = []
+  for chunk in chunks:
+    data.append(chunk)
+    if sum(map(len, data)) >= BINARY_SNIFF:
+      break
+  if is_binary(b"".join(data)):
+    chunks.close()
+    return size, None
+  data.extend(chunks)
+  return size, b"".join(data)
+
+
+# line diff
+
+# matching runs of lines of a and b, as (i, j, n) for a[i:i + n] == b[j:j + n],
+# in order and not adjacent to each other
+# linear-space Myers: common prefixes and suffixes are stripped, the rest is
+# split at the middle of a shortest edit path, found from both ends at once,
+# and both halves are diffed in turn, so only O(len(a) + len(b)) is kept
+# runs are generated as they are found, without building the edit script
+def line_matches(a, b):
+  # compare small ints rather than lines
+  ids = {}
+  a = [ids.setdefault(line, len(ids)) for line in a]
+  b = [ids.setdefault(line, len(ids)) for line in b]
+  # lines only one side has can't match, diff the others (as xdiff does),
+  # a[ai[i]] is the i-th of those in a
+  in_a, in_b = set(a), set(b)
+  ai = [i for i, x in enumerate(a) if x in in_b]
+  bi = [j for j, y in enumerate(b) if y in in_a]
+  run = None
+  for i, j, n in myers([a[i] for i in ai], [b[j] for j in bi]):
+    for d in range(n):
+      i2, j2 = ai[i + d], bi[j + d]
+      if run and run[0] + run[2] == i2 and run[1] + run[2] == j2:
+        run = (run[0], run[1], run[2] + 1)
+        continue
+      if run:
+        yield run
+      run = (i2, j2, 1)
+  if run:
+    yield run
+
+def myers(a, b):
+  # stack of ranges (alo, ahi, blo, bhi) still to diff and runs (n,) to yield,
+  # the next one in order on top
+  stack = [(0, len(a), 0, len(b))]
+  while stack:
+    item = stack.pop()
+    if len(item) == 3:
+      if item[2]:
+        yield item
+      continue
+    alo, ahi, blo, bhi = item
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+      alo, blo = alo + 1, blo + 1
+    if alo > item[0]:
+      yield item[0], item[2], alo - item[0]
+    n = 0
+    while alo < ahi - n and blo < bhi - n and a[ahi - n - 1] == b[bhi - n - 1]:
+      n += 1
+    stack.append((ahi - n, bhi - n, n))
+    ahi, bhi = ahi - n, bhi - n
+    if alo == ahi or blo == bhi:
+      continue
+    x, y = middle_snake(a, b, alo, ahi, blo, bhi)
+    if (x, y) in ((alo, blo), (ahi, bhi)):
+      continue   # no common lines
+    stack.append((x, ahi, y, bhi))
+    stack.append((alo, x, blo, y))
+
+# a point (x, y) on a shortest edit path from (alo, blo) to (ahi, bhi),
+# where the forward and backward searches meet
+def middle_snake(a, b, alo, ahi, blo, bhi):
+  n, m = ahi - alo, bhi - blo
+  max_d = (n + m + 1) // 2
+  offset, length = max_d, 2 * max_d + 2
+  vf, vb = [-1] * length, [-1] * length
+  vf[offset + 1] = vb[offset + 1] = 0
+  delta = n - m
+  odd = delta % 2 != 0
+  # diagonals that ran off the edges are not extended again
+  kf_start = kf_end = kb_start = kb_end = 0
+  for d in range(max_d):
+    for k in range(-d + kf_start, d + 1 - kf_end, 2):
+      if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+        x = vf[offset + k + 1]
+      else:
+        x = vf[offset + k - 1] + 1
+      y = x - k
+      while x < n and y < m and a[alo + x] == b[blo + y]:
+        x, y = x + 1, y + 1
+      vf[offset + k] = x
+      if x > n:
+        kf_end += 2
+      elif y > m:
+        kf_start += 2
+      elif odd:
+        kb = offset + delta - k
+        if 0 <= kb < length and vb[kb] != -1 and x >= n - vb[kb]:
+          return alo + x, blo + y
+    for k in range(-d + kb_start, d + 1 - kb_end, 2):
+      if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+        x = vb[offset + k + 1]
+      else:
+        x = vb[offset + k - 1] + 1
+      y = x - k
+      while x < n and y < m and a[ahi - x - 1] == b[bhi - y - 1]:
+        x, y = x + 1, y + 1
+      vb[offset + k] = x
+      if x > n:
+        kb_end += 2
+      elif y > m:
+        kb_start += 2
+      elif not odd:
+        kf = offset + delta - k
+        if 0 <= kf < length and vf[kf] != -1:
+          xf = vf[kf]
+          yf = xf - (delta - k)
+          if xf >= n - x:
+            return alo + xf, blo + yf
+  return alo, blo
+
+# (insertions, deletions) of the lines of new against old
+def line_counts(old, new):
+  a, b = old.splitlines(keepends=True), new.splitlines(keepends=True)
+  same = sum(n for _, _, n in line_matches(a, b))
+  return len(b) - same, len(a) - same
+
+# hunks of a unified diff of lines a and b with context lines around changes,
+# as (a start, a count, b start, b count, [(tag, line)]) with tags " ", "-"
+# and "+", yielded as soon as the next change is far enough away
+def unified_hunks(a, b, context=3):
+  hunk = None
+  prev = (0, 0, 0)
+  runs = itertools.chain(line_matches(a, b), [(len(a), len(b), 0)])
+  for i, j, n in runs:
+    pi, pj, pn = prev
+    if (pi + pn, pj + pn) == (i, j):
+      prev = (pi, pj, pn + n)   # a run at the start or one ending at the end
+      continue
+    # context of the previous run, ending or continuing the open hunk
+    if hunk and pn > 2 * context:
+      hunk[4].extend((" ", line) for line in a[pi:pi + context])
+      yield hunk_header(hunk)
+      hunk = None
+    elif hunk:
+      hunk[4].extend((" ", line) for line in a[pi:pi + pn])
+    if hunk is None:
+      c = min(context, pn)
+      hunk = [pi + pn - c, 0, pj + pn - c, 0, [(" ", line) for line in a[pi + pn - c:pi + pn]]]
+    hunk[4].extend(("-", line) for line in a[pi + pn:i])
+    hunk[4].extend(("+", line) for line in b[pj + pn:j])
+    prev = (i, j, n)
+  if hunk:
+    pi, _, pn = prev
+    hunk[4].extend((" ", line) for line in a[pi:pi + min(context, pn)])
+    yield hunk_header(hunk)
+
+# fill in the counts of a hunk
+def hunk_header(hunk):
+  a_start, _, b_start, _, lines = hunk
+  a_count = sum(1 for tag, _ in lines if tag != "+")
+  b_count = sum(1 for tag, _ in lines if tag != "-")
+  return a_start, a_count, b_start, b_count, lines
+
+# "start,count" of a hunk header, a hunk of no lines starts before them
+def hunk_range(start, count):
+  if count == 1:
+    return str(start + 1)
+  return f"{start + 1 if count else start},{count}"
+
+
+# rename and copy detection
+
+# changes with additions paired to the deletions (and with copies, the
+# modifications) they were renamed or copied from, in the order of changes
+# identical blobs are paired through a sha map first, then the rest by
+# similarity: the share of bytes two blobs have in common, estimated from
+# sketches of their chunk hashes (see sketch), at least threshold percent
+# past limit * limit sources by destinations only identical blobs are paired
+# candidates for each destination come from an index of the sketches' chunks
+# rather than from comparing it to every source, chunks in more than
+# RENAME_CANDIDATES sources don't pick candidates
+def detect_renames(repo, changes, workdir=False, threshold=RENAME_THRESHOLD, limit=RENAME_LIMIT, copies=False):
+  changes = list(changes)
+  added = [c for c in changes if c.status == "A"]
+  sources = [c for c in changes if c.status == "D" or copies and c.status == "M"]
+  if not added or not sources:
+    return changes
+  pairs, renamed = {}, set()
+  # pair a destination with a source, the first pairing of a deletion is a rename
+  def pair(dst, src, score):
+    if src.status == "D" and src.path not in renamed:
+      renamed.add(src.path)
+      pairs[dst.path] = Change(f"R{score:03d}", dst.path, src.old, dst.new, src.path)
+    elif copies:
+      pairs[dst.path] = Change(f"C{score:03d}", dst.path, src.old, dst.new, src.path)
+  # identical blobs, those keeping their file name first
+  by_sha = {}
+  for src in sources:
+    by_sha.setdefault(src.old.sha, []).append(src)
+  for same_name in (True, False):
+    for dst in added:
+      if dst.path in pairs:
+        continue
+      candidates = [src for src in by_sha.get(dst.new.sha, [])
+        if not same_name or os.path.basename(src.path) == os.path.basename(dst.path)]
+      free = [src for src in candidates if src.status == "D" and src.path not in renamed]
+      if free or candidates:
+        pair(dst, (free or candidates)[0], 100)
+  # similar blobs
+  dsts = [dst for dst in added if dst.path not in pairs]
+  srcs = [src for src in sources if src.path not in renamed]
+  if dsts and srcs and len(dsts) * len(srcs) <= limit * limit:
+    for score, dst, src in similar_pairs(repo, srcs, dsts, workdir, threshold):
+      if dst.path not in pairs:
+        pair(dst, src, score)
+  return [pairs[c.path] if c.status == "A" and c.path in pairs else c
+    for c in changes if not (c.status == "D" and c.path in renamed)]
+
+# (score, dst, src) of sources and destinations at least threshold percent
+# similar, best first
+def similar_pairs(repo, srcs, dsts, workdir, threshold):
+  src_sketches = [sketch(blob_data(repo, src.old, src.path)) for src in srcs]
+  index = {}
+  for i, (_, chunks) in enumerate(src_sketches):
+    for h in chunks:
+      index.setdefault(h, []).append(i)
+  scored = []
+  for dst in dsts:
+    dst_size, dst_chunks = sketch(blob_data(repo, dst.new, dst.path, workdir))
+    if not dst_size:
+      continue
+    # bytes shared with each source, through chunks few sources have
+    shared = collections.Counter()
+    for h, n in dst_chunks.items():
+      postings = index.get(h, ())
+      if len(postings) <= RENAME_CANDIDATES:
+        for i in postings:
+          shared[i] += min(n, src_sketches[i][1][h])
+    for i, _ in shared.most_common(RENAME_CANDIDATES):
+      src_size, src_chunks = src_sketches[i]
+      if min(src_size, dst_size) * 100 < threshold * max(src_size, dst_size):
+        continue
+      common = sum(min(n, src_chunks[h]) for h, n in dst_chunks.items() if h in src_chunks)
+      score = common * 100 // max(src_size, dst_size)
+      if score >= threshold:
+        renamed = os.path.basename(dst.path) != os.path.basename(srcs[i].path)
+        scored.append((-score, renamed, dst.path, srcs[i].path, dst, srcs[i]))
+  # best first, then those keeping their file name
+  scored.sort(key=lambda s: s[:4])
+  return [(-score, dst, src) for score, _, _, _, dst, src in scored]
+
+# contents of the blob of entry
+# workdir entries are read from the workdir, their blobs may not be stored
+def blob_data(repo, entry, path, workdir=False):
+  if workdir:
+    with open(os.path.join(repo.workdir, path), "rb") as f:
+      return f.read()
+  return repo.object_read(entry.sha).blobbytes
+
+# (size, chunk hash -> bytes) of data, chunks are lines or SKETCH_CHUNK byte
+# pieces of longer ones, so text and binary blobs both have sketches
+def sketch(data):
+  chunks = collections.Counter()
+  start = 0
+  while start < len(data):
+    end = data.find(b"\n", start, start + SKETCH_CHUNK)
+    end = start + SKETCH_CHUNK if end == -1 else end + 1
+    chunks[hash(data[start:end])] += end - start
+    start = end
+  return len(data), chunks
@@ -0,0 +1,141 @@
+import os
+import struct
+
+from tinygit.utils import *
+
+mmap = LazyModule("mmap")
+
+# commit-graph file
+#   header   b"TGCG", version (u32), sorted count (u32), tail count (u32)
+#   sorted   sorted count x entry, sorted by sha
+#   tail     tail count x entry, in the order they were added
+# entry      sha, tree sha, first parent, second parent (20 bytes each,
+#            zeros for no parent), generation (u32)
+# generation is 1 for root commits and 1 + the largest generation of the
+# parents otherwise, so a commit can only reach commits of lower generation
+GRAPH_MAGIC = b"TGCG"
+GRAPH_VERSION = 1
+HEADER = struct.Struct(">4sIII")
+ENTRY = struct.Struct(">20s20s20s20sI")
+NO_PARENT = bytes(20)
+
+# the tail is merged into the sorted table once it grows past this
+TAIL_MAX = 1024
+
+
+class CommitGraph:
+  """Commit-graph file, a fixed width table of commits for history walks.
+
+  New commits are appended to an unsorted tail so writing stays cheap, the
+  tail is sorted into the main table now and then. Commits with more than
+  two parents are never stored, GitRepo.commit_info falls back to the
+  commit object for them.
+
+  Attributes:
+      path (str): Path of the commit-graph file.
+      sorted_count (int): Number of entries in the sorted table.
+      tail (dict): sha -> (tree, parents, generation) for the tail entries.
+
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.data = None
+    self.sorted_count = 0
+    self.tail = {}
+    self.load()
+
+  def load(self):
+    if not os.path.isfile(self.path) or os.path.getsize(self.path) < HEADER.size:
+      return
+    with open(self.path, "rb") as f:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, sorted_count, tail_count = HEADER.unpack_from(self.data, 0)
+    if magic != GRAPH_MAGIC or version != GRAPH_VERSION or \
+        len(self.data) < HEADER.size + (sorted_count + tail_count) * ENTRY.size:
+      # the graph is only a cache, a bad one is as good as none
+      self.close()
+      return
+    self.sorted_count = sorted_count
+    for i in range(sorted_count, sorted_count + tail_count):
+      sha, info = self.entry_at(i)
+      self.tail[sha] = info
+
+  def close(self):
+    if self.data is not None:
+      self.data.close()
+    self.data = None
+    self.sorted_count = 0
+    self.tail = {}
+
+  # (sha, (tree, parents, generation)) of the i-th entry
+  def entry_at(self, i):
+    sha, tree, p1, p2, generation = ENTRY.unpack_from(self.data, HEADER.size + i * ENTRY.size)
+    parents = [p.hex() for p in (p1, p2) if p != NO_PARENT]
+    return sha.hex(), (tree.hex(), parents, generation)
+
+  # (tree, parents, generation) of a commit or None if it isn't in the graph
+  def lookup(self, sha):
+    if sha in self.tail:
+      return self.tail[sha]
+    binsha = bytes.fromhex(sha)
+    lo, hi = 0, self.sorted_count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      start = HEADER.size + mid * ENTRY.size
+      if self.data[start:start + 20] < binsha:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo < self.sorted_count:
+      start = HEADER.size + lo * ENTRY.size
+      if self.data[start:start + 20] == binsha:
+        return self.entry_at(lo)[1]
+    return None
+
+  def __contains__(self, sha):
+    return self.lookup(sha) is not None
+
+  # add (sha, tree, parents, generation) entries, parents must be in the graph
+  def add(self, entries):
+    entries = [e for e in entries if len(e[2]) <= 2 and e[0] not in self]
+    if not entries:
+      return
+    if len(self.tail) + len(entries) > TAIL_MAX:
+      self.rewrite(entries)
+      return
+    with open(self.path, "r+b" if self.data is not None else "wb") as f:
+      if self.data is None:
+        f.write(HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, 0, 0))
+      f.seek(HEADER.size + (self.sorted_count + len(self.tail)) * ENTRY.size)
+      for entry in entries:
+        f.write(pack_entry(*entry))
+      # the header goes last, so a torn append is ignored by readers
+      f.seek(0)
+      f.write(HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, self.sorted_count, len(self.tail) + len(entries)))
+    self.close()
+    self.load()
+
+  # write every entry into a fresh sorted table
+  def rewrite(self, entries):
+    rows = {}
+    for i in range(self.sorted_count):
+      sha, (tree, parents, generation) = self.entry_at(i)
+      rows[sha] = (sha, tree, parents, generation)
+    for sha, (tree, parents, generation) in self.tail.items():
+      rows[sha] = (sha, tree, parents, generation)
+    for entry in entries:
+      rows[entry[0]] = entry
+    tmppath = self.path + ".lock"
+    with open(tmppath, "wb") as f:
+      f.write(HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, len(rows), 0))
+      for sha in sorted(rows):
+        f.write(pack_entry(*rows[sha]))
+    self.close()
+    os.replace(tmppath, self.path)
+    self.load()
+
+
+def pack_entry(sha, tree, parents, generation):
+  parents = [bytes.fromhex(p) for p in parents] + [NO_PARENT] * (2 - len(parents))
+  return ENTRY.pack(bytes.fromhex(sha), bytes.fromhex(tree), parents[0], parents[1], generation)
@@ -0,0 +1,89 @@
+import os
+import json
+
+from tinygit.utils import *
+
+
+class GitIndex:
+  """Stat cache for the work directory, stored in .tinygit/index.
+
+  Records (size, mtime_ns, inode, sha) for every file and (items, sha) for
+  every directory seen during the last walk of the work directory, so that
+  unchanged files don't need to be read and hashed again.
+
+  A file whose mtime is not older than the index itself is "racily clean":
+  it could have been modified within the same timestamp tick the index was
+  written in, so its cached sha is never trusted.
+
+  Attributes:
+      repo (GitRepo): The repo this index belongs to.
+      files (dict): relpath -> [size, mtime_ns, inode, sha].
+      trees (dict): relpath -> [items, sha].
+      timestamp_ns (int): mtime of the index file when it was loaded.
+      signature (tuple): file_signature of the index file when it was loaded.
+
+  """
+
+  def __init__(self, repo):
+    self.repo = repo
+    self.files = {}
+    self.trees = {}
+    self.timestamp_ns = 0
+    self.signature = None
+    self.seen = set()
+    self.load()
+
+  def load(self):
+    path = os.path.join(self.repo.tinygitdir, "index")
+    self.signature = file_signature(path)
+    if self.signature is None:
+      return
+    try:
+      state = json.loads(read_file(path))
+      self.files, self.trees = state["files"], state["trees"]
+      self.timestamp_ns = self.signature[0]
+    except (ValueError, KeyError, OSError):
+      # the index is only a cache, a bad one is as good as none
+      self.files, self.trees = {}, {}
+
+  # cached sha for a file or None if its stat changed or is racy
+  def lookup_file(self, relpath, st):
+    self.seen.add(relpath)
+    entry = self.files.get(relpath)
+    if entry is None:
+      return None
+    size, mtime_ns, ino, sha = entry
+    if (size, mtime_ns, ino) != (st.st_size, st.st_mtime_ns, st.st_ino):
+      return None
+    if mtime_ns >= self.timestamp_ns:
+      return None
+    return sha
+
+  def update_file(self, relpath, st, sha):
+    self.seen.add(relpath)
+    self.files[relpath] = [st.st_size, st.st_mtime_ns, st.st_ino, sha]
+
+  # cached sha for a dir or None if any of its children changed
+  def lookup_tree(self, relpath, items):
+    self.seen.add(relpath)
+    entry = self.trees.get(relpath)
+    if entry is None or entry[0] != items:
+      return None
+    return entry[1]
+
+  def update_tree(self, relpath, items, sha):
+    self.seen.add(relpath)
+    self.trees[relpath] = [items, sha]
+
+  # write the index, dropping entries for paths that no longer exist
+  def save(self):
+    self.files = {k: v for k, v in self.files.items() if k in self.seen}
+    self.trees = {k: v for k, v in self.trees.items() if k in self.seen}
+    data = json.dumps({"files": self.files, "trees": self.trees})
+    path = os.path.join(self.repo.tinygitdir, "index")
+    write_file(path + ".lock", data=data)
+    os.replace(path + ".lock", path)
+    # same state as loading the file we just wrote
+    self.signature = file_signature(path)
+    self.timestamp_ns = self.signature[0]
+    self.seen = set()
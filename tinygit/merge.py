@@ -0,0 +1,139 @@
+import os
+
+from tinygit.utils import *
+from tinygit.state import *
+from tinygit.diff import *
+
+
+# three-way merge of trees base, ours and theirs, any may be None for the
+# empty tree, returns (merged tree sha or None if empty, conflicts)
+# subtrees with the same sha on two sides are resolved without being read,
+# blobs are only read when both sides changed them
+# conflicts are (path, reason), their merged blobs hold conflict markers
+def merge_trees(repo, base, ours, theirs, theirs_name="theirs", path=""):
+  if ours == theirs or base == theirs:
+    return ours, []
+  if base == ours:
+    return theirs, []
+  base_items, our_items, their_items = tree_items(repo, base), tree_items(repo, ours), tree_items(repo, theirs)
+  names = base_items.keys() | our_items.keys() | their_items.keys()
+  merged, conflicts = {}, []
+  for name in sorted(names):
+    o, a, b = base_items.get(name), our_items.get(name), their_items.get(name)
+    child_path = os.path.join(path, name)
+    items, child_conflicts = merge_entries(repo, o, a, b, theirs_name, child_path)
+    for item in items:
+      if item[0] != name:
+        # theirs' copy of a conflict, under a name no side uses
+        item[0] = unused_name(item[0], names | merged.keys())
+      merged[item[0]] = item
+    conflicts.extend(child_conflicts)
+  if not merged:
+    return None, conflicts
+  tree = GitTree()
+  tree.items = [merged[name] for name in sorted(merged)]
+  return repo.object_write(tree), conflicts
+
+# name, or name.<n> for the lowest n not in taken
+def unused_name(name, taken):
+  candidate, n = name, 0
+  while candidate in taken:
+    n += 1
+    candidate = f"{name}.{n}"
+  return candidate
+
+
+def same_entry(x, y):
+  if x is None or y is None:
+    return x is y
+  return (x.sha, x.kind) == (y.sha, y.kind) and same_mode(x, y)
+
+def tree_item(entry, name=None):
+  return [name or entry.name, entry.sha, entry.kind, entry.executable, entry.size]
+
+# merged tree items and conflicts for one name, o, a and b are the base,
+# our and their TreeEntry or None
+def merge_entries(repo, o, a, b, theirs_name, path):
+  # one side unchanged, or both changed the same way
+  if same_entry(a, b) or same_entry(o, b):
+    return ([tree_item(a)] if a else []), []
+  if same_entry(o, a):
+    return ([tree_item(b)] if b else []), []
+  # both sides changed it, differently
+  if a and b and a.kind == "tree" and b.kind == "tree":
+    sha, conflicts = merge_trees(repo, o.sha if o and o.kind == "tree" else None, a.sha, b.sha, theirs_name, path)
+    return ([[a.name, sha, "tree", False, None]] if sha else []), conflicts
+  if a and b and a.kind == "blob" and b.kind == "blob":
+    executable = b.executable if a.executable == (o.executable if o else False) else a.executable
+    if a.sha == b.sha:
+      return [[a.name, a.sha, "blob", executable, a.size]], []
+    base_data = repo.object_read(o.sha).blobbytes if o and o.kind == "blob" else b""
+    ours, theirs = repo.object_read(a.sha).blobbytes, repo.object_read(b.sha).blobbytes
+    if b"\x00" in base_data + ours + theirs:
+      # binary, keep both
+      return [tree_item(a), tree_item(b, f"{b.name}.{theirs_name}")], [(path, "binary")]
+    data, conflict = merge_lines(base_data, ours, theirs, theirs_name)
+    blob = GitBlob(data)
+    sha = repo.object_write(blob)
+    return [[a.name, sha, "blob", executable, len(data)]], [(path, "content")] if conflict else []
+  if a is None or b is None:
+    # changed on one side, deleted on the other, keep the change
+    kept = a or b
+    return [tree_item(kept)], [(path, "modify/delete")]
+  # a file on one side and a dir on the other, keep both
+  return [tree_item(a), tree_item(b, f"{b.name}.{theirs_name}")], [(path, "file/directory")]
+
+
+# three-way merge of the lines of base, ours and theirs (bytes), using the
+# matches of base against each side to find the stable regions (diff3)
+# returns (merged bytes, whether there were conflicts)
+def merge_lines(base, ours, theirs, theirs_name="theirs"):
+  o, a, b = base.splitlines(keepends=True), ours.splitlines(keepends=True), theirs.splitlines(keepends=True)
+  ma, mb = base_matches(o, a), base_matches(o, b)
+  out, conflict = [], False
+  io = ia = ib = 0
+  while True:
+    # stable run, matching on both sides
+    j = 0
+    while io + j < len(o) and ma.get(io + j) == ia + j and mb.get(io + j) == ib + j:
+      j += 1
+    if j:
+      out.extend(o[io:io + j])
+      io, ia, ib = io + j, ia + j, ib + j
+      continue
+    # unstable chunk, up to the next base line matched on both sides
+    k = io
+    while k < len(o) and not (k in ma and k in mb):
+      k += 1
+    ka, kb = (ma[k], mb[k]) if k < len(o) else (len(a), len(b))
+    co, ca, cb = o[io:k], a[ia:ka], b[ib:kb]
+    if ca == cb or cb == co:
+      out.extend(ca)
+    elif ca == co:
+      out.extend(cb)
+    else:
+      conflict = True
+      out.append(b"<<<<<<< HEAD\n")
+      out.extend(with_newline(ca))
+      out.append(b"=======\n")
+      out.extend(with_newline(cb))
+      out.append(b">>>>>>> " + theirs_name.encode() + b"\n")
+    if k >= len(o):
+      break
+    io, ia, ib = k, ka, kb
+  return b"".join(out), conflict
+
+# base line index -> index of the line it matches in other, from the runs
+# of the Myers line diff
+def base_matches(base, other):
+  matches = {}
+  for i, j, n in line_matches(base, other):
+    for d in range(n):
+      matches[i + d] = j + d
+  return matches
+
+# lines with a newline at the end of the last one, for conflict markers
+def with_newline(lines):
+  if lines and not lines[-1].endswith(b"\n"):
+    return lines[:-1] + [lines[-1] + b"\n"]
+  return lines
@@ -0,0 +1,531 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from tinygit.utils import *
+from tinygit.trace import *
+
+mmap, hashlib = LazyModule("mmap"), LazyModule("hashlib")
+
+# pack file (.pack)
+#   header   b"TGPK", version (u32), object count (u32)
+#   entries  ENTRY_FULL (u8), zlib compressed "<kind> <size>\0<data>"
+#            ENTRY_DELTA (u8), base sha (20 bytes), zlib compressed delta
+# index file (.idx)
+#   header   b"TGIX", version (u32), object count (u32)
+#   fanout   256 x u32, number of objects whose first sha byte is <= i
+#   table    count x (sha (20 bytes), offset (u64), length (u64)), sorted by sha
+PACK_MAGIC = b"TGPK"
+IDX_MAGIC = b"TGIX"
+PACK_VERSION = 1
+HEADER = struct.Struct(">4sII")
+FANOUT = struct.Struct(">256I")
+ENTRY = struct.Struct(">20sQQ")
+ENTRY_FULL = 0
+ENTRY_DELTA = 1
+
+# delta search parameters, see delta_search
+DELTA_WINDOW = 10
+DELTA_MAX_DEPTH = 50
+DELTA_MIN_SIZE = 64
+DELTA_MAX_SIZE = 16 * 1024 * 1024
+DELTA_BLOCK = 16
+DELTA_PROBES = 16
+
+# bytes of reconstructed delta bases kept around per pack
+BASE_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class GitPack:
+  """A pack of objects and its memory mapped index.
+
+  Objects are found by binary searching the sorted sha table of the index,
+  narrowed down by the fanout table, so a lookup costs no syscalls.
+
+  Attributes:
+      packpath (str): Path of the .pack file.
+      idxpath (str): Path of the .idx file.
+      count (int): Number of objects in the pack.
+
+  """
+
+  def __init__(self, packpath):
+    self.packpath = packpath
+    self.idxpath = packpath[:-len(".pack")] + ".idx"
+    with open(self.idxpath, "rb") as f:
+      self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with open(self.packpath, "rb") as f:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, self.count = HEADER.unpack_from(self.idx, 0)
+    if magic != IDX_MAGIC or version != PACK_VERSION:
+      raise Exception(f"Pack index corrupted {self.idxpath}")
+    self.fanout = FANOUT.unpack_from(self.idx, HEADER.size)
+    self.table = HEADER.size + FANOUT.size
+    self.bases = OrderedDict()
+    self.bases_size = 0
+    self.bases_lock = threading.Lock()
+
+  def close(self):
+    self.idx.close()
+    self.data.close()
+
+  # binary sha of the i-th entry of the sorted table
+  def sha_at(self, i):
+    start = self.table + i * ENTRY.size
+    return self.idx[start:start + 20]
+
+  # first table position whose sha is >= binsha
+  def bisect(self, binsha):
+    lo = self.fanout[binsha[0] - 1] if binsha[0] > 0 else 0
+    hi = self.fanout[binsha[0]]
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self.sha_at(mid) < binsha:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  # (offset, length) of an object or None if it isn't in this pack
+  def find(self, sha):
+    binsha = bytes.fromhex(sha)
+    i = self.bisect(binsha)
+    if i < self.count and self.sha_at(i) == binsha:
+      _, offset, length = ENTRY.unpack_from(self.idx, self.table + i * ENTRY.size)
+      return offset, length
+    return None
+
+  def contains(self, sha):
+    return len(sha) == 40 and self.find(sha) is not None
+
+  # all shas starting with the hex prefix
+  def shas_with_prefix(self, prefix):
+    return prefix_match(self.sha_at, self.count, prefix)
+
+  # shas sorting right before and after sha, other than sha itself
+  def neighbors(self, sha):
+    return sorted_neighbors(self.sha_at, self.count, sha)
+
+  def shas(self):
+    return [self.sha_at(i).hex() for i in range(self.count)]
+
+  # decompressed "<kind> <size>\0<data>" of an object or None
+  def read_raw(self, sha):
+    if self.find(sha) is None:
+      return None
+    # follow the delta chain down to a full entry or a cached base
+    chain = []
+    while True:
+      with self.bases_lock:
+        raw = self.bases.get(sha)
+        if raw is not None:
+          self.bases.move_to_end(sha)
+          break
+      found = self.find(sha)
+      if found is None:
+        raise Exception(f"Object corrupted, missing delta base {sha}")
+      offset, length = found
+      entrytype = self.data[offset]
+      trace_count("bytes.read.compressed", length)
+      if entrytype == ENTRY_FULL:
+        raw = zlib.decompress(self.data[offset + 1:offset + length])
+        break
+      elif entrytype == ENTRY_DELTA:
+        chain.append((sha, zlib.decompress(self.data[offset + 21:offset + length])))
+        sha = self.data[offset + 1:offset + 21].hex()
+      else:
+        raise Exception(f"Object corrupted {sha}")
+    # apply the deltas back up, caching every base along the way
+    while chain:
+      self.cache_base(sha, raw)
+      sha, delta = chain.pop()
+      raw = delta_apply(raw, delta)
+    return raw
+
+  # (kind, size) of an object or None, without reconstructing it
+  # a delta has the kind of its base and records the size of its raw object
+  def info(self, sha):
+    found = self.find(sha)
+    if found is None:
+      return None
+    offset, length = found
+    raw_size = None
+    while self.data[offset] == ENTRY_DELTA:
+      if raw_size is None:
+        head = inflate_header(self.chunks(offset + 21, length - 21), 32)
+        _, i = varint_decode(head, 0)
+        raw_size, _ = varint_decode(head, i)
+      found = self.find(self.data[offset + 1:offset + 21].hex())
+      if found is None:
+        raise Exception(f"Object corrupted, missing delta base of {sha}")
+      offset, length = found
+    kind, size, _ = parse_header(inflate_header(self.chunks(offset + 1, length - 1)))
+    if raw_size is not None:
+      # the raw object is "<kind> <size>\0" followed by size bytes
+      rest = raw_size - len(kind) - 2
+      size = next(rest - d for d in range(1, 21) if len(str(rest - d)) == d)
+    return kind, size
+
+  # memoryview chunks of length bytes of the pack, from offset
+  def chunks(self, offset, length, size=256):
+    view = memoryview(self.data)[offset:offset + length]
+    return (view[i:i + size] for i in range(0, len(view), size))
+
+  # iterator over the decompressed raw object in chunks, or None
+  # whole objects are inflated straight from the map, deltas need their base
+  # in memory anyway so they are reconstructed in one piece
+  def stream_raw(self, sha):
+    found = self.find(sha)
+    if found is None:
+      return None
+    offset, length = found
+    if self.data[offset] != ENTRY_FULL:
+      return iter([self.read_raw(sha)])
+    return inflate(self.chunks(offset + 1, length - 1, CHUNK_SIZE))
+
+  # remember a reconstructed delta base, evicting least recently used ones
+  def cache_base(self, sha, raw):
+    with self.bases_lock:
+      if sha in self.bases or len(raw) > BASE_CACHE_SIZE:
+        return
+      self.bases[sha] = raw
+      self.bases_size += len(raw)
+      while self.bases_size > BASE_CACHE_SIZE:
+        _, old = self.bases.popitem(last=False)
+        self.bases_size -= len(old)
+
+
+# loose object index (objects/loose-index)
+#   header   b"TGLX", version (u32), sorted count (u32)
+#   sorted   sorted count x sha (20 bytes)
+#   tail     shas (20 bytes) of loose objects written since, unsorted
+LOOSE_MAGIC = b"TGLX"
+LOOSE_VERSION = 1
+LOOSE_HEADER = struct.Struct(">4sII")
+
+# the tail is sorted in once it grows past this
+LOOSE_TAIL_MAX = 4096
+
+
+class LooseIndex:
+  """Sorted ids of the loose objects, so prefixes resolve by bisection.
+
+  Writers append the ids of new loose objects to an unsorted tail, which is
+  sorted into the table once it gets long. Ids of objects removed since are
+  only dropped on rebuild, so callers must check the objects still exist.
+
+  Attributes:
+      path (str): Path of the loose-index file.
+      count (int): Number of ids in the sorted table.
+      tail (list): Sorted binary ids from the tail.
+
+  """
+
+  def __init__(self, path, scan):
+    self.path = path
+    self.data = None
+    self.count = 0
+    self.tail = []
+    if not os.path.isfile(path):
+      self.rebuild(scan())
+    else:
+      self.load()
+
+  def load(self):
+    with open(self.path, "rb") as f:
+      self.data = f.read()
+    magic, version, count = LOOSE_HEADER.unpack_from(self.data, 0)
+    end = LOOSE_HEADER.size + count * 20
+    if magic != LOOSE_MAGIC or version != LOOSE_VERSION or len(self.data) < end:
+      raise Exception(f"Loose object index corrupted {self.path}")
+    self.count = count
+    tail = self.data[end:len(self.data) - (len(self.data) - end) % 20]
+    self.tail = sorted({tail[i:i + 20] for i in range(0, len(tail), 20)})
+    if len(self.tail) > LOOSE_TAIL_MAX:
+      self.rebuild([self.sha_at(i).hex() for i in range(self.count)] + [b.hex() for b in self.tail])
+
+  def rebuild(self, shas):
+    binshas = sorted({bytes.fromhex(sha) for sha in shas})
+    tmppath = self.path + f".tmp{os.getpid()}"
+    with open(tmppath, "wb") as f:
+      f.write(LOOSE_HEADER.pack(LOOSE_MAGIC, LOOSE_VERSION, len(binshas)))
+      f.write(b"".join(binshas))
+    os.replace(tmppath, self.path)
+    self.load()
+
+  def sha_at(self, i):
+    start = LOOSE_HEADER.size + i * 20
+    return self.data[start:start + 20]
+
+  def shas_with_prefix(self, prefix):
+    return prefix_match(self.sha_at, self.count, prefix) + \
+      prefix_match(self.tail.__getitem__, len(self.tail), prefix)
+
+  def neighbors(self, sha):
+    return sorted_neighbors(self.sha_at, self.count, sha) + \
+      sorted_neighbors(self.tail.__getitem__, len(self.tail), sha)
+
+
+# record a new loose object in the loose index, if there is one yet
+# a 20 byte O_APPEND write is atomic, so concurrent writers are fine
+def loose_index_append(path, sha):
+  if not os.path.isfile(path):
+    return
+  fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+  try:
+    os.write(fd, bytes.fromhex(sha))
+  finally:
+    os.close(fd)
+
+
+# first position in a sorted table of binary shas whose sha is >= binsha
+def sorted_bisect(sha_at, lo, hi, binsha):
+  while lo < hi:
+    mid = (lo + hi) // 2
+    if sha_at(mid) < binsha:
+      lo = mid + 1
+    else:
+      hi = mid
+  return lo
+
+
+# hex shas of a sorted table of binary shas that start with a hex prefix
+def prefix_match(sha_at, count, prefix):
+  lower = bytes.fromhex(prefix + "0" * (len(prefix) % 2))
+  ret = []
+  for i in range(sorted_bisect(sha_at, 0, count, lower), count):
+    sha = sha_at(i).hex()
+    if not sha.startswith(prefix):
+      break
+    ret.append(sha)
+  return ret
+
+
+# hex shas right before and after sha in a sorted table, other than sha
+def sorted_neighbors(sha_at, count, sha):
+  binsha = bytes.fromhex(sha)
+  i = sorted_bisect(sha_at, 0, count, binsha)
+  ret = [sha_at(i - 1).hex()] if i > 0 else []
+  if i < count and sha_at(i) == binsha:
+    i += 1
+  if i < count:
+    ret.append(sha_at(i).hex())
+  return ret
+
+
+def varint_encode(n):
+  out = bytearray()
+  while n >= 0x80:
+    out.append((n & 0x7f) | 0x80)
+    n >>= 7
+  out.append(n)
+  return bytes(out)
+
+
+# returns (value, position after it)
+def varint_decode(data, i):
+  n, shift = 0, 0
+  while True:
+    b = data[i]
+    i += 1
+    n |= (b & 0x7f) << shift
+    shift += 7
+    if b < 0x80:
+      return n, i
+
+
+# deltas are
+#   varint base size, varint target size, then a list of ops
+#   0x01-0x7f        insert the next n bytes
+#   0x80             copy, followed by varint offset and varint length in base
+DELTA_COPY = 0x80
+DELTA_MAX_INSERT = 0x7f
+
+
+# map of block -> offset for every aligned block of the base
+def delta_index(base):
+  index = {}
+  for i in range(0, len(base) - DELTA_BLOCK + 1, DELTA_BLOCK):
+    index.setdefault(base[i:i + DELTA_BLOCK], i)
+  return index
+
+
+# length of the common run of a[i:] and b[j:]
+def match_length(a, i, b, j):
+  n = 0
+  step = 4096
+  limit = min(len(a) - i, len(b) - j)
+  while step:
+    while n + step <= limit and a[i + n:i + n + step] == b[j + n:j + n + step]:
+      n += step
+    step //= 8
+  return n
+
+
+# whether a delta turning base into target can't be under max_size
+# with max_size at most half of target, such a delta copies at least half
+# of target from base, and every block inside a copy occurs in base, so if
+# none of a few blocks spread over target does, the pair isn't worth
+# indexing and searching byte by byte
+def delta_hopeless(base, target, max_size):
+  if 2 * max_size > len(target) or len(target) < DELTA_PROBES * DELTA_BLOCK:
+    return False
+  step = len(target) // DELTA_PROBES
+  return not any(base.find(target[k:k + DELTA_BLOCK]) >= 0 for k in range(0, len(target) - DELTA_BLOCK + 1, step))
+
+
+# delta turning base into target, or None if it would exceed max_size
+def delta_create(base, target, index=None, max_size=None):
+  if index is None:
+    index = delta_index(base)
+  if max_size is None:
+    max_size = float("inf")
+  out = bytearray(varint_encode(len(base)) + varint_encode(len(target)))
+  insert = bytearray()
+
+  def flush():
+    for k in range(0, len(insert), DELTA_MAX_INSERT):
+      chunk = insert[k:k + DELTA_MAX_INSERT]
+      out.append(len(chunk))
+      out.extend(chunk)
+    insert.clear()
+
+  i = 0
+  while i < len(target):
+    offset = index.get(target[i:i + DELTA_BLOCK])
+    if offset is None:
+      insert.append(target[i])
+      i += 1
+      if len(out) + len(insert) > max_size:
+        return None
+      continue
+    # grow the match backwards into pending inserts, then forwards
+    while insert and offset > 0 and base[offset - 1] == insert[-1]:
+      insert.pop()
+      offset -= 1
+      i -= 1
+    length = match_length(base, offset, target, i)
+    flush()
+    out.append(DELTA_COPY)
+    out.extend(varint_encode(offset))
+    out.extend(varint_encode(length))
+    i += length
+    if len(out) > max_size:
+      return None
+  flush()
+  if len(out) > max_size:
+    return None
+  return bytes(out)
+
+
+def delta_apply(base, delta):
+  base_size, i = varint_decode(delta, 0)
+  target_size, i = varint_decode(delta, i)
+  if base_size != len(base):
+    raise Exception("Delta corrupted, base size mismatch")
+  out = bytearray()
+  while i < len(delta):
+    op = delta[i]
+    i += 1
+    if op == DELTA_COPY:
+      offset, i = varint_decode(delta, i)
+      length, i = varint_decode(delta, i)
+      out.extend(base[offset:offset + length])
+    elif 0 < op <= DELTA_MAX_INSERT:
+      out.extend(delta[i:i + op])
+      i += op
+    else:
+      raise Exception("Delta corrupted, bad op")
+  if len(out) != target_size:
+    raise Exception("Delta corrupted, target size mismatch")
+  return bytes(out)
+
+
+# order of the delta search, by kind, name and size (largest first), so
+# versions of the same file end up next to each other
+# infos is sha -> (kind, size), names sha -> path name
+def delta_order(infos, names):
+  return sorted(infos, key=lambda sha: (infos[sha][0], names.get(sha, ""), -infos[sha][1], sha))
+
+
+# pick delta bases for (sha, raw) objects, coming in delta_order
+# each one is tried against the previous DELTA_WINDOW objects of the same
+# kind, only those are kept in memory
+# yields (sha, raw, (base sha, delta) or None)
+def delta_search(objects):
+  depth = {}
+  window = []   # [sha, kind, raw, index built on first use]
+  for sha, raw in objects:
+    kind = raw[:raw.find(b' ')]
+    window = [w for w in window if w[1] == kind]
+    best = None
+    if DELTA_MIN_SIZE <= len(raw) <= DELTA_MAX_SIZE:
+      for w in reversed(window):
+        base_sha, _, base_raw, base_index = w
+        if depth.get(base_sha, 0) >= DELTA_MAX_DEPTH or not DELTA_MIN_SIZE <= len(base_raw) <= DELTA_MAX_SIZE:
+          continue
+        # a delta can't be smaller than the size difference
+        if abs(len(base_raw) - len(raw)) > len(raw) // 2:
+          continue
+        max_size = len(best[1]) - 1 if best else len(raw) // 2
+        if delta_hopeless(base_raw, raw, max_size):
+          continue
+        if base_index is None:
+          base_index = w[3] = delta_index(base_raw)
+        delta = delta_create(base_raw, raw, base_index, max_size)
+        if delta is not None:
+          best = (base_sha, delta)
+    if best:
+      depth[sha] = depth.get(best[0], 0) + 1
+    yield sha, raw, best
+    window.append([sha, kind, raw, None])
+    window = window[-DELTA_WINDOW:]
+
+
+# write a pack of (sha, "<kind> <size>\0<data>") objects to the pack dir
+# objects are written as they come, so they can be read lazily, and should
+# come in delta_order for good delta bases
+# returns path of the new .pack file
+def pack_write(packdir, objects):
+  if not os.path.isdir(packdir):
+    os.makedirs(packdir)
+  # the name depends on every sha, so the pack is written under a temporary one
+  tmppack = os.path.join(packdir, f"tmp-pack-{os.getpid()}")
+  tmpidx = os.path.join(packdir, f"tmp-idx-{os.getpid()}")
+
+  entries = []
+  with open(tmppack, "wb") as f:
+    f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, 0))
+    offset = HEADER.size
+    for sha, raw, best in delta_search(objects):
+      if best:
+        base_sha, delta = best
+        entry = bytes([ENTRY_DELTA]) + bytes.fromhex(base_sha) + zlib.compress(delta)
+      else:
+        entry = bytes([ENTRY_FULL]) + zlib.compress(raw)
+      f.write(entry)
+      entries.append((bytes.fromhex(sha), offset, len(entry)))
+      offset += len(entry)
+    f.seek(0)
+    f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(entries)))
+  entries.sort()
+  name = hashlib.sha1("".join(binsha.hex() for binsha, _, _ in entries).encode()).hexdigest()
+  packpath = os.path.join(packdir, f"pack-{name}.pack")
+  idxpath = os.path.join(packdir, f"pack-{name}.idx")
+
+  fanout = [0] * 256
+  for binsha, _, _ in entries:
+    fanout[binsha[0]] += 1
+  for i in range(1, 256):
+    fanout[i] += fanout[i - 1]
+  with open(tmpidx, "wb") as f:
+    f.write(HEADER.pack(IDX_MAGIC, PACK_VERSION, len(entries)))
+    f.write(FANOUT.pack(*fanout))
+    for entry in entries:
+      f.write(ENTRY.pack(*entry))
+
+  # the index goes last, readers ignore packs without one
+  os.replace(tmppack, packpath)
+  os.replace(tmpidx, idxpath)
+  return packpath
@@ -1,12 +1,77 @@
 import os 
 import sys
-import configparser
-import hashlib
-import zlib
 import collections
 import json
+import threading
+import heapq
+import bisect
 
 from tinygit.utils import *
+from tinygit.pack import *
+from tinygit.graph import *
+from tinygit.index import *
+from tinygit.trace import *
+
+hashlib = LazyModule("hashlib")
+
+# bytes of decoded objects kept in memory per repo, see ObjectCache
+BLOB_CACHE_SIZE = 64 * 1024 * 1024
+OBJECT_CACHE_SIZE = 32 * 1024 * 1024
+
+# tinygit gc, see cmd_gc
+GC_GRACE = 14 * 24 * 60 * 60
+GC_PACKS_MAX = 8
+GC_AUTO_LOOSE = 1000
+
+# shortest sha prefix that is resolved or printed, so short branch and tag
+# names aren't taken for prefixes, see GitRepo.resolve_obj_abbr
+ABBREV_MIN = 4
+
+# objects checked per task by tinygit fsck workers
+FSCK_BATCH = 256
+
+
+class ObjectCache:
+  """Byte bounded LRU cache of decoded objects, keyed by sha.
+
+  Objects handed out are shared between readers and must not be mutated.
+
+  Attributes:
+      budget (int): Maximum total size in bytes of the cached objects.
+      size (int): Current total size in bytes of the cached objects.
+      hits (int): Number of lookups answered from the cache.
+      misses (int): Number of objects that had to be read from the db.
+
+  """
+
+  def __init__(self, budget):
+    self.budget = budget
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, sha):
+    with self.lock:
+      entry = self.entries.get(sha)
+      if entry is None:
+        return None
+      self.entries.move_to_end(sha)
+      self.hits += 1
+      return entry[0]
+
+  def put(self, sha, obj, size):
+    with self.lock:
+      self.misses += 1
+      if size > self.budget or sha in self.entries:
+        return
+      self.entries[sha] = (obj, size)
+      self.size += size
+      while self.size > self.budget:
+        _, (_, old_size) = self.entries.popitem(last=False)
+        self.size -= old_size
+
 
 # Repo state fetched upon invocatio of all commands
 class GitRepo:
@@ -26,64 +91,228 @@ class GitRepo:
   def __init__(self, workdir):
     self.workdir = workdir
     self.tinygitdir = os.path.join(workdir, ".tinygit")
+    self.packs = None
+    self.loose = None
+    self.graph = None
+    self.octopus = {}
+    self.head = None
+    self.loose_refs = {}
+    self.packed = None
+    self.stat_index = None
+    self.signatures = {}
+    self.blob_cache = ObjectCache(BLOB_CACHE_SIZE)
+    self.object_cache = ObjectCache(OBJECT_CACHE_SIZE)
     
     if not os.path.isdir(self.tinygitdir):
       raise Exception("Not a git repository %s" % workdir)
 
+  # drop state other processes may have changed since it was loaded, so a 
+  # long lived repo (see tinygit daemon) sees the same db as a fresh one
+  # objects never change once written, so the object caches are kept
+  def refresh(self):
+    self.head = None
+    self.loose_refs = {}
+    self.packed = None
+    if self.changed("objects", "loose-index"):
+      self.loose = None
+    if self.changed("objects", "pack"):
+      for pack in self.packs or []:
+        pack.close()
+      self.packs = None
+    if self.changed("commit-graph"):
+      if self.graph is not None:
+        self.graph.close()
+      self.graph = None
+
+  # whether a file in the tinygit dir changed since the last call
+  def changed(self, *path):
+    signature = file_signature(self.tinygitdir, *path)
+    changed = self.signatures.get(path) != signature
+    self.signatures[path] = signature
+    return changed
+
+  # stat cache of the work directory, reused while the index file is unchanged
+  def index(self):
+    signature = file_signature(self.tinygitdir, "index")
+    if self.stat_index is None or self.stat_index.signature != signature:
+      self.stat_index = GitIndex(self)
+    self.stat_index.seen = set()
+    return self.stat_index
+
   def get_head(self):
-    return json.loads(read_file(self.tinygitdir, "HEAD"))
+    if self.head is None:
+      self.head = json.loads(read_file(self.tinygitdir, "HEAD"))
+    return dict(self.head)
 
   def set_head(self, type, id):
     write_file(self.tinygitdir, "HEAD", data=json.dumps({"type": type, "id": id}, indent=2))
+    self.head = {"type": type, "id": id}
 
   # obtain sha of commit head points to or None if no commits yet
   def resolve_head(self):
     head = self.get_head()
     if head["type"] == "branch":
-      if file_exists(self.tinygitdir, "refs", "heads", head["id"]):
-        return read_file(self.tinygitdir, "refs", "heads", head["id"])
-      else:
-        return None   # no commits yet
+      return self.resolve_branch(head["id"])   # None if no commits yet
     elif head["type"] == "commit":
       return head["id"]
 
   # sha from branch name
   def resolve_branch(self, name):
-    if file_exists(self.tinygitdir, "refs", "heads", name):
-      return read_file(self.tinygitdir, "refs", "heads", name)
-    else:
-      return None
+    return self.ref_resolve("refs/heads/" + name)
 
   # sha from tag name
   def resolve_tag(self, name):
-    if file_exists(self.tinygitdir, "refs", "tags", name):
-      return read_file(self.tinygitdir, "refs", "tags", name)
-    else:
-      return None
+    return self.ref_resolve("refs/tags/" + name)
+
+  # sha a ref (e.g. refs/heads/master) points to or None
+  # loose refs win over packed ones, each is read at most once per repo
+  def ref_resolve(self, ref):
+    if ref not in self.loose_refs:
+      self.loose_refs[ref] = read_file(self.tinygitdir, *ref.split("/"))
+    if self.loose_refs[ref] is not None:
+      return self.loose_refs[ref]
+    names, shas = self.packed_refs()
+    i = bisect.bisect_left(names, ref)
+    if i < len(names) and names[i] == ref:
+      return shas[i]
+    return None
+
+  # (sorted ref names, shas) from .tinygit/packed-refs, read once per repo
+  # each line of the file is "<sha> <ref>", sorted by ref
+  def packed_refs(self):
+    if self.packed is None:
+      names, shas = [], []
+      for line in (read_file(self.tinygitdir, "packed-refs") or "").splitlines():
+        sha, ref = line.split(" ", 1)
+        names.append(ref)
+        shas.append(sha)
+      self.packed = (names, shas)
+    return self.packed
+
+  def packed_refs_write(self, refs):
+    data = "".join(f"{refs[ref]} {ref}\n" for ref in sorted(refs))
+    write_file_atomic(self.tinygitdir, "packed-refs", data=data)
+    names = sorted(refs)
+    self.packed = (names, [refs[ref] for ref in names])
+
+  def ref_write(self, ref, sha):
+    write_file(self.tinygitdir, *ref.split("/"), data=sha)
+    self.loose_refs[ref] = sha
+
+  # remove a ref, loose and packed
+  def ref_delete(self, ref):
+    if file_exists(self.tinygitdir, *ref.split("/")):
+      os.remove(os.path.join(self.tinygitdir, *ref.split("/")))
+    self.loose_refs[ref] = None
+    names, shas = self.packed_refs()
+    if ref in names:
+      self.packed_refs_write({n: sha for n, sha in zip(names, shas) if n != ref})
+
+  # names of branches or tags, kind is "heads" or "tags", hierarchical ones
+  # like feature/x included
+  def ref_names(self, kind):
+    names = {name for name, _ in self.loose_ref_files(kind)}
+    prefix = "refs/" + kind + "/"
+    names.update(ref[len(prefix):] for ref in self.packed_refs()[0] if ref.startswith(prefix))
+    return sorted(names)
+
+  # (name, path) of the loose ref files under refs/<kind>, in subdirectories too
+  def loose_ref_files(self, kind):
+    root = os.path.join(self.tinygitdir, "refs", kind)
+    ret = []
+    for dirpath, _, filenames in os.walk(root):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        ret.append((os.path.relpath(path, root).replace(os.sep, "/"), path))
+    return ret
 
   # MIGHT BE A BUG HERE
   def resolve_obj(self, name):
-    if file_exists(self.tinygitdir, "objects", name[0:2], name[2:]):
+    if self.object_exists(name):
       return name
     return None
 
-  # sha from abbr sha
+  # shas from abbr sha, at least ABBREV_MIN long, loose or packed
   def resolve_obj_abbr(self, name):
+    if len(name) < ABBREV_MIN or not all(c in "0123456789abcdef" for c in name):
+      return []
+    ret = set(sha for sha in self.loose_index().shas_with_prefix(name) 
+              if file_exists(self.tinygitdir, "objects", sha[0:2], sha[2:]))
+    for pack in self.pack_list():
+      ret.update(pack.shas_with_prefix(name))
+    return sorted(ret)
+
+  # shortest prefix of sha, at least minimum (and ABBREV_MIN) long, that no
+  # other object shares
+  def abbrev(self, sha, minimum=ABBREV_MIN):
+    neighbors = self.loose_index().neighbors(sha)
+    for pack in self.pack_list():
+      neighbors.extend(pack.neighbors(sha))
+    length = max(minimum, ABBREV_MIN)
+    for other in neighbors:
+      common = 0
+      while common < len(sha) and sha[common] == other[common]:
+        common += 1
+      length = max(length, common + 1)
+    return sha[:length]
+
+  # sorted index of the loose object ids, loaded once per repo
+  def loose_index(self):
+    if self.loose is None:
+      self.loose = LooseIndex(os.path.join(self.tinygitdir, "objects", "loose-index"), self.loose_object_list)
+    return self.loose
+
+  # packs in the db, opened once per repo
+  def pack_list(self):
+    if self.packs is None:
+      self.packs = []
+      if dir_exists(self.tinygitdir, "objects", "pack"):
+        for entry in sorted(scan_dir(self.tinygitdir, "objects", "pack"), key=lambda e: e.name):
+          if entry.name.endswith(".pack") and file_exists(entry.path[:-len(".pack")] + ".idx"):
+            self.packs.append(GitPack(entry.path))
+    return self.packs
+
+  # shas of all objects stored as loose files
+  def loose_object_list(self):
     ret = []
-    if dir_exists(self.tinygitdir, "objects", name[0:2]):
-      for entry in scan_dir(self.tinygitdir, "objects", name[0:2]):
-        if entry.name.startswith(name[2:]):
-          ret.append(name[0:2] + entry.name)
+    for fanout in scan_dir(self.tinygitdir, "objects"):
+      if fanout.is_dir() and len(fanout.name) == 2:
+        ret.extend(fanout.name + entry.name for entry in scan_dir(fanout.path) if len(entry.name) == 38)
     return ret
 
   def object_exists(self, sha):
-    return file_exists(self.tinygitdir, "objects", sha[0:2], sha[2:])
+    if file_exists(self.tinygitdir, "objects", sha[0:2], sha[2:]):
+      return True
+    return any(pack.contains(sha) for pack in self.pack_list())
 
-  # read an object of any kind from the db
+  # read an object of any kind, from the caches or the db
+  # blobs are cached separately so they can't push out trees and commits
+  @traced("object_read")
   def object_read(self, sha):
-    # read binary
-    b =  read_file(self.tinygitdir, "objects", sha[0:2], sha[2:], mode="rb")
-    raw = zlib.decompress(b)
+    obj = self.object_cache.get(sha) or self.blob_cache.get(sha)
+    if obj is not None:
+      trace_count("cache.hits")
+      return obj
+    trace_count("cache.misses")
+    obj, size = self.object_read_db(sha)
+    cache = self.blob_cache if obj.kind == "blob" else self.object_cache
+    cache.put(sha, obj, size)
+    return obj
+
+  # read an object of any kind from the db, packs first then loose
+  # returns (object, size of its raw form)
+  def object_read_db(self, sha):
+    raw = None
+    for pack in self.pack_list():
+      raw = pack.read_raw(sha)
+      if raw is not None:
+        break
+    if raw is None:
+      b = read_file(self.tinygitdir, "objects", sha[0:2], sha[2:], mode="rb")
+      if b is None:
+        raise Exception(f"Object {sha} not found")
+      trace_count("bytes.read.compressed", len(b))
+      raw = zlib.decompress(b)
     # read type
     ispace = raw.find(b' ')
     kind = raw[0:ispace].decode("ascii")
@@ -98,16 +327,184 @@ class GitRepo:
     elif kind=='tree'   : c=GitTree
     elif kind=='tag'    : c=GitTag
     else: raise Exception("Object corrupted")
-    return c(raw[inull + 1:])
+    trace_count("objects.read." + kind)
+    trace_count("bytes.read.uncompressed", len(raw))
+    return c(raw[inull + 1:]), len(raw)
+
+  # (kind, size) of an object, only its header is inflated
+  def object_info(self, sha):
+    for pack in self.pack_list():
+      info = pack.info(sha)
+      if info is not None:
+        return info
+    if not file_exists(self.tinygitdir, "objects", sha[0:2], sha[2:]):
+      raise Exception(f"Object {sha} not found")
+    with open(os.path.join(self.tinygitdir, "objects", sha[0:2], sha[2:]), "rb") as f:
+      kind, size, _ = parse_header(inflate_header(read_chunks(f, 256)))
+    return kind, size
+
+  # typed entries (TreeEntry) of a tree
+  # entries of untyped trees from older repos get their kind and size from
+  # the header of the object they point to
+  def tree_read(self, sha):
+    ret = []
+    for item in self.object_read(sha).items:
+      if len(item) >= 5:
+        ret.append(TreeEntry(*item[:5]))
+      else:
+        kind, size = self.object_info(item[1])
+        # the mode wasn't recorded, None so it never counts as a change
+        ret.append(TreeEntry(item[0], item[1], kind, None, size if kind == "blob" else None))
+    return ret
+
+  # open an object of any kind for streaming, without reading it whole
+  # returns (kind, size, iterator over chunks of its data)
+  def object_open(self, sha):
+    stream = None
+    for pack in self.pack_list():
+      stream = pack.stream_raw(sha)
+      if stream is not None:
+        break
+    if stream is None:
+      if not self.object_exists(sha):
+        raise Exception(f"Object {sha} not found")
+      stream = self.loose_stream(sha)
+    # read header
+    head = b""
+    for chunk in stream:
+      head += chunk
+      if b'\x00' in head:
+        break
+    kind, size, start = parse_header(head)
+
+    def chunks():
+      n = len(head) - start
+      yield head[start:]
+      for chunk in stream:
+        n += len(chunk)
+        yield chunk
+      if n != size:
+        raise Exception("Object corrupted")
+    return kind, size, chunks()
+
+  def loose_stream(self, sha):
+    with open(os.path.join(self.tinygitdir, "objects", sha[0:2], sha[2:]), "rb") as f:
+      yield from inflate(read_chunks(f))
+
+  # write a blob's data to path in chunks
+  @traced("blob_checkout")
+  def blob_checkout(self, sha, path, executable=False):
+    kind, size, chunks = self.object_open(sha)
+    if kind != "blob":
+      raise Exception(f"Object {sha} is a {kind}, not a blob")
+    with open(path, "wb") as f:
+      for chunk in chunks:
+        f.write(chunk)
+    trace_count("bytes.checked_out", size)
+    if executable:
+      # executable by whoever can read it
+      mode = os.stat(path).st_mode
+      os.chmod(path, mode | (mode & 0o444) >> 2)
+
+  # hash a file as a blob in chunks, storing it in the db if write
+  # the size in the header comes from a stat, so the file must not change
+  # while it is read
+  @traced("blob_write_file")
+  def blob_write_file(self, path, write=True):
+    with open(path, "rb") as f:
+      size = os.fstat(f.fileno()).st_size
+      head = b"blob " + str(size).encode() + b'\x00'
+      h = hashlib.sha1(head)
+      out, compressor = None, None
+      if write:
+        tmppath = os.path.join(self.tinygitdir, "objects", f"tmp{os.getpid()}-{threading.get_ident()}")
+        out = open(tmppath, "wb")
+        compressor = zlib.compressobj()
+        out.write(compressor.compress(head))
+      try:
+        n = 0
+        for chunk in read_chunks(f):
+          n += len(chunk)
+          h.update(chunk)
+          if out:
+            out.write(compressor.compress(chunk))
+        if n != size:
+          raise Exception(f"File {path} changed while being read")
+        trace_count("bytes.hashed", n)
+        if out:
+          out.write(compressor.flush())
+          compressed = out.tell()
+          out.close()
+      except BaseException:
+        if out:
+          out.close()
+          os.remove(tmppath)
+        raise
+    sha = h.hexdigest()
+    if write:
+      if self.object_exists(sha):
+        os.remove(tmppath)
+        self.object_freshen(sha)
+      else:
+        os.makedirs(os.path.join(self.tinygitdir, "objects", sha[0:2]), exist_ok=True)
+        os.replace(tmppath, os.path.join(self.tinygitdir, "objects", sha[0:2], sha[2:]))
+        loose_index_append(os.path.join(self.tinygitdir, "objects", "loose-index"), sha)
+        trace_count("objects.written.blob")
+        trace_count("bytes.written.uncompressed", len(head) + size)
+        trace_count("bytes.written.compressed", compressed)
+    return sha
 
   # write an object of any kind to the db
+  @traced("object_write")
   def object_write(self, obj):
     data = obj.serialize()
     raw = obj.kind.encode() + b' ' + str(len(data)).encode() + b'\x00' + data
     sha = hashlib.sha1(raw).hexdigest()
-    write_file(self.tinygitdir, "objects", sha[0:2], sha[2:], data=zlib.compress(raw), mode="wb")  
+    if self.object_exists(sha):
+      self.object_freshen(sha)
+      return sha
+    compressed = zlib.compress(raw)
+    write_file_atomic(self.tinygitdir, "objects", sha[0:2], sha[2:], data=compressed, mode="wb")
+    loose_index_append(os.path.join(self.tinygitdir, "objects", "loose-index"), sha)
+    trace_count("objects.written." + obj.kind)
+    trace_count("bytes.written.uncompressed", len(raw))
+    trace_count("bytes.written.compressed", len(compressed))
     return sha
 
+  # mark an existing object as just written, by touching its loose file or
+  # its pack, so tinygit gc doesn't prune it while a new commit refers to it
+  def object_freshen(self, sha):
+    path = os.path.join(self.tinygitdir, "objects", sha[0:2], sha[2:])
+    if not os.path.isfile(path):
+      path = next((pack.packpath for pack in self.pack_list() if pack.contains(sha)), None)
+    try:
+      if path:
+        os.utime(path)
+    except OSError:
+      pass   # read-only db, nothing can prune it either
+
+  # sha -> kind of every object reachable from the roots
+  # blobs are never read, missing trees and commits raise
+  def reachable(self, roots):
+    graph = self.commit_graph()
+    seen = {}
+    stack = [(sha, self.object_info(sha)[0]) for sha in roots]
+    while stack:
+      sha, kind = stack.pop()
+      if sha in seen:
+        continue
+      seen[sha] = kind
+      if kind == "commit":
+        info = graph.lookup(sha)
+        if info is None:
+          commit = self.object_read(sha)
+          info = (commit.state["headers"]["tree"], commit.parents(), None)
+        stack.append((info[0], "tree"))
+        stack.extend((parent, "commit") for parent in info[1])
+      elif kind == "tree":
+        stack.extend((entry.sha, entry.kind) for entry in self.tree_read(sha))
+    return seen
+
   # objectish is either
   # 1. HEAD
   # 2. object sha (e.g. 280beb21fad764ad44e7158e0003eff4459a68f7)
@@ -115,44 +512,149 @@ class GitRepo:
   # 4. name of branch or tag (e.g. sometag, somebranch)
   def object_resolve(self, objectish):
     shas = set()
-    if objectish == "HEAD" and self.resolve_head():
-      shas.add(self.resolve_head())
-    if self.resolve_branch(objectish):
-      shas.add(self.resolve_branch(objectish))
-    if self.resolve_tag(objectish):
-      shas.add(self.resolve_tag(objectish))
-    if self.resolve_obj(objectish):
-      shas.add(self.resolve_obj(objectish))
-    if self.resolve_obj_abbr(objectish):
-      shas.update(self.resolve_obj_abbr(objectish))
+    for sha in [
+      self.resolve_head() if objectish == "HEAD" else None,
+      self.resolve_branch(objectish), 
+      self.resolve_tag(objectish), 
+      self.resolve_obj(objectish)
+    ]:
+      if sha:
+        shas.add(sha)
+    shas.update(self.resolve_obj_abbr(objectish))
     return list(shas)
 
   # commitish is objtect resolving to a commit
   def resolve_commit_alias(self, commitish):
     shas = self.object_resolve(commitish)
-    return [sha for sha in shas if not sha or self.object_read(sha).kind == "commit"]
+    return [sha for sha in shas if not sha or self.object_info(sha)[0] == "commit"]
+
+  # commit-graph of the repo, opened once per repo
+  def commit_graph(self):
+    if self.graph is None:
+      self.graph = CommitGraph(os.path.join(self.tinygitdir, "commit-graph"))
+    return self.graph
+
+  # (tree, parents, generation) of a commit, from the commit-graph or, for
+  # the commits with more than two parents it doesn't store, from the commit
+  # object, with the generation taken from its parents
+  def commit_info(self, sha):
+    info = self.commit_graph().lookup(sha) or self.octopus.get(sha)
+    if info is None:
+      commit = self.object_read(sha)
+      parents = commit.parents()
+      generation = 1 + max((self.commit_info(parent)[2] for parent in parents), default=0)
+      info = self.octopus[sha] = (commit.state["headers"]["tree"], parents, generation)
+    return info
+
+  # lazily walk the commits reachable from sha, highest generation first
+  # so a commit always comes before its parents
+  def commit_walk(self, sha):
+    self.commit_graph_update([sha])
+    heap, seen = [(-self.commit_info(sha)[2], sha)], {sha}
+    while heap:
+      _, sha = heapq.heappop(heap)
+      yield sha
+      for parent in self.commit_info(sha)[1]:
+        if parent not in seen:
+          seen.add(parent)
+          heapq.heappush(heap, (-self.commit_info(parent)[2], parent))
+
+  # add commits, and any of their ancestors that are missing, to the commit-graph
+  def commit_graph_update(self, shas):
+    graph = self.commit_graph()
+    entries = {}
+    def generation(sha):
+      return entries[sha][3] if sha in entries else self.commit_info(sha)[2]
+    # parents are added before their children
+    stack = list(shas)
+    while stack:
+      sha = stack[-1]
+      if sha in entries or sha in graph or sha in self.octopus:
+        stack.pop()
+        continue
+      commit = self.object_read(sha)
+      parents = commit.parents()
+      missing = [p for p in parents if p not in entries and p not in graph and p not in self.octopus]
+      if missing:
+        stack.extend(missing)
+        continue
+      stack.pop()
+      entries[sha] = (sha, commit.state["headers"]["tree"], parents, 1 + max(map(generation, parents), default=0))
+    graph.add(list(entries.values()))
+    # the graph doesn't store those, see commit_info
+    for sha, tree, parents, gen in entries.values():
+      if len(parents) > 2:
+        self.octopus[sha] = (tree, parents, gen)
+
+  # is commit ancestor reachable from commit descendant (or the same)
+  # commits with a lower generation than ancestor can't reach it, so the
+  # walk stops at them
+  def is_ancestor(self, ancestor, descendant):
+    self.commit_graph_update([ancestor, descendant])
+    floor = self.commit_info(ancestor)[2]
+    seen, stack = {descendant}, [descendant]
+    while stack:
+      sha = stack.pop()
+      if sha == ancestor:
+        return True
+      for parent in self.commit_info(sha)[1]:
+        if parent not in seen and self.commit_info(parent)[2] >= floor:
+          seen.add(parent)
+          stack.append(parent)
+    return False
+
+  # best common ancestor of two commits or None if they share no history
+  # commits are visited highest generation first, so when a commit reached
+  # from both sides comes up, all its descendants have been visited and no
+  # other common ancestor can be a descendant of it
+  def merge_base(self, a, b):
+    self.commit_graph_update([a, b])
+    flags = {a: 1}
+    flags[b] = flags.get(b, 0) | 2
+    heap = [(-self.commit_info(sha)[2], sha) for sha in flags]
+    heapq.heapify(heap)
+    done = set()
+    while heap:
+      _, sha = heapq.heappop(heap)
+      if sha in done:
+        continue
+      done.add(sha)
+      if flags[sha] == 3:
+        return sha
+      for parent in self.commit_info(sha)[1]:
+        old = flags.get(parent, 0)
+        if old | flags[sha] != old:
+          flags[parent] = old | flags[sha]
+          heapq.heappush(heap, (-self.commit_info(parent)[2], parent))
+    return None
 
   # get dictionary for rel path -> hash for all refs
-  def ref_list():
-    ret = {"HEAD": self.resolve_head()}
-    for entry in scan_dir(self.tinygitdir, "refs", "heads"):
-      ret["refs/heads/" + entry.name] = resolve_branch(entry.name)
-    for entry in scan_dir(self.tinygitdir, "refs", "tags"):
-      ret["refs/tags/" + entry.name] = resolve_tag(entry.name)
+  def ref_list(self):
+    ret = {"HEAD": self.resolve_head()} if self.resolve_head() else {}
+    for name in self.ref_names("heads"):
+      ret["refs/heads/" + name] = self.resolve_branch(name)
+    for name in self.ref_names("tags"):
+      ret["refs/tags/" + name] = self.resolve_tag(name)
     return ret
 
 
 # read a repo from where we are running tinygit from
+# repos kept open across commands by tinygit daemon, workdir -> GitRepo
+open_repos = {}
+
+@traced("repo_find")
 def repo_find(path="."):
   path = os.path.realpath(path)
-  if os.path.isdir(os.path.join(path, ".tinygit")): 
-    return GitRepo(path)
-  else:
+  while True:
+    if path in open_repos:
+      return open_repos[path]
+    if os.path.isdir(os.path.join(path, ".tinygit")): 
+      return GitRepo(path)
     parentpath = os.path.realpath(os.path.join(path, ".."))
     if parentpath == path:
       print("Not a tinygit repository")
       sys.exit(1)
-    return repo_find(path=parentpath)
+    path = parentpath
 
 # just return hash, don't write to db
 def object_hash(obj):
@@ -184,10 +686,18 @@ class GitBlob:
     self.blobbytes = data
 
 
+# typed entry of a tree, size is None for trees, executable is None for
+# blobs of old [name, sha] trees, whose mode is unknown
+TreeEntry = collections.namedtuple("TreeEntry", ["name", "sha", "kind", "executable", "size"])
+
+
 class GitTree:
   """Tree class.
 
-  Binary representation of tree is a textual list of (path, objsha) pairs, encoded.
+  Binary representation of tree is a textual list of 
+  [name, objsha, kind, executable, size] entries, encoded.
+  Trees written before entries were typed hold [name, objsha] pairs, 
+  GitRepo.tree_read fills in the missing fields for those.
 
   Attributes:
     kind (str): the kind of obj, namely tree.
@@ -234,6 +744,13 @@ class GitCommit:
   def deserialize(self, data):
     self.state = json.loads(data.decode("ascii"))
 
+  # parent shas, the parent header is a list for merge commits
+  def parents(self):
+    parent = self.state["headers"].get("parent")
+    if parent is None:
+      return []
+    return parent if isinstance(parent, list) else [parent]
+
 
 # # valid ref name
 # def ref_is_name(name):
@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import json
+import threading
+import collections
+import functools
+import builtins
+
+# opt-in tracing of a command, see trace_start
+#   TINYGIT_TRACE=1       print a summary table to stderr when the command ends
+#   TINYGIT_TRACE=<path>  write a chrome trace-event json file to path, for
+#                         chrome://tracing, perfetto or speedscope
+TRACE_ENV = "TINYGIT_TRACE"
+
+# spans kept for the trace-event file, past this only the totals are kept
+TRACE_EVENTS_MAX = 200000
+
+# filesystem calls counted while tracing, (module, name)
+FS_CALLS = [
+  (os, "stat"), (os, "lstat"), (os, "scandir"), (os, "listdir"), (os, "open"),
+  (os, "replace"), (os, "rename"), (os, "remove"), (os, "unlink"), (os, "mkdir"),
+  (os, "rmdir"), (os, "chmod"), (builtins, "open"),
+]
+
+
+class Tracer:
+  """Timings and counters of one traced command.
+
+  Spans are timed calls of traced functions, phases are their totals by
+  name. Spans nest, so the total of a phase includes the phases it calls.
+
+  Attributes:
+      path (str): Where to write the trace-event json, None for a summary.
+      phases (dict): name -> [calls, total ns].
+      counters (Counter): name -> count, for objects, bytes, caches and fs calls.
+      events (list): Chrome trace events of the spans, at most TRACE_EVENTS_MAX.
+
+  """
+
+  def __init__(self, path=None):
+    self.path = path
+    self.start_ns = time.perf_counter_ns()
+    self.phases = {}
+    self.counters = collections.Counter()
+    self.events = []
+    self.dropped = 0
+    self.lock = threading.Lock()
+    self.patched = []
+
+  def span(self, name, start_ns, end_ns):
+    with self.lock:
+      phase = self.phases.setdefault(name, [0, 0])
+      phase[0] += 1
+      phase[1] += end_ns - start_ns
+      if self.path is None:
+        return
+      if len(self.events) >= TRACE_EVENTS_MAX:
+        self.dropped += 1
+        return
+      self.events.append({
+        "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+        "ts": (start_ns - self.start_ns) / 1000, "dur": (end_ns - start_ns) / 1000,
+      })
+
+  def count(self, name, n=1):
+    with self.lock:
+      self.counters[name] += n
+
+  # count calls of the FS_CALLS functions
+  def patch(self):
+    for module, name in FS_CALLS:
+      original = getattr(module, name)
+      def counted(*args, original=original, counter="fs." + name, **kwargs):
+        self.count(counter)
+        return original(*args, **kwargs)
+      setattr(module, name, counted)
+      self.patched.append((module, name, original))
+
+  def unpatch(self):
+    for module, name, original in self.patched:
+      setattr(module, name, original)
+    self.patched = []
+
+  def summary(self, out):
+    print(f"{'phase':<32}{'calls':>10}{'total ms':>12}", file=out)
+    for name, (calls, total_ns) in sorted(self.phases.items(), key=lambda p: -p[1][1]):
+      print(f"{name:<32}{calls:>10}{total_ns / 1e6:>12.3f}", file=out)
+    print(file=out)
+    print(f"{'counter':<32}{'value':>22}", file=out)
+    for name, value in sorted(self.counters.items()):
+      print(f"{name:<32}{value:>22}", file=out)
+    hits, misses = self.counters["cache.hits"], self.counters["cache.misses"]
+    if hits + misses:
+      print(f"{'cache.hit_rate':<32}{hits / (hits + misses):>22.1%}", file=out)
+
+  def write(self, path):
+    trace = {
+      "traceEvents": self.events,
+      "displayTimeUnit": "ms",
+      "otherData": {
+        "counters": dict(self.counters),
+        "phases": {name: {"calls": calls, "total_ms": total_ns / 1e6} for name, (calls, total_ns) in self.phases.items()},
+        "dropped_events": self.dropped,
+      },
+    }
+    with open(path, "w") as f:
+      json.dump(trace, f)
+
+
+# the tracer of the running command, None unless tracing
+tracer = None
+
+# start tracing, path as in TINYGIT_TRACE, "1" or None for a summary
+def trace_start(path=None):
+  global tracer
+  tracer = Tracer(None if path in (None, "", "1") else path)
+  tracer.patch()
+
+# stop tracing and print the summary or write the trace-event file
+def trace_stop():
+  global tracer
+  if tracer is None:
+    return
+  t, tracer = tracer, None
+  t.unpatch()
+  if t.path is None:
+    t.summary(sys.stderr)
+  else:
+    t.write(t.path)
+
+def trace_count(name, n=1):
+  if tracer is not None:
+    tracer.count(name, n)
+
+# time every call of the decorated function as a span called name
+def traced(name):
+  def decorate(f):
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+      if tracer is None:
+        return f(*args, **kwargs)
+      start_ns = time.perf_counter_ns()
+      try:
+        return f(*args, **kwargs)
+      finally:
+        if tracer is not None:
+          tracer.span(name, start_ns, time.perf_counter_ns())
+    return wrapper
+  return decorate
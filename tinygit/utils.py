@@ -1,4 +1,28 @@
 import os
+import threading
+import importlib
+
+
+class LazyModule:
+  """A module imported on first use.
+
+  Keeps zlib, hashlib and mmap out of the startup of commands that never
+  read or write objects. Attributes are cached once looked up, so later
+  uses cost a plain attribute lookup.
+  """
+
+  def __init__(self, name):
+    self._name = name
+
+  def __getattr__(self, attr):
+    value = getattr(importlib.import_module(self._name), attr)
+    setattr(self, attr, value)
+    return value
+
+zlib = LazyModule("zlib")
+
+# bytes read, hashed or inflated at a time when streaming objects
+CHUNK_SIZE = 1024 * 1024
 
 def dir_exists(*path):
   return os.path.isdir(os.path.join(*path))
@@ -12,18 +36,72 @@ def scan_dir(*path):
 def file_exists(*path):
   return os.path.isfile(os.path.join(*path))
 
+# (mtime_ns, size, inode) of a path or None if it doesn't exist, changes
+# whenever the file is written or replaced
+def file_signature(*path):
+  try:
+    st = os.stat(os.path.join(*path))
+  except OSError:
+    return None
+  return (st.st_mtime_ns, st.st_size, st.st_ino)
+
 def write_file(*path, data=None, mode="w"):
   if len(path) > 1 and not os.path.exists(os.path.join(*path[:-1])): 
-    os.makedirs(os.path.join(*path[:-1]))
+    os.makedirs(os.path.join(*path[:-1]), exist_ok=True)
   with open(os.path.join(*path), mode) as f: 
     f.write(data)
 
+# write to a temporary file first, so readers and concurrent writers of the
+# same path never see a partial file
+def write_file_atomic(*path, data=None, mode="w"):
+  tmpname = path[-1] + f".tmp{os.getpid()}-{threading.get_ident()}"
+  write_file(*path[:-1], tmpname, data=data, mode=mode)
+  os.replace(os.path.join(*path[:-1], tmpname), os.path.join(*path))
+
 def read_file(*path, mode="r"):
   if not os.path.isfile(os.path.join(*path)): 
     return None
   with open(os.path.join(*path), mode) as f: 
     return f.read()
 
+# chunks of an open file
+def read_chunks(f, size=CHUNK_SIZE):
+  return iter(lambda: f.read(size), b"")
+
+# decompress an iterator of compressed chunks, yielding at most size bytes at a time
+def inflate(chunks, size=CHUNK_SIZE):
+  d = zlib.decompressobj()
+  for chunk in chunks:
+    while chunk:
+      out = d.decompress(chunk, size)
+      chunk = d.unconsumed_tail
+      if out:
+        yield out
+  out = d.flush()
+  if out:
+    yield out
+
+# decompress just enough of an iterator of compressed chunks to hold an 
+# object header ("<kind> <size>\0"), returns what was decompressed
+def inflate_header(chunks, size=64):
+  d = zlib.decompressobj()
+  head = b""
+  for chunk in chunks:
+    while chunk and b'\x00' not in head and len(head) < size:
+      head += d.decompress(chunk, size - len(head))
+      chunk = d.unconsumed_tail
+    if b'\x00' in head or len(head) >= size:
+      break
+  return head
+
+# (kind, size, end of header) from the start of a raw object
+def parse_header(head):
+  ispace = head.find(b' ')
+  inull = head.find(b'\x00', ispace)
+  if ispace < 0 or inull < 0:
+    raise Exception("Object corrupted")
+  return head[0:ispace].decode("ascii"), int(head[ispace:inull].decode("ascii")), inull + 1
+
 class bcolors:
   HEADER = '\033[95m'
   OKBLUE = '\033[94m'